@@ -0,0 +1,165 @@
+"""Maximum weight independent set solver for conflicts between meeting participants.
+
+Participants are indices 0..N-1, the conflicts of participant i are the bitmap adjacency[i].
+"""
+import concurrent.futures
+import dataclasses
+from typing import List, Tuple
+
+from .utils import get_bitmap_indices
+
+# Components smaller than this are solved in the calling process, it's faster than sending them to a worker.
+MIN_PARALLEL_COMPONENT_SIZE = 16
+
+
+@dataclasses.dataclass
+class IndependentSetSolution:
+    value: int
+    # Bit i is set if participant i is chosen.
+    participants_bitmap: int
+    # Number of search nodes popped from the stack.
+    expanded_nodes: int
+
+
+def get_tie_broken_weights(values: List[int]) -> List[int]:
+    """Folds the tie-breaking rules into the weights, so every set of participants has a distinct total weight.
+
+    The total weight of a set S is ((sum of values) * (N + 1) + |S|) * 2^N - (sum of 2^(N-1-i) for i in S).
+    Maximizing it maximizes the value first, then prefers more participants on equal value,
+    then prefers leaving out the participants earlier in the list.
+    """
+    participant_count = len(values)
+    return [((value * (participant_count + 1) + 1) << participant_count) - (1 << (participant_count - 1 - index))
+            for index, value in enumerate(values)]
+
+
+def _get_clique_cover_bound(candidates: int, weights: List[int], adjacency: List[int]) -> int:
+    """Upper bound of the candidates' independent set weight by greedy coloring.
+
+    Candidates are greedily partitioned into cliques, an independent set has at most one participant
+    from each clique, so the sum of the max weight of each clique is an upper bound."""
+    # [(bitmap of participants adjacent to every clique member, max weight in the clique)]
+    cliques = []
+    for index in sorted(get_bitmap_indices(candidates), key=lambda i: weights[i], reverse=True):
+        for clique_idx, (common_neighbors, max_weight) in enumerate(cliques):
+            if common_neighbors >> index & 1:
+                cliques[clique_idx] = (common_neighbors & adjacency[index], max_weight)
+                break
+        else:
+            cliques.append((adjacency[index], weights[index]))
+    return sum(max_weight for _, max_weight in cliques)
+
+
+def solve_max_weight_independent_set(weights: List[int], adjacency: List[int]) -> IndependentSetSolution:
+    """Iterative branch and bound search of the participants set with max total weight and no conflict in it."""
+    participant_count = len(weights)
+    # Self conflict doesn't prevent one from attending.
+    adjacency = [adjacency[index] & ~(1 << index) for index in range(participant_count)]
+    # Participants with non-positive weight never improve a set.
+    candidates = 0
+    for index, weight in enumerate(weights):
+        if weight > 0:
+            candidates |= 1 << index
+
+    best_value, best_participants = 0, 0
+    expanded_nodes = 0
+    # (unchecked candidates, chosen participants, value of chosen participants)
+    stack = [(candidates, 0, 0)]
+    while stack:
+        candidates, chosen, value = stack.pop()
+        expanded_nodes += 1
+
+        # Participants without conflicts among the candidates are always chosen.
+        branch_index, branch_weight = -1, 0
+        for index in get_bitmap_indices(candidates):
+            if not adjacency[index] & candidates:
+                candidates ^= 1 << index
+                chosen |= 1 << index
+                value += weights[index]
+            elif weights[index] > branch_weight:
+                branch_index, branch_weight = index, weights[index]
+
+        if not candidates:
+            if value > best_value:
+                best_value, best_participants = value, chosen
+            continue
+        if value + sum(weights[index] for index in get_bitmap_indices(candidates)) <= best_value:
+            continue
+        if value + _get_clique_cover_bound(candidates, weights, adjacency) <= best_value:
+            continue
+
+        # Branch on the heaviest candidate, the branch choosing it is searched first.
+        branch_bit = 1 << branch_index
+        stack.append((candidates & ~branch_bit, chosen, value))
+        stack.append((candidates & ~branch_bit & ~adjacency[branch_index], chosen | branch_bit, value + branch_weight))
+
+    return IndependentSetSolution(value=best_value, participants_bitmap=best_participants,
+                                  expanded_nodes=expanded_nodes)
+
+
+def get_connected_components(adjacency: List[int]) -> List[int]:
+    """Returns the bitmap of participants in each connected component of the conflict graph."""
+    unvisited = (1 << len(adjacency)) - 1
+    components = []
+    while unvisited:
+        frontier = unvisited & -unvisited
+        component = 0
+        while frontier:
+            component |= frontier
+            next_frontier = 0
+            for index in get_bitmap_indices(frontier):
+                next_frontier |= adjacency[index]
+            frontier = next_frontier & ~component
+        unvisited &= ~component
+        components.append(component)
+    return components
+
+
+def _solve_component(component_weights_and_adjacency: Tuple[List[int], List[int]]) -> IndependentSetSolution:
+    return solve_max_weight_independent_set(*component_weights_and_adjacency)
+
+
+def solve_conflict_graph(weights: List[int], adjacency: List[int], max_workers: int = 1) -> IndependentSetSolution:
+    """Solves each connected component of the conflict graph independently and merges the results.
+
+    Components don't share conflicts, so the optimal set is the union of each component's optimal set,
+    and the search is the sum of 2^k instead of 2^N. Large components are solved in a process pool
+    if max_workers > 1.
+    """
+    merged_solution = IndependentSetSolution(value=0, participants_bitmap=0, expanded_nodes=0)
+    # [(participant indices of the component, (component weights, component adjacency))]
+    subproblems = []
+    for component in get_connected_components(adjacency):
+        indices = get_bitmap_indices(component)
+        if len(indices) == 1:
+            if weights[indices[0]] > 0:
+                merged_solution.value += weights[indices[0]]
+                merged_solution.participants_bitmap |= component
+            continue
+        index_to_component_index = {index: component_index for component_index, index in enumerate(indices)}
+        component_adjacency = []
+        for index in indices:
+            component_adjacency.append(sum(1 << index_to_component_index[neighbor]
+                                           for neighbor in get_bitmap_indices(adjacency[index] & component)))
+        subproblems.append((indices, ([weights[index] for index in indices], component_adjacency)))
+
+    parallel_subproblems = [subproblem for subproblem in subproblems
+                            if len(subproblem[0]) >= MIN_PARALLEL_COMPONENT_SIZE]
+    if max_workers > 1 and len(parallel_subproblems) > 1:
+        serial_subproblems = [subproblem for subproblem in subproblems
+                              if len(subproblem[0]) < MIN_PARALLEL_COMPONENT_SIZE]
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+            parallel_solutions = list(executor.map(
+                _solve_component, [subproblem[1] for subproblem in parallel_subproblems]))
+        solved_subproblems = (
+            list(zip(parallel_subproblems, parallel_solutions))
+            + [(subproblem, _solve_component(subproblem[1])) for subproblem in serial_subproblems])
+    else:
+        solved_subproblems = [(subproblem, _solve_component(subproblem[1])) for subproblem in subproblems]
+
+    for (indices, _), solution in solved_subproblems:
+        merged_solution.value += solution.value
+        merged_solution.expanded_nodes += solution.expanded_nodes
+        for component_index in get_bitmap_indices(solution.participants_bitmap):
+            merged_solution.participants_bitmap |= 1 << indices[component_index]
+    return merged_solution
@@ -1,47 +1,243 @@
 """Create meeting link."""
-import json
+import datetime
+import email.utils
+import functools
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
 
 import requests
-import datetime
-from msal import ConfidentialClientApplication
-from .app_settings import CLIENT_CREDENTIAL, REUNION_CLIENT_ID, TENANT_NAME, ADMIN_USER_OBJECT_ID
-
-# Make this as a module level variable, so token will be cached.
-APP = ConfidentialClientApplication(client_id=REUNION_CLIENT_ID,
-                                    authority=f"https://login.microsoftonline.com/{TENANT_NAME}",
-                                    client_credential=CLIENT_CREDENTIAL)
-
-
-def create_meeting_link(meeting_name, start_time, end_time):
-    """start and end time is default to UTC timezone."""
-    result = APP.acquire_token_silent(scopes=["https://graph.microsoft.com/.default"], account=None)
-    if not result:
-        print("No suitable token exists in cache. Let's get a new one from AAD.")
-        result = APP.acquire_token_for_client(scopes=["https://graph.microsoft.com/.default"])
-    token = result.get("access_token")
-    if token is None:
-        print(result.get("error"))
-        print(result.get("error_description"))
-        return
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+GRAPH_BASE_URL = "https://graph.microsoft.com/v1.0"
+GRAPH_SCOPES = ["https://graph.microsoft.com/.default"]
+# (connect, read) timeout in seconds of each request.
+GRAPH_TIMEOUT = (3.05, 10)
+GRAPH_MAX_RETRIES = 3
+# The delay before the n-th retry is GRAPH_RETRY_BACKOFF_SECONDS * 2^(n-1) unless Retry-After is given.
+GRAPH_RETRY_BACKOFF_SECONDS = 0.5
+GRAPH_MAX_RETRY_DELAY_SECONDS = 30
+GRAPH_RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# Requests of these methods could be applied twice if they are retried after they are sent, they are only retried
+# when they were not sent or were throttled, unless the caller marks them idempotent.
+GRAPH_NON_IDEMPOTENT_METHODS = {"POST", "PATCH"}
+# The token is refreshed this long before it expires.
+TOKEN_EXPIRY_MARGIN_SECONDS = 60
+# Requests fail fast for CIRCUIT_BREAKER_RESET_SECONDS after this many consecutive failed requests.
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = 5
+CIRCUIT_BREAKER_RESET_SECONDS = 60
+
+
+class GraphClientError(Exception):
+    pass
+
+
+class CircuitOpenError(GraphClientError):
+    pass
+
+
+class CircuitBreaker:
+    """Stops calling a failing service for a while, then lets one trial request decide to close it again."""
+
+    def __init__(self, failure_threshold: int = CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds: float = CIRCUIT_BREAKER_RESET_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.consecutive_failures = 0
+        # Monotonic time the circuit is opened at, None if it's closed.
+        self.opened_time: Optional[float] = None
+        self.lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        with self.lock:
+            if self.opened_time is None:
+                return True
+            if self.clock() - self.opened_time < self.reset_seconds:
+                return False
+            # Half open, other requests fail fast until the trial request finishes.
+            self.opened_time = self.clock()
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.consecutive_failures = 0
+            self.opened_time = None
+
+    def record_failure(self):
+        with self.lock:
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= self.failure_threshold:
+                self.opened_time = self.clock()
+
+
+def _get_retry_after_seconds(response: requests.Response) -> Optional[float]:
+    """Seconds in the Retry-After header, which is either a number of seconds or an HTTP date."""
+    retry_after = response.headers.get("Retry-After")
+    if not retry_after:
+        return None
+    try:
+        return max(float(retry_after), 0)
+    except ValueError:
+        pass
+    try:
+        retry_time = email.utils.parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    return max((retry_time - datetime.datetime.now(datetime.timezone.utc)).total_seconds(), 0)
+
 
+class GraphClient:
+    """Microsoft Graph client with a pooled session, a cached token, retries and a circuit breaker.
+
+    get_token returns an MSAL token result, i.e. {"access_token": ..., "expires_in": seconds} or
+    {"error": ..., "error_description": ...}.
+    """
+
+    def __init__(self, get_token: Callable[[], Dict], base_url: str = GRAPH_BASE_URL,
+                 timeout: Tuple[float, float] = GRAPH_TIMEOUT, max_retries: int = GRAPH_MAX_RETRIES,
+                 circuit_breaker: Optional[CircuitBreaker] = None,
+                 sleep: Callable[[float], None] = time.sleep, pool_size: int = 10):
+        self.get_token = get_token
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.sleep = sleep
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.token: Optional[str] = None
+        self.token_expiry_time = 0.0
+        self.token_lock = threading.Lock()
+
+    def _get_access_token(self, refresh: bool = False) -> str:
+        with self.token_lock:
+            if refresh or self.token is None or time.monotonic() >= self.token_expiry_time:
+                try:
+                    result = self.get_token()
+                except Exception as e:
+                    # e.g. the authority discovery of MSAL failed.
+                    raise GraphClientError(f"Acquiring the token failed: {e!r}") from e
+                if "access_token" not in result:
+                    raise GraphClientError(f"{result.get('error')}: {result.get('error_description')}")
+                self.token = result["access_token"]
+                self.token_expiry_time = (
+                    time.monotonic() + float(result.get("expires_in", 0)) - TOKEN_EXPIRY_MARGIN_SECONDS)
+            return self.token
+
+    def request(self, method: str, path: str, idempotent: Optional[bool] = None, **kwargs) -> requests.Response:
+        """Sends the request, retrying connection errors, timeouts, 429 and 5xx responses.
+
+        A non idempotent request, by default a POST or PATCH, is only retried after a connect timeout or a 429, since
+        it could have been applied when the response is lost. Returns the response of other status codes, raises
+        GraphClientError if all attempts failed and CircuitOpenError without sending if too many requests failed
+        recently.
+        """
+        if not self.circuit_breaker.allow_request():
+            raise CircuitOpenError(f"Too many failed requests to {self.base_url}.")
+        if idempotent is None:
+            idempotent = method.upper() not in GRAPH_NON_IDEMPOTENT_METHODS
+        try:
+            response = self._send_with_retries(method, path, idempotent, **kwargs)
+        except GraphClientError:
+            # Failures to acquire the token count too.
+            self.circuit_breaker.record_failure()
+            raise
+        self.circuit_breaker.record_success()
+        return response
+
+    def _send_with_retries(self, method: str, path: str, idempotent: bool, **kwargs) -> requests.Response:
+        extra_headers = kwargs.pop("headers", {})
+        refreshed_token = False
+        error: Optional[Exception] = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.sleep(min(delay_seconds, GRAPH_MAX_RETRY_DELAY_SECONDS))
+            delay_seconds = GRAPH_RETRY_BACKOFF_SECONDS * 2 ** attempt
+            headers = {"Authorization": f"Bearer {self._get_access_token()}", **extra_headers}
+            try:
+                response = self.session.request(
+                    method, f"{self.base_url}{path}", headers=headers, timeout=self.timeout, **kwargs)
+            except requests.ConnectTimeout as e:
+                # The request wasn't sent.
+                error = e
+                continue
+            except requests.RequestException as e:
+                error = e
+                if not idempotent:
+                    break
+                continue
+            if response.status_code == 401 and not refreshed_token:
+                # The token could be revoked before it expires.
+                refreshed_token = True
+                self._get_access_token(refresh=True)
+                delay_seconds = 0
+                error = GraphClientError(f"{method} {path} is unauthorized.")
+                continue
+            if response.status_code not in GRAPH_RETRY_STATUS_CODES:
+                return response
+            error = GraphClientError(f"{method} {path} responded {response.status_code}.")
+            if not idempotent and response.status_code != 429:
+                break
+            retry_after_seconds = _get_retry_after_seconds(response)
+            if retry_after_seconds is not None:
+                delay_seconds = retry_after_seconds
+        raise GraphClientError(f"{method} {path} failed after {attempt + 1} attempts.") from error
+
+
+@functools.lru_cache(maxsize=1)
+def _get_msal_app():
+    # Imported and created on first use, the constructor discovers the tenant over the network.
+    from msal import ConfidentialClientApplication
+    from .app_settings import CLIENT_CREDENTIAL, REUNION_CLIENT_ID, TENANT_NAME
+    return ConfidentialClientApplication(client_id=REUNION_CLIENT_ID,
+                                         authority=f"https://login.microsoftonline.com/{TENANT_NAME}",
+                                         client_credential=CLIENT_CREDENTIAL)
+
+
+def _acquire_graph_token() -> Dict:
+    return _get_msal_app().acquire_token_for_client(scopes=GRAPH_SCOPES)
+
+
+@functools.lru_cache(maxsize=1)
+def get_graph_client() -> GraphClient:
+    """The client shared in this process, so its connections and token are reused."""
+    return GraphClient(get_token=_acquire_graph_token)
+
+
+def create_meeting_link(meeting_name, start_time, end_time, external_id: Optional[str] = None,
+                        client: Optional[GraphClient] = None):
+    """start and end time is default to UTC timezone. Returns None if the meeting can't be created.
+
+    With an external_id the meeting is created with createOrGet, which returns the meeting created before with the
+    same external_id, so the request can be retried without creating another meeting.
+    """
     payload = {
         "startDateTime": start_time.isoformat(timespec="microseconds"),
         # must in the format of "2022-03-12T14:30:34.2444915-07:00",
         "endDateTime": end_time.isoformat(timespec="microseconds"),
         "subject": meeting_name
     }
-    headers_dict = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json"
-    }
-
-    resp = requests.post(f"https://graph.microsoft.com/v1.0/users/{ADMIN_USER_OBJECT_ID}/onlineMeetings/",
-                         data=json.dumps(payload), headers=headers_dict)
-    if resp.status_code != 201:
-        print(f"====debug {resp.status_code} {resp.content}\n")
-        print(payload)
+    from .app_settings import ADMIN_USER_OBJECT_ID
+    path = f"/users/{ADMIN_USER_OBJECT_ID}/onlineMeetings/"
+    if external_id:
+        payload["externalId"] = external_id
+        path = f"/users/{ADMIN_USER_OBJECT_ID}/onlineMeetings/createOrGet"
+    try:
+        resp = (client or get_graph_client()).request("POST", path, idempotent=bool(external_id), json=payload)
+    except GraphClientError:
+        logger.exception("Creating online meeting %s failed.", payload)
+        return
+    # createOrGet responds 200 with the existing meeting.
+    if resp.status_code not in (200, 201):
+        logger.error("Creating online meeting %s responded %s %s.", payload, resp.status_code, resp.content)
         return
-    return json.loads(resp.content).get("joinWebUrl").split("?")[0]
+    return resp.json().get("joinWebUrl").split("?")[0]
 
 
 def main():
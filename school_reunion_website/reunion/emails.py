@@ -1,11 +1,115 @@
-from django.core.mail import send_mail
-from .models import MeetingPreference, MeetingRecord
-from typing import List, Dict
+import datetime
+import hashlib
+import logging
+import uuid
+
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import F
+from django.utils import timezone
+from .models import MeetingPreference, MeetingRecord, OutboxEmail, Invitation
+from .scheduling_stats import increment_counter, COUNTER_EMAILS_ENQUEUED
+from .utils import (OUTBOX_STATUS_PENDING, OUTBOX_STATUS_SENDING, OUTBOX_STATUS_SENT, OUTBOX_STATUS_FAILED,
+                    OUTBOX_BATCH_SIZE, OUTBOX_MAX_ATTEMPTS, OUTBOX_RETRY_DELAY, OUTBOX_SENDING_LEASE)
+from typing import List, Dict, Optional
+
+logger = logging.getLogger(__name__)
 
 
 SCHOOL_REUNION_ADMIN_EMAIL = 'reunion4school@gmail.com'
 
 
+def _get_outbox_email(subject: str, message: str, recipient: str,
+                      from_email: str = SCHOOL_REUNION_ADMIN_EMAIL) -> OutboxEmail:
+    dedup_key = hashlib.sha256('\0'.join([from_email, recipient, subject, message]).encode()).hexdigest()
+    return OutboxEmail(subject=subject, message=message, from_email=from_email, recipient=recipient,
+                       dedup_key=dedup_key)
+
+
+def enqueue_emails(outbox_emails: List[OutboxEmail]):
+    """Adds the emails to the outbox with one query in the current transaction.
+
+    An email is ignored if the same email is still pending."""
+    OutboxEmail.objects.bulk_create(outbox_emails, ignore_conflicts=True)
+    increment_counter(COUNTER_EMAILS_ENQUEUED, len(outbox_emails))
+
+
+def enqueue_email(subject: str, message: str, recipient: str, from_email: str = SCHOOL_REUNION_ADMIN_EMAIL):
+    enqueue_emails([_get_outbox_email(subject, message, recipient, from_email)])
+
+
+def _get_retry_time(attempts: int) -> datetime.datetime:
+    return timezone.now() + OUTBOX_RETRY_DELAY * 2 ** (attempts - 1)
+
+
+def _claim_outbox_emails(batch_size: int) -> List[OutboxEmail]:
+    """Leases a batch of the due emails to this worker, with a conditional UPDATE committed right away.
+
+    An email is claimed by one worker only, even on a database that ignores row locks. An email left sending by a
+    worker that didn't finish is claimed again once its lease expires.
+    """
+    now = timezone.now()
+    due_emails = OutboxEmail.objects.filter(
+        status__in=[OUTBOX_STATUS_PENDING, OUTBOX_STATUS_SENDING], next_attempt_time__lte=now)
+    candidate_pks = list(due_emails.order_by('next_attempt_time', 'pk').values_list('pk', flat=True)[:batch_size])
+    if not candidate_pks:
+        return []
+    lease_token = uuid.uuid4()
+    due_emails.filter(pk__in=candidate_pks).update(
+        status=OUTBOX_STATUS_SENDING, next_attempt_time=now + OUTBOX_SENDING_LEASE, lease_token=lease_token,
+        attempts=F('attempts') + 1)
+    return list(OutboxEmail.objects.filter(lease_token=lease_token).order_by('pk'))
+
+
+def _finish_outbox_email(outbox_email: OutboxEmail, error: Optional[Exception]):
+    """Records the result of sending the claimed email, unless its lease expired and another worker claimed it."""
+    if error:
+        if outbox_email.attempts >= OUTBOX_MAX_ATTEMPTS:
+            result = {'status': OUTBOX_STATUS_FAILED}
+        else:
+            result = {'status': OUTBOX_STATUS_PENDING, 'next_attempt_time': _get_retry_time(outbox_email.attempts)}
+        result['last_error'] = repr(error)
+    else:
+        result = {'status': OUTBOX_STATUS_SENT, 'sent_time': timezone.now()}
+    OutboxEmail.objects.filter(pk=outbox_email.pk, lease_token=outbox_email.lease_token).update(
+        lease_token=None, **result)
+
+
+def deliver_outbox_emails(batch_size: int = OUTBOX_BATCH_SIZE) -> int:
+    """Sends a batch of the due emails over one connection, returns the number of emails sent.
+
+    The batch is claimed before sending and each email is marked as it's sent, no transaction is open while
+    sending, so several workers don't send the same emails and don't block the requests enqueuing emails.
+    An email failed to send is retried with exponential backoff, up to OUTBOX_MAX_ATTEMPTS attempts.
+    """
+    outbox_emails = _claim_outbox_emails(batch_size)
+    if not outbox_emails:
+        return 0
+    sent_count = 0
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        logger.warning('Opening the email connection failed: %s', e)
+        connection_error = e
+    else:
+        connection_error = None
+    for outbox_email in outbox_emails:
+        error = connection_error
+        if not error:
+            try:
+                connection.send_messages([EmailMessage(
+                    outbox_email.subject, outbox_email.message, outbox_email.from_email,
+                    [outbox_email.recipient], connection=connection)])
+            except Exception as e:
+                error = e
+        _finish_outbox_email(outbox_email, error)
+        if not error:
+            sent_count += 1
+    if not connection_error:
+        connection.close()
+    return sent_count
+
+
 def _verification_link(verification_code):
     # todo: formalize the host
     return f'<a href="https://127.0.0.1:8000/email_verification/{verification_code}>Click Me To Verify</a>"'
@@ -14,61 +118,55 @@ def _verification_link(verification_code):
 def verify_registered_email_address(meeting_preference: MeetingPreference, meeting_name):
     message = (f'Please click the following link to confirm your registration for Meeting {meeting_name}:'
                f'\n{_verification_link(meeting_preference.email_verification_code)}')
-    send_mail(
-        'Verify Email For School Reunion',
-        message,
-        SCHOOL_REUNION_ADMIN_EMAIL,
-        [meeting_preference.email],
-        fail_silently=False
-    )
+    enqueue_email('Verify Email For School Reunion', message, meeting_preference.email)
 
 
 def invitation_link(record_id, invitation_id):
     return f'<a href="https://127.0.0.1:8000/confirm_invitation/{record_id}/{invitation_id}>Click Me To Confirm</a>"'
 
 
-def send_scheduled_meeting_notification(meeting_record: MeetingRecord,
-                                        invitation_id: str,
-                                        preference: MeetingPreference,
-                                        all_preference: List[MeetingPreference]):
-    if not invitation_id:
-        return
-    message = (f'Please click the following link to confirm your attendance:'
-               f'\n{invitation_link(meeting_record.record_id, invitation_id)}'
-               f'\n'
-               f'\nMeeting details'
-               f'\n    Name: {meeting_record.meeting.display_name}'
-               f'\n    Start time: {meeting_record.meeting_start_time}'
-               f'\n'
-               f'\nAll potential participants'
-               f'\n{", ".join([p.name for p in all_preference])}')
-    send_mail(
-        f'You are invited to meeting {meeting_record.meeting.display_name}',
-        message,
-        SCHOOL_REUNION_ADMIN_EMAIL,
-        [preference.email],
-        fail_silently=True
-    )
+def send_scheduled_meeting_notifications(meeting_record: MeetingRecord,
+                                         invitations: List[Invitation],
+                                         all_preference: List[MeetingPreference]) -> Dict[str, OutboxEmail]:
+    """Enqueues the invitation emails of a meeting at once, returns {recipient email: outbox email}.
+
+    Only the confirmation link differs between the emails, the rest of the message is rendered once.
+    """
+    subject = f'You are invited to meeting {meeting_record.meeting.display_name}'
+    meeting_details = (f'\n'
+                       f'\nMeeting details'
+                       f'\n    Name: {meeting_record.meeting.display_name}'
+                       f'\n    Start time: {meeting_record.meeting_start_time}'
+                       f'\n'
+                       f'\nAll potential participants'
+                       f'\n{", ".join([p.name for p in all_preference])}')
+    recipient_to_outbox_email = {}
+    for invitation in invitations:
+        message = (f'Please click the following link to confirm your attendance:'
+                   f'\n{invitation_link(meeting_record.record_id, invitation.invitation_code)}'
+                   f'{meeting_details}')
+        recipient_to_outbox_email[invitation.attendant.email] = _get_outbox_email(
+            subject, message, invitation.attendant.email)
+    enqueue_emails(list(recipient_to_outbox_email.values()))
+    return recipient_to_outbox_email
 
 
 def send_scheduled_meeting_details(preference: MeetingPreference, meeting_record: MeetingRecord):
-    message = (f'Thanks for confirming your attendance! Here is the online meeting link:'
-               f'\n{meeting_record.online_meeting_link}'
+    if meeting_record.online_meeting_link:
+        link_message = f'Here is the online meeting link:\n{meeting_record.online_meeting_link}'
+    else:
+        link_message = 'The online meeting link will be sent with the final participants list.'
+    message = (f'Thanks for confirming your attendance! {link_message}'
                f'\nMeeting details'
                f'\n    Name: {meeting_record.meeting.display_name}_{meeting_record.record_id}'
                f'\n    Start time: {meeting_record.meeting_start_time.isoformat()}'
                f'\nThe final participants list will be sent three weeks before the meeting.')
-    send_mail(
-        f'Online meeting link for {meeting_record.meeting.display_name}',
-        message,
-        SCHOOL_REUNION_ADMIN_EMAIL,
-        [preference.email],
-        fail_silently=True
-    )
+    enqueue_email(f'Online meeting link for {meeting_record.meeting.display_name}', message, preference.email)
 
 
-def send_final_meeting_reminder_emails(target_email, all_meeting_participants: List[MeetingPreference],
-                                       meeting_record: MeetingRecord):
+def send_final_meeting_reminder_emails(all_meeting_participants: List[MeetingPreference],
+                                       meeting_record: MeetingRecord) -> Dict[str, OutboxEmail]:
+    """Enqueues the same finalized meeting email to all participants, returns {recipient email: outbox email}."""
     message = (f'The meeting {meeting_record.meeting.display_name} is finalized.'
                f'\nOnline meeting link:'
                f'\n{meeting_record.online_meeting_link}'
@@ -77,10 +175,9 @@ def send_final_meeting_reminder_emails(target_email, all_meeting_participants: L
                f'\n    Start time: {meeting_record.meeting_start_time.isoformat(timespec="microseconds")}'
                f'\nPlease have a discussion with other participants if needed:'
                f'\n{", ".join([preference.name + ": " + preference.email for preference in all_meeting_participants])}')
-    send_mail(
-        f'Finalized information about meeting {meeting_record.meeting.display_name}_{meeting_record.record_id}',
-        message,
-        SCHOOL_REUNION_ADMIN_EMAIL,
-        [target_email],
-        fail_silently=True
-    )
+    subject = f'Finalized information about meeting {meeting_record.meeting.display_name}_{meeting_record.record_id}'
+    recipient_to_outbox_email = {
+        preference.email: _get_outbox_email(subject, message, preference.email)
+        for preference in all_meeting_participants}
+    enqueue_emails(list(recipient_to_outbox_email.values()))
+    return recipient_to_outbox_email
@@ -4,9 +4,10 @@ from crispy_forms.helper import FormHelper
 from crispy_forms.bootstrap import InlineRadios, FormActions, InlineCheckboxes
 from bootstrap_datepicker_plus.widgets import TimePickerInput
 from crispy_forms.layout import Layout, Submit, Row, Column, Button, ButtonHolder, HTML, Div
-from .utils import get_country_to_holidays_map, REPEAT_OPTIONS
+from .utils import get_country_name_to_holidays_code, REPEAT_OPTIONS
 from taggit.forms import TagField, TagWidget
 import ast
+import functools
 from django.urls import reverse
 
 
@@ -24,33 +25,9 @@ class TagifyField(TagField):
             raise forms.ValidationError("Please provide a comma-separated list of tags.")
 
 
-class SelectWithAttribute(forms.widgets.Select):
-    """
-    Select With Option Attributes:
-        subclass of Django's Select widget that allows attributes in options,
-        like disabled="disabled", title="help text", class="some classes",
-              style="background: color;"...
-
-    Pass a dict instead of a string for its label:
-        choices = [ ('value_1', 'label_1'),
-                    ...
-                    ('value_k', {'label': 'label_k', 'foo': 'bar', ...}),
-                    ... ]
-    The option k will be rendered as:
-        <option value="value_k" foo="bar" ...>label_k</option>
-    """
-
-    def create_option(self, name, value, label, selected, index, subindex=None, attrs=None):
-        if isinstance(label, dict):
-            opt_attrs = label.copy()
-            label = opt_attrs.pop('label')
-        else:
-            opt_attrs = {}
-        option_dict = super(SelectWithAttribute, self).create_option(
-            name, value, label, selected, index, subindex=subindex, attrs=attrs)
-        for key, val in opt_attrs.items():
-            option_dict['attrs'][key] = val
-        return option_dict
+@functools.lru_cache(maxsize=None)
+def get_country_choices():
+    return tuple([(country, country) for country in get_country_name_to_holidays_code().keys()])
 
 
 class EntryForm(forms.Form):
@@ -115,27 +92,14 @@ class MeetingGenerationForm(forms.ModelForm):
 class MeetingPreferenceForm(forms.ModelForm):
     class Meta:
         model = MeetingPreference
-        exclude = ('registered_attendant_code', 'meeting', 'email_verification_code')
-
-    country_to_holidays = get_country_to_holidays_map()
-    country = forms.ChoiceField(
-        choices=tuple([(country, country) for country, _ in country_to_holidays.items()]), required=False)
-    choices = []
-    for country_name, holidays in country_to_holidays.items():
-        class_name = country_name.replace(' ', '_')
-        choices.append((f'{country_name}_0',
-                        {'label': f'Select All {country_name} Holidays',
-                         'class': class_name,
-                         'style': 'display: none'}))
-        for idx, (holiday_name, _) in enumerate(holidays.items()):
-            choices.append((f'{country_name}_{idx+1}',
-                            {'label': f'{holiday_name}',
-                             'class': class_name,
-                             'style': 'display: none'}))
-    holiday = forms.ChoiceField(label='Holiday (repeat each year; select country first)',
-                                choices=tuple(choices),
-                                widget=SelectWithAttribute,
-                                required=False)
+        exclude = ('registered_attendant_code', 'meeting', 'email_verification_code',
+                   'attending_date_rules', 'weighted_attendant_values')
+
+    country = forms.ChoiceField(choices=get_country_choices, required=False)
+    # Options are loaded from the holiday catalog of the selected country by meeting_preference.js.
+    holiday = forms.CharField(label='Holiday (repeat each year; select country first)',
+                              widget=forms.Select,
+                              required=False)
     custom_dates = forms.CharField(widget=forms.DateInput,
                                    required=False,
                                    label='Custom dates (select repeat option first)')
@@ -0,0 +1,345 @@
+"""Concurrent load of the registration and confirmation endpoints, and checks of the data it leaves behind.
+
+Each virtual user opens the preference form of a load test meeting, registers, verifies the email and edits the
+preference. Then every registered user confirms the invitations of two meeting records, and one of them twice as a
+double click does. The requests go through the Django test client in this process, or to a running server at a base
+URL that uses the same database, since the verification and invitation codes are read from it.
+"""
+import collections
+import concurrent.futures
+import dataclasses
+import datetime
+import functools
+import random
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connections
+from django.test import Client, override_settings
+
+from .models import Meeting, MeetingPreference, MeetingAttendance, MeetingRecord, Invitation, OutboxEmail
+from .schedule_meeting import get_utc_now
+from .utils import VERIFIED_EMAIL_STATUS, ATTENDANT_CONFIRM_STATUS, MEETING_RECORD_STATUS_INITIALIZED
+
+LOAD_TEST_MEETING_NAME = 'load test meeting'
+# Reserved domain, so the emails enqueued by the load are never delivered.
+LOAD_TEST_EMAIL_DOMAIN = 'load-test.invalid'
+LOAD_TEST_ONLINE_MEETING_LINK = 'https://meeting.invalid/load-test'
+# Only the first error messages are kept in the report.
+MAX_ERROR_SAMPLES = 10
+
+OPERATION_OPEN_FORM = 'open_form'
+OPERATION_REGISTER = 'register'
+OPERATION_VERIFY = 'verify'
+OPERATION_EDIT = 'edit'
+OPERATION_CONFIRM = 'confirm'
+# Expected status codes of each operation, others are errors. The form and the registration are rejected with 404
+# when the meeting has no available slot.
+OPERATION_EXPECTED_STATUS_CODES = {
+    OPERATION_OPEN_FORM: {200, 404},
+    OPERATION_REGISTER: {302, 404},
+    OPERATION_VERIFY: {200},
+    OPERATION_EDIT: {302},
+    OPERATION_CONFIRM: {200},
+}
+
+
+@dataclasses.dataclass
+class LoadTestConfig:
+    users: int = 20
+    # Virtual users run at the same time.
+    concurrency: int = 8
+    # Available slots of the meeting, fewer than the users so some registrations are rejected.
+    meeting_slots: int = 15
+    edits_per_user: int = 2
+    # None sends the requests through the Django test client.
+    base_url: Optional[str] = None
+    # Order of the confirmations.
+    seed: int = 0
+    keep_data: bool = False
+
+
+@dataclasses.dataclass
+class OperationResult:
+    operation: str
+    latency_seconds: float
+    status_code: Optional[int]
+    error: Optional[str] = None
+
+
+class _TestClientTransport:
+
+    def __init__(self):
+        self.client = Client(raise_request_exception=False)
+
+    def request(self, method: str, path: str, data: Optional[Dict] = None) -> int:
+        if method == 'GET':
+            return self.client.get(path).status_code
+        return self.client.post(path, data=data).status_code
+
+
+class _HttpTransport:
+    """A browser like session of the server, with its session and CSRF cookies."""
+
+    def __init__(self, base_url: str):
+        # Only the load test against a server needs requests.
+        import requests
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+
+    def request(self, method: str, path: str, data: Optional[Dict] = None) -> int:
+        if method == 'GET':
+            return self.session.get(f'{self.base_url}{path}', allow_redirects=False).status_code
+        if 'csrftoken' not in self.session.cookies:
+            self.session.get(f'{self.base_url}/')
+        return self.session.post(f'{self.base_url}{path}', data=data, allow_redirects=False,
+                                 headers={'X-CSRFToken': self.session.cookies.get('csrftoken', ''),
+                                          'Referer': f'{self.base_url}/'}).status_code
+
+
+class _VirtualUser:
+
+    def __init__(self, index: int, meeting_code: str, config: LoadTestConfig):
+        self.index = index
+        self.meeting_code = meeting_code
+        self.name = f'load_test_user_{index}'
+        self.email = f'user_{index}@{LOAD_TEST_EMAIL_DOMAIN}'
+        self.transport = _HttpTransport(config.base_url) if config.base_url else _TestClientTransport()
+        self.results: List[OperationResult] = []
+        self.registered_attendant_code: Optional[str] = None
+
+    def send(self, operation: str, method: str, path: str, data: Optional[Dict] = None) -> Optional[int]:
+        start_time = time.perf_counter()
+        status_code, error = None, None
+        try:
+            status_code = self.transport.request(method, path, data)
+        except Exception as e:
+            error = f'{operation}: {e!r}'
+        result = OperationResult(operation, time.perf_counter() - start_time, status_code, error)
+        if error is None and status_code not in OPERATION_EXPECTED_STATUS_CODES[operation]:
+            result.error = f'{operation} {path} responded {status_code}.'
+        self.results.append(result)
+        return status_code
+
+    def _preference_post_data(self, prefer_to_attend_every_n_months: int) -> Dict:
+        return {'name': self.name,
+                'email': self.email,
+                'prefer_to_attend_every_n_months': str(prefer_to_attend_every_n_months),
+                'selected_attending_dates': '[{"value":"12/16/2021 - 12/25/2021:repeat_each_year"}]',
+                'online_attending_time_zone': '0',
+                'acceptable_meeting_methods': ['online'],
+                'weighted_attendants': '',
+                'minimal_meeting_value': '1',
+                'minimal_meeting_size': '2'}
+
+    def register_and_edit(self, edits: int) -> Optional[int]:
+        """Returns the expected prefer_to_attend_every_n_months of the preference, None if not registered."""
+        if self.send(OPERATION_OPEN_FORM, 'POST', '/meeting_preference/', {'meeting_code': self.meeting_code}) != 200:
+            return None
+        if self.send(OPERATION_REGISTER, 'POST', '/meeting_preference/', self._preference_post_data(12)) != 302:
+            return None
+        preference = MeetingPreference.objects.filter(meeting_id=self.meeting_code, name=self.name).first()
+        if preference is None:
+            return None
+        self.registered_attendant_code = str(preference.registered_attendant_code)
+        self.send(OPERATION_VERIFY, 'GET', f'/email_verification/{preference.email_verification_code}')
+        prefer_to_attend_every_n_months = 12
+        for edit in range(edits):
+            self.send(OPERATION_OPEN_FORM, 'POST', '/meeting_preference/',
+                      {'meeting_code': self.meeting_code, 'registered_attendant_code': self.registered_attendant_code})
+            prefer_to_attend_every_n_months = edit + 1
+            self.send(OPERATION_EDIT, 'POST', '/meeting_preference/',
+                      self._preference_post_data(prefer_to_attend_every_n_months))
+        return prefer_to_attend_every_n_months
+
+    def confirm(self, invitations: List[Invitation]):
+        for invitation in invitations:
+            self.send(OPERATION_CONFIRM, 'GET',
+                      f'/confirm_invitation/{invitation.record_id}/{invitation.invitation_code}')
+
+
+def _run_concurrently(tasks: List[Callable], concurrency: int) -> List:
+    """Runs the tasks in concurrency threads and returns their results in order, or in this thread if it's 1."""
+    if concurrency <= 1:
+        return [task() for task in tasks]
+
+    def run(task):
+        try:
+            return task()
+        finally:
+            # Each thread has its own database connections.
+            connections.close_all()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(run, tasks))
+
+
+def _percentile(sorted_values: List[float], percent: float) -> float:
+    """Nearest rank percentile."""
+    if not sorted_values:
+        return 0
+    rank = max(int(round(percent / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize_operations(results: List[OperationResult], elapsed_seconds: float) -> Dict:
+    operation_to_results: Dict[str, List[OperationResult]] = collections.defaultdict(list)
+    for result in results:
+        operation_to_results[result.operation].append(result)
+    operations = {}
+    for operation, operation_results in sorted(operation_to_results.items()):
+        latencies = sorted(result.latency_seconds * 1000 for result in operation_results)
+        operations[operation] = {
+            'count': len(operation_results),
+            'errors': sum(result.error is not None for result in operation_results),
+            'status_codes': dict(collections.Counter(str(result.status_code) for result in operation_results)),
+            'latency_ms': {'p50': _percentile(latencies, 50), 'p90': _percentile(latencies, 90),
+                           'p99': _percentile(latencies, 99), 'max': latencies[-1]},
+        }
+    return {'requests': len(results),
+            'elapsed_seconds': elapsed_seconds,
+            'throughput_per_second': len(results) / elapsed_seconds if elapsed_seconds else 0,
+            'errors': sum(result.error is not None for result in results),
+            'error_samples': [result.error for result in results if result.error][:MAX_ERROR_SAMPLES],
+            'operations': operations}
+
+
+def _create_records_and_invitations(meeting: Meeting, preferences: List[MeetingPreference]
+                                    ) -> Tuple[List[MeetingRecord], Dict[str, List[Invitation]]]:
+    """Two meeting records a month apart, inviting all the preferences, and {attendant code: invitations}."""
+    records = []
+    for days in (30, 60):
+        start_time = (get_utc_now() + datetime.timedelta(days=days)).replace(microsecond=0)
+        records.append(MeetingRecord.objects.create(
+            meeting=meeting, meeting_status=MEETING_RECORD_STATUS_INITIALIZED, meeting_method='online',
+            offline_meeting_locations='', online_meeting_link=LOAD_TEST_ONLINE_MEETING_LINK,
+            meeting_start_time=start_time, meeting_end_time=start_time + datetime.timedelta(hours=2)))
+    code_to_invitations = collections.defaultdict(list)
+    for invitation in Invitation.objects.bulk_create(
+            [Invitation(record=record, attendant=preference) for record in records for preference in preferences]):
+        code_to_invitations[str(invitation.attendant_id)].append(invitation)
+    return records, code_to_invitations
+
+
+def check_invariants(meeting: Meeting, registered_users: int, unregistered_users: int,
+                     expected_months: Dict[str, int], records: List[MeetingRecord], input_version_writes: int) -> List[str]:
+    """Violations of what the successful requests should have left in the database."""
+    violations = []
+    meeting.refresh_from_db()
+    preferences = list(MeetingPreference.objects.filter(meeting=meeting))
+    if len(preferences) > meeting.code_max_usage:
+        violations.append(f'Overbooked: {len(preferences)} registrations of {meeting.code_max_usage} slots.')
+    if meeting.code_available_usage != meeting.code_max_usage - len(preferences):
+        violations.append(f'code_available_usage is {meeting.code_available_usage} with {len(preferences)} '
+                          f'registrations of {meeting.code_max_usage} slots.')
+    if len(preferences) != registered_users:
+        violations.append(f'{registered_users} registrations succeeded, {len(preferences)} are saved.')
+    if unregistered_users and meeting.code_available_usage > 0:
+        violations.append(f'{unregistered_users} users are not registered with '
+                          f'{meeting.code_available_usage} slots left.')
+    attendance_counts = collections.Counter(
+        str(code) for code in MeetingAttendance.objects.filter(attendant_preference__meeting=meeting)
+        .values_list('attendant_preference_id', flat=True))
+    latest_start_time = max((record.meeting_start_time for record in records), default=None)
+    code_to_confirmation_time = dict(
+        MeetingAttendance.objects.filter(attendant_preference__meeting=meeting)
+        .values_list('attendant_preference_id', 'latest_confirmation_time'))
+    for preference in preferences:
+        code = str(preference.registered_attendant_code)
+        if attendance_counts[code] != 1:
+            violations.append(f'{preference.name} has {attendance_counts[code]} attendance rows.')
+        if preference.email_verification_code != VERIFIED_EMAIL_STATUS:
+            violations.append(f'{preference.name} is not verified.')
+        if code in expected_months and preference.prefer_to_attend_every_n_months != expected_months[code]:
+            violations.append(f'Lost edit of {preference.name}: prefer_to_attend_every_n_months is '
+                              f'{preference.prefer_to_attend_every_n_months}, expected {expected_months[code]}.')
+        confirmation_time = code_to_confirmation_time.get(preference.registered_attendant_code)
+        if latest_start_time and confirmation_time != latest_start_time:
+            violations.append(f'Lost confirmation of {preference.name}: latest_confirmation_time is '
+                              f'{confirmation_time}, expected {latest_start_time}.')
+    unconfirmed = Invitation.objects.filter(record__in=records).exclude(status=ATTENDANT_CONFIRM_STATUS).count()
+    if unconfirmed:
+        violations.append(f'{unconfirmed} invitations are not confirmed.')
+    if meeting.input_version != input_version_writes:
+        violations.append(f'input_version is {meeting.input_version} after {input_version_writes} writes.')
+    return violations
+
+
+def _delete_load_test_data(meeting: Meeting):
+    Invitation.objects.filter(record__meeting=meeting).delete()
+    MeetingRecord.objects.filter(meeting=meeting).delete()
+    MeetingAttendance.objects.filter(attendant_preference__meeting=meeting).delete()
+    MeetingPreference.objects.filter(meeting=meeting).delete()
+    OutboxEmail.objects.filter(recipient__endswith=f'@{LOAD_TEST_EMAIL_DOMAIN}').delete()
+    meeting.delete()
+
+
+def _count_input_version_writes(users: List[_VirtualUser]) -> int:
+    """Bumps of the meeting input version by the successful requests.
+
+    A registration saves the preference and its attendance, a verification and an edit save the preference and a
+    confirmation updates the attendance."""
+    bumps = {OPERATION_REGISTER: 2, OPERATION_VERIFY: 1, OPERATION_EDIT: 1, OPERATION_CONFIRM: 1}
+    writes = 0
+    for user in users:
+        for result in user.results:
+            if result.error is None and result.operation in bumps and result.status_code // 100 in (2, 3):
+                writes += bumps[result.operation]
+    return writes
+
+
+def run_load_test(config: LoadTestConfig) -> Dict:
+    """Runs the registration phase and then the confirmation phase, returns the report of both."""
+    if config.base_url:
+        return _run_load_test(config)
+    # The test client requests are served by this process.
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+        return _run_load_test(config)
+
+
+def _run_load_test(config: LoadTestConfig) -> Dict:
+    rng = random.Random(config.seed)
+    meeting = Meeting.objects.create(
+        meeting_code=uuid.uuid4(), display_name=LOAD_TEST_MEETING_NAME,
+        code_max_usage=config.meeting_slots, code_available_usage=config.meeting_slots,
+        contact_email=f'owner@{LOAD_TEST_EMAIL_DOMAIN}')
+    meeting_code = str(meeting.meeting_code)
+    users = [_VirtualUser(index, meeting_code, config) for index in range(config.users)]
+    try:
+        start_time = time.perf_counter()
+        expected_months = _run_concurrently(
+            [functools.partial(user.register_and_edit, config.edits_per_user) for user in users], config.concurrency)
+        registration_seconds = time.perf_counter() - start_time
+        registered_users = [user for user in users if user.registered_attendant_code]
+
+        records, code_to_invitations = _create_records_and_invitations(
+            meeting, list(MeetingPreference.objects.filter(meeting=meeting)))
+        confirm_tasks = []
+        for user in registered_users:
+            invitations = code_to_invitations[user.registered_attendant_code]
+            # The same confirmation link is clicked twice.
+            invitations = invitations + [rng.choice(invitations)]
+            rng.shuffle(invitations)
+            confirm_tasks.append(functools.partial(user.confirm, invitations))
+        start_time = time.perf_counter()
+        _run_concurrently(confirm_tasks, config.concurrency)
+        confirmation_seconds = time.perf_counter() - start_time
+
+        results = [result for user in users for result in user.results]
+        violations = check_invariants(
+            meeting, len(registered_users), len(users) - len(registered_users),
+            {user.registered_attendant_code: months for user, months in zip(users, expected_months)
+             if user.registered_attendant_code and months is not None},
+            records, _count_input_version_writes(users))
+    finally:
+        if not config.keep_data:
+            _delete_load_test_data(meeting)
+    return {'config': dataclasses.asdict(config),
+            'meeting_code': meeting_code,
+            'registered_users': len(registered_users),
+            'registration_seconds': registration_seconds,
+            'confirmation_seconds': confirmation_seconds,
+            **summarize_operations(results, registration_seconds + confirmation_seconds),
+            'invariant_violations': violations}
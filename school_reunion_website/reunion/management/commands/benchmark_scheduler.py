@@ -0,0 +1,50 @@
+"""Times the scheduling stages on a synthetic meeting and prints the results as JSON.
+
+The synthetic meeting is rolled back after the run, so it can run against any database.
+Run under manager.py directory with command:
+    python3.9 manage.py benchmark_scheduler --attendants 500 --conflict-density 0.05 --output results.json"""
+import datetime
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ...scheduler_benchmark import SyntheticWorkload, create_synthetic_meeting, run_scheduler_benchmark
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the scheduling pipeline stages on a synthetic workload.'
+
+    def add_arguments(self, parser):
+        defaults = SyntheticWorkload()
+        parser.add_argument('--attendants', type=int, default=defaults.attendant_count)
+        parser.add_argument('--conflict-density', type=float, default=defaults.conflict_density,
+                            help='Chance that an attendant gives another attendant a negative weight.')
+        parser.add_argument('--history-ratio', type=float, default=defaults.history_ratio,
+                            help='Share of attendants who confirmed a meeting before.')
+        parser.add_argument('--max-rules', type=int, default=defaults.max_rules_per_attendant,
+                            help='Max attending date rules of each attendant.')
+        parser.add_argument('--start', type=datetime.date.fromisoformat, default=defaults.start)
+        parser.add_argument('--until', type=datetime.date.fromisoformat, default=defaults.until)
+        parser.add_argument('--seed', type=int, default=defaults.seed)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--busiest-dates', type=int, default=20,
+                            help='Dates the sanitization and conflict resolution stages are timed on.')
+        parser.add_argument('--output', default=None, help='Writes the JSON results to the file instead of stdout.')
+
+    def handle(self, *args, **options):
+        workload = SyntheticWorkload(
+            attendant_count=options['attendants'], conflict_density=options['conflict_density'],
+            history_ratio=options['history_ratio'], max_rules_per_attendant=options['max_rules'],
+            start=options['start'], until=options['until'], seed=options['seed'])
+        with transaction.atomic():
+            meeting = create_synthetic_meeting(workload)
+            results = run_scheduler_benchmark(
+                meeting, workload, repeat=options['repeat'], busiest_date_count=options['busiest_dates'])
+            transaction.set_rollback(True)
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(output)
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,31 @@
+"""Precomputes holidays of all supported countries to a file, so processes don't generate them at runtime.
+
+Run under manager.py directory with command:
+    python3.9 manage.py build_holiday_index --first-year 2022 --last-year 2025"""
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from ...utils import get_holiday_index_path, write_holiday_index
+
+
+class Command(BaseCommand):
+    help = ('Builds the country -> holiday -> dates index served by get_country_holidays and '
+            'get_country_holiday_catalog.')
+
+    def add_arguments(self, parser):
+        current_year = datetime.datetime.utcnow().year
+        parser.add_argument('--first-year', type=int, default=current_year)
+        # Meetings are scheduled up to about 14 months ahead.
+        parser.add_argument('--last-year', type=int, default=current_year + 2)
+        parser.add_argument('--output', default=None,
+                            help='Defaults to REUNION_HOLIDAY_INDEX_PATH setting or reunion/holiday_index.json.')
+
+    def handle(self, *args, **options):
+        if options['first_year'] > options['last_year']:
+            self.stderr.write('--first-year must not be after --last-year.')
+            return
+        path = options['output'] or get_holiday_index_path()
+        years = range(options['first_year'], options['last_year'] + 1)
+        write_holiday_index(years, path)
+        self.stdout.write(f'Holiday index for {options["first_year"]}-{options["last_year"]} is written to {path}.')
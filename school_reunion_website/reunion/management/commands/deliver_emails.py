@@ -0,0 +1,43 @@
+"""Sends the emails in the outbox until it's stopped by SIGTERM or SIGINT.
+
+Run under manager.py directory with command:
+    python3.9 manage.py deliver_emails --interval 10"""
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from ...emails import deliver_outbox_emails
+from ...utils import OUTBOX_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Sends the pending outbox emails in batches, each batch over one connection.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Sends the pending emails and exits.')
+        parser.add_argument('--interval', type=float, default=10, help='Seconds between checks of the outbox.')
+        parser.add_argument('--batch-size', type=int, default=OUTBOX_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        stop_event = threading.Event()
+
+        def stop(signum, frame):
+            stop_event.set()
+
+        previous_handlers = {signum: signal.signal(signum, stop) for signum in (signal.SIGTERM, signal.SIGINT)}
+        try:
+            while not stop_event.is_set():
+                sent_count = 0
+                batch_sent_count = deliver_outbox_emails(options['batch_size'])
+                while batch_sent_count and not stop_event.is_set():
+                    sent_count += batch_sent_count
+                    batch_sent_count = deliver_outbox_emails(options['batch_size'])
+                if sent_count:
+                    self.stdout.write(f'Sent {sent_count} emails.')
+                if options['once']:
+                    break
+                stop_event.wait(options['interval'])
+        finally:
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
@@ -0,0 +1,46 @@
+"""Sends concurrent registration, verification, edit and confirmation traffic and prints the report as JSON.
+
+The load test meeting and its data are deleted after the run unless --keep-data is given, and the command fails if
+any invariant is violated. Without --base-url the requests go through the Django test client, with it they go to
+a running server that uses the same database.
+Run under manager.py directory with command:
+    python3.9 manage.py load_test --users 40 --concurrency 8 --slots 30
+    python3.9 manage.py load_test --base-url http://127.0.0.1:8000 --users 40 --concurrency 8"""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...load_test import LoadTestConfig, run_load_test
+
+
+class Command(BaseCommand):
+    help = 'Load tests the registration and confirmation endpoints and checks the data they leave behind.'
+
+    def add_arguments(self, parser):
+        defaults = LoadTestConfig()
+        parser.add_argument('--users', type=int, default=defaults.users)
+        parser.add_argument('--concurrency', type=int, default=defaults.concurrency,
+                            help='Virtual users run at the same time, 1 runs them one by one in this thread.')
+        parser.add_argument('--slots', type=int, default=defaults.meeting_slots,
+                            help='Available slots of the load test meeting.')
+        parser.add_argument('--edits', type=int, default=defaults.edits_per_user,
+                            help='Preference edits of each registered user.')
+        parser.add_argument('--base-url', default=defaults.base_url,
+                            help='Server to send the requests to, e.g. http://127.0.0.1:8000.')
+        parser.add_argument('--seed', type=int, default=defaults.seed)
+        parser.add_argument('--keep-data', action='store_true')
+        parser.add_argument('--output', default=None, help='Writes the JSON report to the file instead of stdout.')
+
+    def handle(self, *args, **options):
+        report = run_load_test(LoadTestConfig(
+            users=options['users'], concurrency=options['concurrency'], meeting_slots=options['slots'],
+            edits_per_user=options['edits'], base_url=options['base_url'], seed=options['seed'],
+            keep_data=options['keep_data']))
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(output)
+        else:
+            self.stdout.write(output)
+        if report['invariant_violations']:
+            raise CommandError(f'{len(report["invariant_violations"])} invariant violations.')
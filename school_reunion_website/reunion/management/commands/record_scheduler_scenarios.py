@@ -0,0 +1,28 @@
+"""Snapshots meetings into the scenario corpus replayed by the replay_scheduler_scenarios command.
+
+Run under manager.py directory with command:
+    python3.9 manage.py record_scheduler_scenarios --corpus scheduler_corpus --meeting-code <code>"""
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import Meeting
+from ...scheduler_replay import snapshot_meeting, write_scenario
+
+
+class Command(BaseCommand):
+    help = 'Writes the participants and attendance of meetings as scenario files.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', required=True, help='Directory of the scenario files.')
+        parser.add_argument('--meeting-code', action='append', default=[], help='Can be repeated.')
+        parser.add_argument('--all', action='store_true', help='Records every meeting.')
+
+    def handle(self, *args, **options):
+        if options['all']:
+            meetings = Meeting.objects.order_by('meeting_code')
+        elif options['meeting_code']:
+            meetings = Meeting.objects.filter(meeting_code__in=options['meeting_code']).order_by('meeting_code')
+        else:
+            raise CommandError('Either --meeting-code or --all is required.')
+        for meeting in meetings:
+            path = write_scenario(snapshot_meeting(meeting), options['corpus'])
+            self.stdout.write(f'Recorded meeting {meeting.meeting_code} to {path}.')
@@ -0,0 +1,45 @@
+"""Replays the scenario corpus with the scheduler engines and prints the plan metrics, runtime and memory as JSON.
+
+Run under manager.py directory with command:
+    python3.9 manage.py replay_scheduler_scenarios --corpus scheduler_corpus --engine date_lists --engine matrix"""
+import dataclasses
+import json
+
+from django.core.management.base import BaseCommand
+
+from ...schedule_meeting import SCHEDULER_ENGINES
+from ...scheduler_replay import load_corpus, replay_scenario
+
+
+class Command(BaseCommand):
+    help = 'Runs scheduler engines over the recorded scenarios with a fixed seed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', required=True, help='Directory of the scenario files.')
+        parser.add_argument('--engine', action='append', choices=sorted(SCHEDULER_ENGINES), default=[],
+                            help='Can be repeated, defaults to all engines.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default=None, help='Writes the JSON results to the file instead of stdout.')
+
+    def handle(self, *args, **options):
+        engines = options['engine'] or sorted(SCHEDULER_ENGINES)
+        results = [replay_scenario(name, scenario, engine, seed=options['seed'])
+                   for name, scenario in load_corpus(options['corpus']) for engine in engines]
+        totals = {}
+        for engine in engines:
+            engine_results = [result for result in results if result.engine == engine]
+            totals[engine] = {
+                'meetings_scheduled': sum(result.meetings_scheduled for result in engine_results),
+                'total_attendees': sum(result.total_attendees for result in engine_results),
+                'total_participant_value': sum(result.total_participant_value for result in engine_results),
+                'runtime_seconds': sum(result.runtime_seconds for result in engine_results),
+                'max_peak_memory_bytes': max((result.peak_memory_bytes for result in engine_results), default=0),
+            }
+        output = json.dumps({'seed': options['seed'],
+                             'results': [dataclasses.asdict(result) for result in results],
+                             'totals': totals}, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(output)
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,58 @@
+"""Schedules the stale meetings periodically until it's stopped by SIGTERM or SIGINT.
+
+Run under manager.py directory with command:
+    python3.9 manage.py run_scheduler --max-workers 4 --interval 3600"""
+import concurrent.futures
+import datetime
+import os
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from ...scheduler_worker import (run_scheduling_round, initialize_worker, DEFAULT_STALE_AFTER,
+                                 DEFAULT_MEETING_TIMEOUT_SECONDS)
+
+
+class Command(BaseCommand):
+    help = 'Runs schedule_meetings for the meetings not checked recently in a process pool.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Runs one round and exits.')
+        parser.add_argument('--interval', type=float, default=3600, help='Seconds between rounds.')
+        parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1,
+                            help='Worker processes, 1 schedules the meetings in this process.')
+        parser.add_argument('--timeout', type=float, default=DEFAULT_MEETING_TIMEOUT_SECONDS,
+                            help='Seconds one meeting may take, 0 for no limit.')
+        parser.add_argument('--stale-after', type=float, default=DEFAULT_STALE_AFTER.total_seconds() / 3600,
+                            help='Hours after the last check a meeting is scheduled again.')
+
+    def handle(self, *args, **options):
+        stop_event = threading.Event()
+
+        def stop(signum, frame):
+            self.stdout.write('Stopping after the running meetings are done.')
+            stop_event.set()
+
+        previous_handlers = {signum: signal.signal(signum, stop) for signum in (signal.SIGTERM, signal.SIGINT)}
+        executor = None
+        if options['max_workers'] > 1:
+            executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=options['max_workers'], initializer=initialize_worker)
+        try:
+            while not stop_event.is_set():
+                result = run_scheduling_round(
+                    executor, stale_after=datetime.timedelta(hours=options['stale_after']),
+                    timeout_seconds=options['timeout'] or None, stop_event=stop_event)
+                self.stdout.write(
+                    f'Scheduled {len(result.scheduled_meeting_codes)} meetings, '
+                    f'{len(result.failed_meeting_codes)} failed, {len(result.timed_out_meeting_codes)} timed out, '
+                    f'{len(result.cancelled_meeting_codes)} cancelled.')
+                if options['once']:
+                    break
+                stop_event.wait(options['interval'])
+        finally:
+            if executor:
+                executor.shutdown(wait=True)
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
@@ -1,8 +1,11 @@
 import datetime
 from pytz import UTC
 from django.db import models
+from django.utils import timezone
 from django.core.validators import MaxValueValidator, MinValueValidator
 import uuid
+from typing import Dict
+from .utils import parse_attending_date_rules, get_weighted_attendants_as_dictionary, ATTENDANT_PENDING_STATUS, OUTBOX_STATUS_PENDING, OUTBOX_STATUS_SENDING
 
 
 DEFAULT_INITIAL_DATE = datetime.datetime(year=1970, month=1, day=1, tzinfo=UTC)
@@ -17,10 +20,40 @@ class Meeting(models.Model):
     code_available_usage = models.IntegerField(default=-1)
     contact_email = models.EmailField()
     last_check_time = models.DateTimeField(default=DEFAULT_INITIAL_DATE)
+    # Bumped when the scheduler inputs of the meeting change, see mark_meeting_inputs_changed.
+    input_version = models.IntegerField(default=0)
+    # The input_version scheduled_plan is computed with.
+    scheduled_input_version = models.IntegerField(default=-1)
+    # {'start': ISO date, 'until': ISO date, 'dates': [{'date': ISO date, 'participants': [attendant code]}]},
+    # None if never scheduled.
+    scheduled_plan = models.JSONField(null=True, blank=True)
+    scheduled_plan_time = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f'meeting {self.meeting_code}'
 
+    def reserve_available_slot(self) -> bool:
+        """Decrements the available usage in the database if it's positive, returns if a slot is reserved.
+
+        The check and the decrement are one UPDATE, so concurrent registrations can't overbook the meeting."""
+        return bool(Meeting.objects.filter(pk=self.pk, code_available_usage__gt=0).update(
+            code_available_usage=models.F('code_available_usage') - 1))
+
+    def save(self, *args, **kwargs):
+        # input_version is only changed by mark_meeting_inputs_changed, don't overwrite it with a stale value.
+        if not self._state.adding and not kwargs.get('update_fields'):
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name != 'input_version']
+        super().save(*args, **kwargs)
+
+
+def mark_meeting_inputs_changed(meeting_id):
+    """Bumps the input version of the meeting, so its plan is computed again in the next scheduling.
+
+    It's called when a preference or attendance is saved, a queryset update of them needs to call it explicitly.
+    """
+    Meeting.objects.filter(pk=meeting_id).update(input_version=models.F('input_version') + 1)
+
 
 class MeetingRecord(models.Model):
     record_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -29,13 +62,15 @@ class MeetingRecord(models.Model):
 
     meeting_method = models.TextField()
     offline_meeting_locations = models.TextField()
-    online_meeting_link = models.TextField()
+    # Empty until the first invitation is confirmed, see ensure_online_meeting_link.
+    online_meeting_link = models.TextField(blank=True, default='')
     meeting_start_time = models.DateTimeField()
     meeting_end_time = models.DateTimeField()
-    # {UUID: PENDING|CONFIRM|DENY}
-    attendant_code_to_status = models.TextField()
-    # {invitation code: UUID}
-    invitation_code_to_attendant_code = models.TextField()
+
+    def get_invitation_status_counts(self) -> Dict[str, int]:
+        """{PENDING|CONFIRM|DENY: number of invitations}, counted by the database."""
+        return {entry['status']: entry['count'] for entry in
+                self.invitations.values('status').annotate(count=models.Count('pk')).order_by()}
 
 
 class MeetingPreference(models.Model):
@@ -48,6 +83,8 @@ class MeetingPreference(models.Model):
     # Time and location:
     prefer_to_attend_every_n_months = models.IntegerField()
     selected_attending_dates = models.TextField(blank=True)
+    # Parsed from selected_attending_dates on save, None if not parsed yet.
+    attending_date_rules = models.JSONField(null=True, blank=True)
     # TODO/p0, add largest_meeting_regardless_dates option.
     #  The logic change would be adding a set of participants, people in the set would always be counted once
     #  in one date, after that date is picked remove selected participants from the set,
@@ -67,6 +104,8 @@ class MeetingPreference(models.Model):
     # The conflict between people will be handled in meeting scheduler.
     # Default value is 1 for everyone.
     weighted_attendants = models.TextField(blank=True)
+    # Parsed from weighted_attendants on save, {name: value}. None if not parsed yet.
+    weighted_attendant_values = models.JSONField(null=True, blank=True)
     # Minimal meeting value for one to be considered joining.
     minimal_meeting_value = models.IntegerField(default=2)
     # In case minimal_meeting_value doesn't cover edge cases.
@@ -78,7 +117,13 @@ class MeetingPreference(models.Model):
     class Meta:
         unique_together = (("meeting", "name"), ("meeting", "email"),)
 
+    def parse_attending_preference(self):
+        """Parses the string inputs once, so the scheduler doesn't need to parse them for each run."""
+        self.attending_date_rules = parse_attending_date_rules(self.selected_attending_dates)
+        self.weighted_attendant_values = get_weighted_attendants_as_dictionary(self.weighted_attendants)
+
     def save(self, **kwargs):
+        self.parse_attending_preference()
         if not self.earliest_meeting_time:
             self.earliest_meeting_time = '10:00'
         if not self.latest_meeting_time:
@@ -86,9 +131,53 @@ class MeetingPreference(models.Model):
         if not self.preferred_meeting_duration:
             self.preferred_meeting_duration = '4:00'
         super().save(kwargs)
+        mark_meeting_inputs_changed(self.meeting_id)
 
 
 class MeetingAttendance(models.Model):
     attendant_preference = models.ForeignKey(MeetingPreference, on_delete=models.PROTECT)
     latest_invitation_time = models.DateTimeField(default=DEFAULT_INITIAL_DATE)
     latest_confirmation_time = models.DateTimeField(default=DEFAULT_INITIAL_DATE)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        mark_meeting_inputs_changed(self.attendant_preference.meeting_id)
+
+
+class Invitation(models.Model):
+    record = models.ForeignKey(MeetingRecord, on_delete=models.PROTECT, related_name='invitations')
+    attendant = models.ForeignKey(MeetingPreference, on_delete=models.PROTECT)
+    # Part of the link sent to the attendant for confirmation.
+    invitation_code = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    # PENDING|CONFIRM|DENY
+    status = models.CharField(max_length=10, default=ATTENDANT_PENDING_STATUS)
+
+    class Meta:
+        unique_together = (("record", "attendant"),)
+        indexes = [models.Index(fields=["record", "status"])]
+
+
+class OutboxEmail(models.Model):
+    """An email waiting to be sent by deliver_outbox_emails, enqueued in the transaction that needs it sent."""
+    subject = models.TextField()
+    message = models.TextField()
+    from_email = models.EmailField()
+    recipient = models.EmailField()
+    # Hash of the email, the same email can't be pending or sending twice.
+    dedup_key = models.CharField(max_length=64)
+    # PENDING|SENDING|SENT|FAILED
+    status = models.CharField(max_length=10, default=OUTBOX_STATUS_PENDING)
+    attempts = models.IntegerField(default=0)
+    # When a pending email is due, or when the lease of a sending email expires.
+    next_attempt_time = models.DateTimeField(default=timezone.now)
+    # Set by the worker that claimed the sending email.
+    lease_token = models.UUIDField(null=True, blank=True, db_index=True)
+    created_time = models.DateTimeField(auto_now_add=True)
+    sent_time = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(
+            fields=["dedup_key"], condition=models.Q(status__in=[OUTBOX_STATUS_PENDING, OUTBOX_STATUS_SENDING]),
+            name="unique_pending_outbox_email")]
+        indexes = [models.Index(fields=["status", "next_attempt_time"])]
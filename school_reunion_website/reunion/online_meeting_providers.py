@@ -0,0 +1,84 @@
+"""Providers creating the online meeting links, selected by the REUNION_ONLINE_MEETING_PROVIDER setting.
+
+Providers are created on first use, so only the processes creating links import the provider's dependencies.
+"""
+import abc
+import datetime
+import functools
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+from django.conf import settings
+
+ONLINE_MEETING_PROVIDER_GRAPH = 'graph'
+ONLINE_MEETING_PROVIDER_LOCAL = 'local'
+ONLINE_MEETING_PROVIDER_RECORDING = 'recording'
+DEFAULT_ONLINE_MEETING_PROVIDER = ONLINE_MEETING_PROVIDER_GRAPH
+# Reserved top level domain, links of the local providers never resolve.
+LOCAL_MEETING_LINK_PREFIX = 'https://meeting.invalid/'
+
+
+class OnlineMeetingProvider(abc.ABC):
+
+    @abc.abstractmethod
+    def create_meeting_link(self, meeting_name: str, start_time: datetime.datetime,
+                            end_time: datetime.datetime, external_id: str) -> Optional[str]:
+        """Returns the link of the online meeting of external_id, None if it can't be created now.
+
+        Calls with the same external_id return the link of the same meeting, so they can be repeated.
+        """
+
+
+class GraphOnlineMeetingProvider(OnlineMeetingProvider):
+    """Microsoft Teams meetings created through Graph, needs msal and the credentials in app_settings."""
+
+    def __init__(self):
+        from .create_online_meeting import create_meeting_link
+        self._create_meeting_link = create_meeting_link
+
+    def create_meeting_link(self, meeting_name, start_time, end_time, external_id):
+        return self._create_meeting_link(meeting_name, start_time, end_time, external_id=external_id)
+
+
+class LocalOnlineMeetingProvider(OnlineMeetingProvider):
+    """Placeholder links for development and benchmarks, no request is sent."""
+
+    def create_meeting_link(self, meeting_name, start_time, end_time, external_id):
+        return f'{LOCAL_MEETING_LINK_PREFIX}{quote(meeting_name)}/{external_id}'
+
+
+class RecordingOnlineMeetingProvider(OnlineMeetingProvider):
+    """Fake for tests, records the calls and fails them while available is False."""
+
+    def __init__(self):
+        self.available = True
+        # [(meeting name, start time, end time, external id)]
+        self.calls: List[Tuple[str, datetime.datetime, datetime.datetime, str]] = []
+
+    def create_meeting_link(self, meeting_name, start_time, end_time, external_id):
+        self.calls.append((meeting_name, start_time, end_time, external_id))
+        if not self.available:
+            return None
+        return f'{LOCAL_MEETING_LINK_PREFIX}recorded/{external_id}'
+
+
+ONLINE_MEETING_PROVIDERS: Dict[str, Callable[[], OnlineMeetingProvider]] = {
+    ONLINE_MEETING_PROVIDER_GRAPH: GraphOnlineMeetingProvider,
+    ONLINE_MEETING_PROVIDER_LOCAL: LocalOnlineMeetingProvider,
+    ONLINE_MEETING_PROVIDER_RECORDING: RecordingOnlineMeetingProvider,
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _create_online_meeting_provider(name: str) -> OnlineMeetingProvider:
+    return ONLINE_MEETING_PROVIDERS[name]()
+
+
+def get_online_meeting_provider() -> OnlineMeetingProvider:
+    """The provider named by the REUNION_ONLINE_MEETING_PROVIDER setting, one instance per process."""
+    return _create_online_meeting_provider(
+        getattr(settings, 'REUNION_ONLINE_MEETING_PROVIDER', DEFAULT_ONLINE_MEETING_PROVIDER))
+
+
+def clear_online_meeting_providers():
+    _create_online_meeting_provider.cache_clear()
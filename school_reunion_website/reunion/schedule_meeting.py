@@ -1,23 +1,43 @@
+import bisect
+import calendar
 import datetime
+import logging
 import uuid
 
-from .models import MeetingPreference, Meeting, MeetingRecord, MeetingAttendance
-from .utils import ATTENDANT_PENDING_STATUS, VERIFIED_EMAIL_STATUS, get_country_to_holidays_map, REPEAT_OPTIONS_SET, NO_REPEAT, REPEAT_EACH_YEAR, REPEAT_EACH_WEEK, REPEAT_EACH_MONTH, MEETING_RECORD_STATUS_INITIALIZED, MEETING_RECORD_STATUS_FINALIZED, ATTENDANT_CONFIRM_STATUS
+from .models import MeetingPreference, Meeting, MeetingRecord, MeetingAttendance, Invitation, mark_meeting_inputs_changed
+from .utils import VERIFIED_EMAIL_STATUS, get_country_holidays, REPEAT_OPTIONS_SET, NO_REPEAT, REPEAT_EACH_YEAR, REPEAT_EACH_WEEK, REPEAT_EACH_MONTH, MEETING_RECORD_STATUS_INITIALIZED, MEETING_RECORD_STATUS_FINALIZED, ATTENDANT_CONFIRM_STATUS, ATTENDING_RULE_HOLIDAY, ATTENDING_RULE_CUSTOM, get_bitmap_indices
 import collections
-from typing import List, Dict, Optional, Tuple, Union, Set
+import heapq
+from typing import Callable, List, Dict, Optional, Tuple, Union, Set
 import random
-from .emails import send_scheduled_meeting_notification, send_final_meeting_reminder_emails
-import json
-from .create_online_meeting import create_meeting_link
+from .emails import send_scheduled_meeting_notifications, send_final_meeting_reminder_emails
+from .online_meeting_providers import get_online_meeting_provider
+from .conflict_solver import solve_conflict_graph, get_tie_broken_weights
+from .scheduling_stats import (collect_scheduling_stats, increment_counter, timed_phase, SchedulingStats,
+                               PHASE_LOAD_ATTENDANCE, PHASE_RULE_EXPANSION, PHASE_HOLIDAY_LOOKUP, PHASE_PICK_DATES,
+                               PHASE_SANITIZATION, PHASE_CONFLICT_SOLVER, PHASE_ARRANGE_MEETINGS, COUNTER_HOLIDAY_RULES,
+                               COUNTER_CUSTOM_RULES, COUNTER_SIZE_SANITIZATIONS, COUNTER_VALUE_SANITIZATIONS,
+                               COUNTER_CONFLICT_ROUNDS, COUNTER_CONFLICT_SOLVER_RUNS, COUNTER_CONFLICT_SOLVER_NODES,
+                               COUNTER_PICKED_DATES, COUNTER_SCHEDULED_PLAN_CACHE_HITS, COUNTER_MEETINGS_ARRANGED)
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
 
-
-ALL_DATES = 'all_dates'
 # Consider to invite the candidate at least after 7 months if they prefer to attend every 10 months.
 MIN_ATTENDING_INTERVAL_TO_PREFERRED_INTERVAL = 0.7
 # Max participate value for people never attended the meeting: 365 * 4
 MAX_PARTICIPATE_VALUE = 1460
 SCHEDULE_MEETINGS_START_FROM_NOW = datetime.timedelta(days=60)
 NOTIFY_MEETINGS_UNTIL_FROM_NOW = datetime.timedelta(days=90)
+# A plan of unchanged inputs is computed again after this.
+MAX_SCHEDULED_PLAN_AGE = datetime.timedelta(days=7)
+# Greedy loop over {date: [participants preference]}.
+SCHEDULER_ENGINE_DATE_LISTS = 'date_lists'
+# Greedy loop over a participants x dates matrix, one bitmask column per date.
+SCHEDULER_ENGINE_MATRIX = 'matrix'
 
 # 1. {date: available people count with relax of 1 week} for 1 year from current time. (done)
 # 2. iteratively generate meeting from most count date to least count date
@@ -45,150 +65,225 @@ def _get_near_weekend_dates(date: datetime.date):
     return []
 
 
-def _transfer_holiday_to_dates(holiday_entry, start: datetime.date, until: datetime.date):
-    """Gets holiday dates with its adjacent weekend."""
-    country, holiday = holiday_entry.split(':')
-    country = country.replace('_', ' ')
+def _get_horizon_day_count(start: datetime.date, until: datetime.date) -> int:
+    return (until - start).days + 1
+
+
+def _get_range_bitmap(start: datetime.date, until: datetime.date,
+                      range_start: datetime.date, range_end: datetime.date) -> int:
+    """Returns the availability bitmap with dates in [range_start, range_end] set, bit i is start + i days."""
+    range_start = max(range_start, start)
+    range_end = min(range_end, until)
+    if range_start > range_end:
+        return 0
+    return ((1 << ((range_end - range_start).days + 1)) - 1) << (range_start - start).days
+
+
+def _set_date_bit(bitmap: int, date: datetime.date, start: datetime.date, until: datetime.date) -> int:
+    if start <= date <= until:
+        bitmap |= 1 << (date - start).days
+    return bitmap
+
+
+def _get_bitmap_dates(bitmap: int, start: datetime.date) -> List[datetime.date]:
+    """Decodes an availability bitmap to sorted dates."""
+    return [start + datetime.timedelta(days=index) for index in get_bitmap_indices(bitmap)]
+
+
+def _transfer_holiday_to_dates(holiday_rule: Dict[str, Optional[str]], start: datetime.date, until: datetime.date) -> int:
+    """Gets holiday dates with its adjacent weekend, as availability bitmap."""
     check_years = tuple(range(start.year, until.year+1))
-    country_to_holidays_map = get_country_to_holidays_map(check_years)
     dates = []
-    holidays_map = country_to_holidays_map.get(country)
+    with timed_phase(PHASE_HOLIDAY_LOOKUP):
+        holidays_map = get_country_holidays(holiday_rule['country'], check_years)
     if not holidays_map:
-        return dates
-    if holiday.startswith('Select All '):
+        return 0
+    if holiday_rule['holiday'] is None:
         for holiday, holiday_dates in holidays_map.items():
             dates.extend(holiday_dates)
     else:
-        dates = holidays_map.get(holiday, [])
+        dates = holidays_map.get(holiday_rule['holiday'], [])
 
-    final_dates = set()
+    bitmap = 0
     for date in dates:
-        final_dates.add(date)
-        for weekend_dates in _get_near_weekend_dates(date):
-            final_dates.add(weekend_dates)
-    return [date for date in list(final_dates) if start <= date <= until]
+        bitmap = _set_date_bit(bitmap, date, start, until)
+        for weekend_date in _get_near_weekend_dates(date):
+            bitmap = _set_date_bit(bitmap, weekend_date, start, until)
+    return bitmap
 
 
-def _transfer_custom_input_to_dates(custom_entry, start: datetime.date, until: datetime.date):
-    date_range, repeated_option = custom_entry.split(':')
+def _transfer_custom_input_to_dates(custom_rule: Dict[str, str], start: datetime.date, until: datetime.date) -> int:
+    """Gets dates matching the custom date range and its repeat option, as availability bitmap."""
+    repeated_option = custom_rule['repeat']
     if repeated_option not in REPEAT_OPTIONS_SET:
-        return []
+        return 0
 
-    input_start_date, input_end_date = date_range.split(' - ')
-    input_start_date = datetime.datetime.strptime(input_start_date, '%m/%d/%Y').date()
-    input_end_date = datetime.datetime.strptime(input_end_date, '%m/%d/%Y').date()
+    input_start_date = datetime.date.fromisoformat(custom_rule['start'])
+    input_end_date = datetime.date.fromisoformat(custom_rule['end'])
     diff_date = input_end_date - input_start_date
+    day_count = _get_horizon_day_count(start, until)
+    if day_count <= 0:
+        return 0
 
-    dates = []
     repeated_rule_set = set()
-
     current_input_date = input_start_date
     # Note if one year with 365 days is selected, Feb 29 will not be included.
     if repeated_option == REPEAT_EACH_YEAR:
         if diff_date > datetime.timedelta(days=365):
-            return [ALL_DATES]
+            return (1 << day_count) - 1
         while current_input_date <= input_end_date:
-            repeated_rule_set.add(f'{current_input_date.month}-{current_input_date.day}')
+            repeated_rule_set.add((current_input_date.month, current_input_date.day))
             current_input_date += datetime.timedelta(days=1)
+        bitmap = 0
+        for year in range(start.year, until.year + 1):
+            for month, day in repeated_rule_set:
+                # Feb 29 only exists in leap years.
+                if day <= calendar.monthrange(year, month)[1]:
+                    bitmap = _set_date_bit(bitmap, datetime.date(year, month, day), start, until)
+        return bitmap
     # Note if whole February is selected, day 30 and 31 will not be included.
     elif repeated_option == REPEAT_EACH_MONTH:
         if diff_date > datetime.timedelta(days=30):
-            return [ALL_DATES]
+            return (1 << day_count) - 1
         while current_input_date <= input_end_date:
             repeated_rule_set.add(current_input_date.day)
             current_input_date += datetime.timedelta(days=1)
+        bitmap = 0
+        year, month = start.year, start.month
+        while (year, month) <= (until.year, until.month):
+            days_in_month = calendar.monthrange(year, month)[1]
+            for day in repeated_rule_set:
+                if day <= days_in_month:
+                    bitmap = _set_date_bit(bitmap, datetime.date(year, month, day), start, until)
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return bitmap
     elif repeated_option == REPEAT_EACH_WEEK:
         if diff_date > datetime.timedelta(days=6):
-            return [ALL_DATES]
+            return (1 << day_count) - 1
         while current_input_date <= input_end_date:
             repeated_rule_set.add(current_input_date.weekday())
             current_input_date += datetime.timedelta(days=1)
-
-    current_date = start
-    while current_date <= until:
-        if repeated_option == REPEAT_EACH_YEAR:
-            if f'{current_date.month}-{current_date.day}' in repeated_rule_set:
-                dates.append(current_date)
-        elif repeated_option == REPEAT_EACH_MONTH:
-            if current_date.day in repeated_rule_set:
-                dates.append(current_date)
-        elif repeated_option == REPEAT_EACH_WEEK:
-            if current_date.weekday() in repeated_rule_set:
-                dates.append(current_date)
-        # No repeat.
-        elif input_start_date < current_date < input_end_date:
-            dates.append(current_date)
-        current_date += datetime.timedelta(days=1)
-    return dates
-
-
-def _get_all_dates(start: datetime.date, until: datetime.date):
-    dates = []
-    current_date = start
-    while current_date <= until:
-        dates.append(current_date)
-        current_date += datetime.timedelta(days=1)
-    return dates
+        # One week pattern aligned to the start date, then doubled until it covers all the dates.
+        bitmap = 0
+        for offset in range(7):
+            if (start.weekday() + offset) % 7 in repeated_rule_set:
+                bitmap |= 1 << offset
+        pattern_width = 7
+        while pattern_width < day_count:
+            bitmap |= bitmap << pattern_width
+            pattern_width *= 2
+        return bitmap & ((1 << day_count) - 1)
+    # No repeat, both ends of the input range are excluded.
+    return _get_range_bitmap(start, until,
+                             input_start_date + datetime.timedelta(days=1),
+                             input_end_date - datetime.timedelta(days=1))
+
+
+def get_available_dates_bitmap(preference: MeetingPreference, start: datetime.date, until: datetime.date) -> int:
+    """Returns the availability of the preference in [start, until], bit i is set if start + i days is available."""
+    day_count = _get_horizon_day_count(start, until)
+    all_dates_bitmap = (1 << day_count) - 1 if day_count > 0 else 0
+    if preference.attending_date_rules is None:
+        preference.parse_attending_preference()
+    available_dates_bitmap = 0
+    for attending_rule in preference.attending_date_rules:
+        if attending_rule['kind'] == ATTENDING_RULE_HOLIDAY:
+            increment_counter(COUNTER_HOLIDAY_RULES)
+            available_dates_bitmap |= _transfer_holiday_to_dates(attending_rule, start, until)
+        elif attending_rule['kind'] == ATTENDING_RULE_CUSTOM:
+            increment_counter(COUNTER_CUSTOM_RULES)
+            available_dates_bitmap |= _transfer_custom_input_to_dates(attending_rule, start, until)
+        if available_dates_bitmap == all_dates_bitmap:
+            break
+    return available_dates_bitmap
 
 
 def get_available_dates(preference: MeetingPreference, start: datetime.date, until: datetime.date):
-    attending_rules = preference.selected_attending_dates.split(',')
-    available_dates = set()
-    for attending_rule in attending_rules:
-        if len(attending_rule.split(':')) != 2:
+    return _get_bitmap_dates(get_available_dates_bitmap(preference, start, until), start)
+
+
+def _pop_next_date_to_participate(
+        candidates_queue: List[Tuple[int, Union[datetime.date, int], int, bool, List[MeetingPreference]]],
+        get_potential_participants: Callable[[Union[datetime.date, int]], List[MeetingPreference]],
+        history_meetings_attendance: List[MeetingAttendance],
+        rng: Optional[random.Random] = None, now: Optional[datetime.datetime] = None) \
+        -> Optional[Tuple[Union[datetime.date, int], List[MeetingPreference]]]:
+    """Pops the date with most participants after sanitization, the earliest one on equal participants count.
+
+    candidates_queue is a heap with one entry per date:
+    (-participants count, date, potential participants count when pushed, is count estimated, participants).
+    The potential participants count is an upper bound of the participants count, so a date is only sanitized
+    when its bound reaches the top, and sanitized again if its potential participants changed since then.
+    Returns None when no date has any participant.
+    """
+    while candidates_queue:
+        negative_count, date, potential_count, is_estimated, participants = heapq.heappop(candidates_queue)
+        potential_participants = get_potential_participants(date)
+        if not potential_participants:
             continue
-        tmp_dates = (_transfer_holiday_to_dates(attending_rule, start, until)
-                     or _transfer_custom_input_to_dates(attending_rule, start, until))
-        if ALL_DATES in tmp_dates:
-            return _get_all_dates(start, until)
-        for tmp_date in tmp_dates:
-            available_dates.add(tmp_date)
-    return list(available_dates)
-
-
-def _pick_next_date_to_participate(
-        dates_with_participants_preference: Dict[datetime.date, List[MeetingPreference]],
-        history_meetings_attendance: List[MeetingAttendance]) \
-        -> Tuple[datetime.date, List[MeetingPreference]]:
-    # Gets the date with most people want to attend.
-    date_with_most_participants: Optional[Tuple[datetime.date, List[MeetingPreference]]] = None
-    for date, preferences in dates_with_participants_preference.items():
-        if date_with_most_participants and len(preferences) <= len(date_with_most_participants[1]):
+        if len(potential_participants) != potential_count:
+            heapq.heappush(candidates_queue, (
+                -len(potential_participants), date, len(potential_participants), True, []))
             continue
-        current_potential_participants = preferences
-        while True:
-            sanitized_participants = _sanitize_with_minimal_meeting_value_preference(
-                current_potential_participants, history_meetings_attendance)
-            sanitized_participants_confirm = _sanitize_with_meeting_size_preference(sanitized_participants)
-            if len(sanitized_participants_confirm) == len(sanitized_participants):
-                break
-            current_potential_participants = sanitized_participants_confirm
-        date_with_most_participants = (date, sanitized_participants)
-    return date_with_most_participants
+        if is_estimated:
+            participants = _sanitize_with_meeting_preference(
+                potential_participants, history_meetings_attendance, rng=rng, now=now)
+            heapq.heappush(candidates_queue, (-len(participants), date, potential_count, False, participants))
+            continue
+        if not participants:
+            return None
+        return date, participants
+    return None
+
+
+def _sanitize_with_meeting_preference(
+        potential_participants: List[MeetingPreference],
+        history_meetings_attendance: List[MeetingAttendance],
+        rng: Optional[random.Random] = None, now: Optional[datetime.datetime] = None) -> List[MeetingPreference]:
+    """Removes participants until both minimal meeting value and size preference are met.
+
+    rng breaks the ties between conflicts, the random module if not given. now defaults to the current time.
+    """
+    increment_counter(COUNTER_VALUE_SANITIZATIONS)
+    with timed_phase(PHASE_SANITIZATION):
+        propagation = _MeetingPreferencePropagation(potential_participants)
+        propagation.propagate()
+        # Removing the participants in conflicts could results in a chain reaction, propagate it before next round.
+        while propagation.resolve_conflicts(history_meetings_attendance, rng=rng, now=now):
+            increment_counter(COUNTER_CONFLICT_ROUNDS)
+            propagation.propagate()
+        return propagation.get_remaining_participants()
 
 
 def _update_other_dates_after_picking_meeting_date(
-        picked_date, participants_preference_in_picked_date, date_to_potential_participants):
-    """Excludes people in the picked date from attending meeting dates in date_to_potential_participants."""
-    participants_code_to_unavailable_date_range = {}
+        picked_date, participants_preference_in_picked_date, date_to_potential_participants,
+        participant_code_to_dates: Dict[uuid.UUID, List[datetime.date]]) -> Set[datetime.date]:
+    """Excludes people in the picked date from attending meeting dates in date_to_potential_participants.
+
+    participant_code_to_dates has the sorted dates each participant could attend, so only the dates in their
+    unavailable date range are visited. Returns the updated dates.
+    """
+    updated_dates = set()
     for participant_preference in participants_preference_in_picked_date:
-        participants_code_to_unavailable_date_range[participant_preference.registered_attendant_code] = (
-            _get_unavailable_date_range(picked_date, participant_preference))
-
-    for date in date_to_potential_participants.keys():
-        updated_preferences = []
-        for meeting_preference in date_to_potential_participants[date]:
-            unavailable_date_range = participants_code_to_unavailable_date_range.get(
-                meeting_preference.registered_attendant_code)
-            if not unavailable_date_range:
-                updated_preferences.append(meeting_preference)
-            elif not unavailable_date_range[0] < date < unavailable_date_range[1]:
-                updated_preferences.append(meeting_preference)
-        date_to_potential_participants[date] = updated_preferences
-    _sanitize_empty_dates(date_to_potential_participants)
+        participant_code = participant_preference.registered_attendant_code
+        unavailable_start_date, unavailable_end_date = _get_unavailable_date_range(picked_date, participant_preference)
+        dates = participant_code_to_dates[participant_code]
+        # Dates strictly inside the unavailable date range.
+        start_index = bisect.bisect_right(dates, unavailable_start_date)
+        end_index = bisect.bisect_left(dates, unavailable_end_date)
+        for date in dates[start_index:end_index]:
+            if date not in date_to_potential_participants:
+                continue
+            date_to_potential_participants[date] = [
+                meeting_preference for meeting_preference in date_to_potential_participants[date]
+                if meeting_preference.registered_attendant_code != participant_code]
+            updated_dates.add(date)
+        del dates[start_index:end_index]
+    return updated_dates
 
 
 def _sanitize_with_meeting_size_preference(potential_participants: List[MeetingPreference]) -> List[MeetingPreference]:
+    increment_counter(COUNTER_SIZE_SANITIZATIONS)
     participant_codes_to_minimal_meeting_size = []
     for meeting_preference in potential_participants:
         participant_codes_to_minimal_meeting_size.append(
@@ -244,7 +339,8 @@ def _get_unavailable_date_range(
 
 
 def _get_meeting_value_data_for_preference(
-        participant, all_participants_preference) -> Tuple[bool, List[MeetingPreference]]:
+        participant, all_participants_preference,
+        rng: Optional[random.Random] = None) -> Tuple[bool, List[MeetingPreference]]:
     """Return (would this participant prefer to be removed, [ways to choose in order for participant to attend])"""
     total_meeting_value = 0
     negative_meeting_value = 0
@@ -254,7 +350,7 @@ def _get_meeting_value_data_for_preference(
     all_participants_preference_name_map = {preference.name: preference for preference in all_participants_preference}
 
     for other_participant in all_participants_preference:
-        value = participant.weighted_attendants.get(other_participant.name, 1)
+        value = participant.weighted_attendant_values.get(other_participant.name, 1)
         total_meeting_value += value
         # Include oneself as 1.
         if value < 1 and other_participant.name in all_participants_preference_name_map:
@@ -269,7 +365,7 @@ def _get_meeting_value_data_for_preference(
     # If all the ways to choose is listed, it will be factorial. Just find the way with minimal people involved.
     else:
         # Shuffle the list so the same negative value has a equal chance been selected.
-        random.shuffle(negative_value_entries)
+        (rng or random).shuffle(negative_value_entries)
         negative_value_entries.sort(key=lambda x: x[0])
         meeting_value = total_meeting_value
         for negative_entry in negative_value_entries:
@@ -280,58 +376,123 @@ def _get_meeting_value_data_for_preference(
     return must_be_removed, constrained_participants_pool
 
 
-def _sanitize_with_minimal_meeting_value_preference(
-        potential_participants: List[MeetingPreference],
-        history_meeting_attendance: List[MeetingAttendance]):
-    """Updates potential_participants with no negative meeting value requirement."""
-    current_potential_participants = potential_participants
-    # Because removing participants could results in a chain reaction. Need to run this two times to confirm.
-    # (not efficient though)
-    while True:
-        sanitized_potential_participants = _sanitize_with_minimal_meeting_value_preference_one_time(
-            current_potential_participants, history_meeting_attendance)
-        sanitized_potential_participants_confirm = _sanitize_with_minimal_meeting_value_preference_one_time(
-            sanitized_potential_participants, history_meeting_attendance)
-        if len(sanitized_potential_participants) == len(sanitized_potential_participants_confirm):
-            return sanitized_potential_participants
-        current_potential_participants = sanitized_potential_participants_confirm
-
-
-def _sanitize_with_minimal_meeting_value_preference_one_time(
-        potential_participants: List[MeetingPreference],
-        history_meeting_attendance: List[MeetingAttendance]) -> List[MeetingPreference]:
-    """Updates potential_participants with no negative meeting value requirement."""
-    conflict_constrain = []
-    conflict_participant_codes = set()
-    unresolvable_participant_codes = set()
-    for participant in potential_participants:
-        must_be_removed, tmp_conflict_constrain = (
-            _get_meeting_value_data_for_preference(participant, potential_participants))
-        if must_be_removed:
-            unresolvable_participant_codes.add(participant.registered_attendant_code)
-            continue
-        elif not tmp_conflict_constrain:
-            continue
-        else:  # resolvable conflict
-            conflict_constrain.append((participant, tmp_conflict_constrain))
+class _MeetingPreferencePropagation:
+    """Removes participants who would not join the meeting until no more removal is needed.
+
+    The meeting value of a participant is the participants count (others count 1 by default) adjusted by the
+    participants listed in its weighted attendants, so it's kept as counters over the listed participants.
+    Removing someone only updates the counters of the participants listing them, and the thresholds the shared
+    participants count is compared with are kept in heaps.
+    """
+
+    def __init__(self, potential_participants: List[MeetingPreference]):
+        self.participants = potential_participants
+        participant_count = len(potential_participants)
+        self.remaining = [True] * participant_count
+        self.remaining_count = participant_count
+        # [[(index of the participant listing it, weighted value)]]
+        self.listed_by: List[List[Tuple[int, float]]] = [[] for _ in range(participant_count)]
+        # Counters of the remaining participants listed in each participant's weighted attendants.
+        self.listed_count = [0] * participant_count
+        self.listed_value = [0] * participant_count
+        # Part of listed_value from values smaller than 1.
+        self.negative_value = [0] * participant_count
+
+        name_to_indices = collections.defaultdict(list)
+        for index, participant in enumerate(potential_participants):
+            name_to_indices[participant.name].append(index)
+        for index, participant in enumerate(potential_participants):
+            for name, value in participant.weighted_attendant_values.items():
+                for listed_index in name_to_indices.get(name, []):
+                    self.listed_by[listed_index].append((index, value))
+                    self._update_listed_counters(index, value, 1)
+
+        # Max heap of (-participants count below which the participant must be removed, index).
+        self.removal_heap = [(-self._get_removal_threshold(index), index) for index in range(participant_count)]
+        heapq.heapify(self.removal_heap)
+        self.indices_by_meeting_size = sorted(
+            range(participant_count), key=lambda i: potential_participants[i].minimal_meeting_size, reverse=True)
+        self.meeting_size_position = 0
+
+    def _update_listed_counters(self, index: int, value: float, sign: int):
+        self.listed_count[index] += sign
+        self.listed_value[index] += sign * value
+        if value < 1:
+            self.negative_value[index] += sign * value
+
+    def _get_conflict_threshold(self, index: int):
+        """The participant's meeting value is not met if remaining_count is smaller than this."""
+        return (self.participants[index].minimal_meeting_value
+                + self.listed_count[index] - self.listed_value[index])
+
+    def _get_removal_threshold(self, index: int):
+        """Same as above, but the meeting value is not met even if all the negative entries are removed."""
+        return min(self._get_conflict_threshold(index),
+                   self._get_conflict_threshold(index) + self.negative_value[index])
+
+    def _remove(self, index: int):
+        self.remaining[index] = False
+        self.remaining_count -= 1
+        for listing_index, value in self.listed_by[index]:
+            if self.remaining[listing_index]:
+                self._update_listed_counters(listing_index, value, -1)
+                heapq.heappush(self.removal_heap, (-self._get_removal_threshold(listing_index), listing_index))
+
+    def _pop_participant_to_remove(self) -> Optional[int]:
+        while self.removal_heap and -self.removal_heap[0][0] > self.remaining_count:
+            threshold, index = heapq.heappop(self.removal_heap)
+            # Skip the outdated entries, the current one is pushed when the counters are updated.
+            if self.remaining[index] and -threshold == self._get_removal_threshold(index):
+                return index
+        while self.meeting_size_position < len(self.indices_by_meeting_size):
+            index = self.indices_by_meeting_size[self.meeting_size_position]
+            if not self.remaining[index]:
+                self.meeting_size_position += 1
+                continue
+            if self.participants[index].minimal_meeting_size > self.remaining_count:
+                return index
+            break
+        return None
+
+    def propagate(self):
+        """Removes the participants whose preference can't be met even after resolving conflicts."""
+        index = self._pop_participant_to_remove()
+        while index is not None:
+            self._remove(index)
+            index = self._pop_participant_to_remove()
+
+    def get_remaining_participants(self) -> List[MeetingPreference]:
+        return [participant for index, participant in enumerate(self.participants) if self.remaining[index]]
+
+    def resolve_conflicts(self, history_meeting_attendance: List[MeetingAttendance],
+                          rng: Optional[random.Random] = None, now: Optional[datetime.datetime] = None) -> bool:
+        """Resolves the conflicts of the participants whose meeting value is not met, returns if anyone is removed."""
+        remaining_participants = self.get_remaining_participants()
+        conflict_constrain = []
+        for index, participant in enumerate(self.participants):
+            if not self.remaining[index] or self.remaining_count >= self._get_conflict_threshold(index):
+                continue
+            must_be_removed, constrained_participants_pool = (
+                _get_meeting_value_data_for_preference(participant, remaining_participants, rng=rng))
+            if not must_be_removed and constrained_participants_pool:
+                conflict_constrain.append((participant, constrained_participants_pool))
+        if not conflict_constrain:
+            return False
+
+        # Branch and bound search, still O(2^N) in the worst case, N is number of people in conflicts.
+        resolved_participant_codes = _get_participants_and_resolve_conflict(
+            conflict_constrain, history_meeting_attendance, now=now)
+        conflict_participant_codes = set()
+        for participant, constrained_participants_pool in conflict_constrain:
             conflict_participant_codes.add(participant.registered_attendant_code)
-            conflict_participant_codes.update([p.registered_attendant_code for p in tmp_conflict_constrain])
-
-    # Handle conflict_constrain. Search through all combination O(N*2^N), N is number of people.
-    resolved_participant_codes = _get_participants_and_resolve_conflict(
-        conflict_constrain, history_meeting_attendance)
-
-    sanitized_potential_participants = []
-    for participant in potential_participants:
-        attendance_code = participant.registered_attendant_code
-        if attendance_code in unresolvable_participant_codes:
-            continue
-        if (attendance_code in conflict_participant_codes
-                and participant.registered_attendant_code not in resolved_participant_codes):
-            continue
-        sanitized_potential_participants.append(participant)
-
-    return sanitized_potential_participants
+            conflict_participant_codes.update(p.registered_attendant_code for p in constrained_participants_pool)
+        removed_any = False
+        for index, participant in enumerate(self.participants):
+            if (self.remaining[index] and participant.registered_attendant_code in conflict_participant_codes
+                    and participant.registered_attendant_code not in resolved_participant_codes):
+                self._remove(index)
+                removed_any = True
+        return removed_any
 
 
 # This is an approximation of meeting value. The meeting records should be used for better estimation.
@@ -346,153 +507,226 @@ def get_utc_now():
 
 def _get_participants_and_resolve_conflict(
         conflict_constrain: List[Tuple[MeetingPreference, List[MeetingPreference]]],
-        history_meeting_attendance: List[MeetingAttendance]) -> Set[str]:
-    conflict_edges: Dict[str, Set[str]] = collections.defaultdict(set)
-    participants_value: Dict[str, int] = collections.defaultdict(int)
-    utc_now = get_utc_now()
-    # Shorten UUID to index, {UUID: str(index)}.
-    uuid_to_shorten_codes_dict = {}
+        history_meeting_attendance: List[MeetingAttendance],
+        now: Optional[datetime.datetime] = None) -> Set[str]:
+    """Returns codes of the participants in the conflict free set with max meeting value at now."""
+    # Participant code to index in conflict graph.
+    code_to_index: Dict[str, int] = {}
+    # Bitmap of conflicted participants for each index.
+    conflict_edges: List[int] = []
 
     # Construct the conflict as edges in both direction.
     for conflict in conflict_constrain:
-        conflict_starter_code = conflict[0].registered_attendant_code
-        if conflict_starter_code not in uuid_to_shorten_codes_dict:
-            uuid_to_shorten_codes_dict[conflict_starter_code] = str(len(uuid_to_shorten_codes_dict))
+        for participant in [conflict[0]] + conflict[1]:
+            if participant.registered_attendant_code not in code_to_index:
+                code_to_index[participant.registered_attendant_code] = len(code_to_index)
+                conflict_edges.append(0)
+        conflict_starter_index = code_to_index[conflict[0].registered_attendant_code]
         for conflict_receiver in conflict[1]:
-            conflict_receiver_code = conflict_receiver.registered_attendant_code
-            if conflict_receiver_code not in uuid_to_shorten_codes_dict:
-                uuid_to_shorten_codes_dict[conflict_receiver_code] = str(len(uuid_to_shorten_codes_dict))
-            conflict_edges[uuid_to_shorten_codes_dict[conflict_starter_code]].add(uuid_to_shorten_codes_dict[conflict_receiver_code])
-            conflict_edges[uuid_to_shorten_codes_dict[conflict_receiver_code]].add(uuid_to_shorten_codes_dict[conflict_starter_code])
+            conflict_receiver_index = code_to_index[conflict_receiver.registered_attendant_code]
+            conflict_edges[conflict_starter_index] |= 1 << conflict_receiver_index
+            conflict_edges[conflict_receiver_index] |= 1 << conflict_starter_index
+    if not code_to_index:
+        return set()
+
+    participants_value = [MAX_PARTICIPATE_VALUE] * len(code_to_index)
+    utc_now = now or get_utc_now()
     for attendance in history_meeting_attendance:
-        if attendance.attendant_preference.registered_attendant_code not in uuid_to_shorten_codes_dict:
-            continue
-        participants_value[uuid_to_shorten_codes_dict[attendance.attendant_preference.registered_attendant_code]] = (
-            _get_participant_meeting_value(attendance, utc_now))
-
-    # {ordered unchecked participants: (cached optimal value, [actual participants])} e.g. {'5,6,7,9': (321, [5, 7, 9])}
-    optimal_meeting_value_with_participants_cache: Dict[str, Tuple[int, List[str]]] = {}
-    shorten_codes_to_uuid_dict = {val: key for key, val in uuid_to_shorten_codes_dict.items()}
-
-    # 2^N = sum(C(i, N)) for 0<=i<=N.
-    # Memory usage C(max_cache_key_depth, N).
-    optimal_value, participants_index = _get_optimal_meeting_value_with_participants(
-        [str(i) for i in range(len(uuid_to_shorten_codes_dict))],
-        conflict_edges, participants_value,
-        optimal_meeting_value_with_participants_cache,
-        max_cache_key_depth=7)
-
-    # Decode index to UUID.
-    return set([shorten_codes_to_uuid_dict[index] for index in participants_index])
-
-
-def _get_optimal_meeting_value_with_participants(
-        participants_to_be_check: List[str],
-        conflict_edges: Dict[str, Set[str]],
-        participants_value: Dict[str, int],
-        optimal_meeting_value_with_participants_cache: Dict[str, Tuple[int, List[str]]],
-        max_cache_key_depth: int):
-    if not participants_to_be_check:
-        return 0, []
-    if len(participants_to_be_check) == 1:
-        return participants_value.get(participants_to_be_check[0], MAX_PARTICIPATE_VALUE), [participants_to_be_check[0]]
-    cache_key = ''
-    if len(participants_to_be_check) <= max_cache_key_depth:
-        cache_key = ','.join(participants_to_be_check)
-        if cache_key in optimal_meeting_value_with_participants_cache:
-            value, participants = optimal_meeting_value_with_participants_cache[cache_key]
-            return value, participants.copy()
-
-    # If we don't choose the first participants in list.
-    optimal_value_if_skip, participants_if_skip = _get_optimal_meeting_value_with_participants(
-        [p for p in participants_to_be_check[1:]], conflict_edges, participants_value,
-        optimal_meeting_value_with_participants_cache,
-        max_cache_key_depth)
-    # If we choose the first participants in list.
-    choose_participant = participants_to_be_check[0]
-    conflict_edges_for_chosen = conflict_edges.get(choose_participant)
-    optimal_value_if_choose, participants_if_choose = _get_optimal_meeting_value_with_participants(
-        [p for p in participants_to_be_check[1:] if p not in conflict_edges_for_chosen],
-        conflict_edges,
-        participants_value,
-        optimal_meeting_value_with_participants_cache,
-        max_cache_key_depth)
-    optimal_value_if_choose += participants_value.get(choose_participant, MAX_PARTICIPATE_VALUE)
-    participants_if_choose.append(choose_participant)
-
-    if optimal_value_if_skip > optimal_value_if_choose:
-        optimal_value = optimal_value_if_skip
-        optimal_participants = participants_if_skip
-    elif optimal_value_if_skip < optimal_value_if_choose:
-        optimal_value = optimal_value_if_choose
-        optimal_participants = participants_if_choose
-    # Pick the meeting with max people, if everything else is the same.
-    elif len(participants_if_choose) > len(participants_if_skip):
-        optimal_value = optimal_value_if_choose
-        optimal_participants = participants_if_choose
-    else:
-        optimal_value = optimal_value_if_skip
-        optimal_participants = participants_if_skip
-    if len(participants_to_be_check) <= max_cache_key_depth:
-        optimal_meeting_value_with_participants_cache[cache_key] = (optimal_value, optimal_participants.copy())
+        index = code_to_index.get(attendance.attendant_preference.registered_attendant_code)
+        if index is not None:
+            participants_value[index] = _get_participant_meeting_value(attendance, utc_now)
+
+    # Same as searching through all combinations, prefer more participants on equal value.
+    with timed_phase(PHASE_CONFLICT_SOLVER):
+        solution = solve_conflict_graph(
+            get_tie_broken_weights(participants_value), conflict_edges,
+            max_workers=getattr(settings, 'REUNION_CONFLICT_SOLVER_MAX_WORKERS', 1))
+    increment_counter(COUNTER_CONFLICT_SOLVER_RUNS)
+    increment_counter(COUNTER_CONFLICT_SOLVER_NODES, solution.expanded_nodes)
+    index_to_code = list(code_to_index.keys())
+    return set([index_to_code[index] for index in get_bitmap_indices(solution.participants_bitmap)])
+
+
+def _pick_meeting_dates_with_date_lists(
+        preferences: List[MeetingPreference],
+        available_dates_bitmaps: List[int],
+        history_meetings_attendance: List[MeetingAttendance],
+        start: datetime.date,
+        rng: Optional[random.Random] = None,
+        now: Optional[datetime.datetime] = None) -> List[Tuple[datetime.date, List[MeetingPreference]]]:
+    date_to_potential_participants = collections.defaultdict(list)
+    for meeting_preference, available_dates_bitmap in zip(preferences, available_dates_bitmaps):
+        for available_date in _get_bitmap_dates(available_dates_bitmap, start):
+            date_to_potential_participants[available_date].append(meeting_preference)
+    # Earlier dates are considered first when the number of participants is the same.
+    date_to_potential_participants = dict(sorted(date_to_potential_participants.items()))
 
-    return optimal_value, optimal_participants
+    # Consider minimal meeting size preference.
+    _sanitize_dates_with_meeting_size_preference(date_to_potential_participants)
+    participant_code_to_dates = collections.defaultdict(list)
+    for date, participants in date_to_potential_participants.items():
+        for meeting_preference in participants:
+            participant_code_to_dates[meeting_preference.registered_attendant_code].append(date)
 
+    # Use greedy algorithm to arrange meetings. With the date most people can participate being considered first.
+    candidates_queue = [(-len(participants), date, len(participants), True, [])
+                        for date, participants in date_to_potential_participants.items()]
+    heapq.heapify(candidates_queue)
+    picked_dates_with_participants_preference: List[Tuple[datetime.date, List[MeetingPreference]]] = []
+    while True:
+        next_meeting = _pop_next_date_to_participate(
+            candidates_queue, lambda date: date_to_potential_participants.get(date, []), history_meetings_attendance,
+            rng=rng, now=now)
+        if not next_meeting:
+            break
+        next_meeting_date, participants_preference = next_meeting
+        date_to_potential_participants.pop(next_meeting_date)
+        picked_dates_with_participants_preference.append((next_meeting_date, participants_preference))
+        updated_dates = _update_other_dates_after_picking_meeting_date(
+            next_meeting_date, participants_preference, date_to_potential_participants, participant_code_to_dates)
+        for date in updated_dates:
+            participants = _sanitize_with_meeting_size_preference(date_to_potential_participants[date])
+            if participants:
+                date_to_potential_participants[date] = participants
+            else:
+                date_to_potential_participants.pop(date)
 
-def get_weighted_attendants_as_dictionary(weighted_attendants: str):
-    """Parses the weighted_attendants string to dictionary, e.g. assa:-1,lala:-10,haha:20"""
-    weighted_attendants_dict = {}
-    for weighted_attendant_str in weighted_attendants.split(','):
-        try:
-            split_value = weighted_attendant_str.split(':')
-            if len(split_value) != 2:
-                continue
-            weighted_attendants_dict[split_value[0]] = float(split_value[1])
-        except:
-            continue
-    return weighted_attendants_dict
+    return picked_dates_with_participants_preference
+
+
+def _sanitize_column_with_meeting_size_preference(column: int, minimal_meeting_sizes: List[int]) -> int:
+    """Same as _sanitize_with_meeting_size_preference, on a bitmask of participant indices."""
+    participant_indices = get_bitmap_indices(column)
+    participant_indices.sort(key=lambda index: minimal_meeting_sizes[index], reverse=True)
+    current_meeting_size = len(participant_indices)
+    for index in participant_indices:
+        if minimal_meeting_sizes[index] > current_meeting_size:
+            current_meeting_size -= 1
+            column &= ~(1 << index)
+    return column
+
+
+def _pick_meeting_dates_with_matrix(
+        preferences: List[MeetingPreference],
+        available_dates_bitmaps: List[int],
+        history_meetings_attendance: List[MeetingAttendance],
+        start: datetime.date,
+        rng: Optional[random.Random] = None,
+        now: Optional[datetime.datetime] = None) -> List[Tuple[datetime.date, List[MeetingPreference]]]:
+    """Same greedy algorithm as _pick_meeting_dates_with_date_lists, on a participants x days matrix.
+
+    Each day is a column stored as a bitmask of participant indices, so the number of potential participants
+    of a day is the column sum, and excluding a participant from the dates around a picked meeting is a slice
+    assignment over the columns in that range. Only those columns need the meeting size sanitization again."""
+    day_count = max([bitmap.bit_length() for bitmap in available_dates_bitmaps], default=0)
+    columns = [0] * day_count
+    for index, available_dates_bitmap in enumerate(available_dates_bitmaps):
+        for day in get_bitmap_indices(available_dates_bitmap):
+            columns[day] |= 1 << index
+    participant_code_to_index = {
+        preference.registered_attendant_code: index for index, preference in enumerate(preferences)}
+    minimal_meeting_sizes = [preference.minimal_meeting_size for preference in preferences]
+
+    # Consider minimal meeting size preference.
+    columns = [_sanitize_column_with_meeting_size_preference(column, minimal_meeting_sizes) for column in columns]
+
+    def get_potential_participants(day: int) -> List[MeetingPreference]:
+        return [preferences[index] for index in get_bitmap_indices(columns[day])]
+
+    # Column sums, i.e. number of potential participants of each day.
+    candidates_queue = []
+    for day, column in enumerate(columns):
+        count = bin(column).count('1')
+        if count:
+            candidates_queue.append((-count, day, count, True, []))
+    heapq.heapify(candidates_queue)
+    picked_dates_with_participants_preference: List[Tuple[datetime.date, List[MeetingPreference]]] = []
+    while True:
+        next_meeting = _pop_next_date_to_participate(
+            candidates_queue, get_potential_participants, history_meetings_attendance, rng=rng, now=now)
+        if not next_meeting:
+            break
+        next_meeting_day, participants_preference = next_meeting
+        next_meeting_date = start + datetime.timedelta(days=next_meeting_day)
+        columns[next_meeting_day] = 0
+        picked_dates_with_participants_preference.append((next_meeting_date, participants_preference))
+
+        # Exclude participants from the dates strictly inside their unavailable date range.
+        updated_days_start, updated_days_end = next_meeting_day, next_meeting_day
+        for participant_preference in participants_preference:
+            unavailable_start_date, unavailable_end_date = _get_unavailable_date_range(
+                next_meeting_date, participant_preference)
+            days_start = max((unavailable_start_date - start).days + 1, 0)
+            days_end = min((unavailable_end_date - start).days, day_count)
+            participant_mask = ~(1 << participant_code_to_index[participant_preference.registered_attendant_code])
+            columns[days_start:days_end] = [column & participant_mask for column in columns[days_start:days_end]]
+            updated_days_start = min(updated_days_start, days_start)
+            updated_days_end = max(updated_days_end, days_end)
+        columns[updated_days_start:updated_days_end] = [
+            _sanitize_column_with_meeting_size_preference(column, minimal_meeting_sizes)
+            for column in columns[updated_days_start:updated_days_end]]
+
+    return picked_dates_with_participants_preference
+
+
+SCHEDULER_ENGINES = {
+    SCHEDULER_ENGINE_DATE_LISTS: _pick_meeting_dates_with_date_lists,
+    SCHEDULER_ENGINE_MATRIX: _pick_meeting_dates_with_matrix,
+}
+
+
+def _load_verified_meeting_attendance(meeting: Meeting) -> List[MeetingAttendance]:
+    """Loads the attendance of the verified participants of the meeting with their preference in one query."""
+    return list(MeetingAttendance.objects.filter(
+        attendant_preference__meeting=meeting,
+        attendant_preference__email_verification_code=VERIFIED_EMAIL_STATUS,
+    ).select_related('attendant_preference').order_by('pk'))
 
 
 def get_feasible_meeting_dates_with_participants(
-        meeting: Meeting, start: datetime.date, until: datetime.date) \
+        meeting: Meeting, start: datetime.date, until: datetime.date,
+        engine: str = SCHEDULER_ENGINE_DATE_LISTS,
+        rng: Optional[random.Random] = None,
+        now: Optional[datetime.datetime] = None) \
         -> List[Tuple[datetime.date, List[MeetingPreference]]]:
-    meeting_preferences = MeetingPreference.objects.filter(meeting=meeting.meeting_code)
-    date_to_potential_participants = collections.defaultdict(list)
-    # Iterate through all preference to filter out recently participated ones.
-    history_meetings_attendance = []
-    for meeting_preference in meeting_preferences:
-        if meeting_preference.email_verification_code != VERIFIED_EMAIL_STATUS:
-            continue
-        # Sanitize the weighted attendants to dictionary.
-        meeting_preference.weighted_attendants = (
-            get_weighted_attendants_as_dictionary(meeting_preference.weighted_attendants))
-        attendance = MeetingAttendance.objects.get(
-            attendant_preference=meeting_preference.registered_attendant_code)
-        history_meetings_attendance.append(attendance)
-        available_dates = get_available_dates(meeting_preference, start=start, until=until)
-        # Also consider the notification sent but haven't received a reply: latest_invitation_time.
-        _, earliest_acceptable_date = _get_unavailable_date_range(
-            max(attendance.latest_confirmation_time, attendance.latest_invitation_time),
-                meeting_preference)
-        for available_date in available_dates:
-            if earliest_acceptable_date <= available_date:
-                date_to_potential_participants[available_date].append(meeting_preference)
+    with timed_phase(PHASE_LOAD_ATTENDANCE):
+        history_meetings_attendance = _load_verified_meeting_attendance(meeting)
+    return pick_meeting_dates_for_attendance(history_meetings_attendance, start, until, engine, rng=rng, now=now)
 
-    # Consider minimal meeting size preference.
-    _sanitize_dates_with_meeting_size_preference(date_to_potential_participants)
 
-    # Use greedy algorithm to arrange meetings. With the date most people can participate being considered first.
-    picked_dates_with_participants_preference: List[Tuple[datetime.date, List[MeetingPreference]]] = []
-    while date_to_potential_participants:
-        next_meeting_date, participants_preference = (
-            _pick_next_date_to_participate(date_to_potential_participants, history_meetings_attendance))
-        date_to_potential_participants.pop(next_meeting_date)
-        if participants_preference:
-            picked_dates_with_participants_preference.append((next_meeting_date, participants_preference))
-        _update_other_dates_after_picking_meeting_date(
-            next_meeting_date, participants_preference, date_to_potential_participants)
-        _sanitize_dates_with_meeting_size_preference(date_to_potential_participants)
+def pick_meeting_dates_for_attendance(
+        history_meetings_attendance: List[MeetingAttendance], start: datetime.date, until: datetime.date,
+        engine: str = SCHEDULER_ENGINE_DATE_LISTS,
+        rng: Optional[random.Random] = None,
+        now: Optional[datetime.datetime] = None) \
+        -> List[Tuple[datetime.date, List[MeetingPreference]]]:
+    """Picks the meeting dates of the attendants, who don't need to be saved, e.g. in a replayed scenario.
 
+    A seeded rng and a fixed now make the picked dates reproducible.
+    """
+    # Iterate through all preference to filter out recently participated ones.
+    preferences = []
+    available_dates_bitmaps = []
+    with timed_phase(PHASE_RULE_EXPANSION):
+        for attendance in history_meetings_attendance:
+            meeting_preference = attendance.attendant_preference
+            # Preferences saved before the inputs are parsed on save.
+            if meeting_preference.weighted_attendant_values is None:
+                meeting_preference.parse_attending_preference()
+            available_dates_bitmap = get_available_dates_bitmap(meeting_preference, start=start, until=until)
+            # Also consider the notification sent but haven't received a reply: latest_invitation_time.
+            _, earliest_acceptable_date = _get_unavailable_date_range(
+                max(attendance.latest_confirmation_time, attendance.latest_invitation_time),
+                    meeting_preference)
+            if earliest_acceptable_date > start:
+                available_dates_bitmap &= ~((1 << (earliest_acceptable_date - start).days) - 1)
+            preferences.append(meeting_preference)
+            available_dates_bitmaps.append(available_dates_bitmap)
+
+    with timed_phase(PHASE_PICK_DATES):
+        picked_dates_with_participants_preference = SCHEDULER_ENGINES[engine](
+            preferences, available_dates_bitmaps, history_meetings_attendance, start, rng=rng, now=now)
+    increment_counter(COUNTER_PICKED_DATES, len(picked_dates_with_participants_preference))
     return picked_dates_with_participants_preference
 
 
@@ -507,56 +741,160 @@ def arrange_new_meeting(host_meeting: Meeting,
     record.meeting_end_time = datetime.datetime.combine(
         meeting_date, datetime.datetime.min.time(), datetime.timezone.utc) + datetime.timedelta(days=1)
     # TODO: offline meeting location to be implemented
-    record.online_meeting_link = create_meeting_link(
-        host_meeting.display_name, record.meeting_start_time, record.meeting_end_time)
-    invitation_code_to_attendant_code = (
-        {str(uuid.uuid4()): str(p.registered_attendant_code) for p in participants_preference})
-    attendant_code_to_invitation_code = (
-        {a: i for i, a in invitation_code_to_attendant_code.items()})
-    record.invitation_code_to_attendant_code = json.dumps(invitation_code_to_attendant_code)
-    record.attendant_code_to_status = json.dumps(
-        {str(p.registered_attendant_code): ATTENDANT_PENDING_STATUS for p in participants_preference})
-    record.save()
-    # TODO: update last invitation time?
-    for participant_preference in participants_preference:
-        send_scheduled_meeting_notification(
-            record, attendant_code_to_invitation_code.get(str(participant_preference.registered_attendant_code)),
-            participant_preference, participants_preference)
-
-
-# TODO: run in background thread & add test.
-def schedule_meetings(meeting: Meeting):
-    utcnow = get_utc_now()
-    schedule_start_date = (utcnow + SCHEDULE_MEETINGS_START_FROM_NOW).date()
-    schedule_until_date = (utcnow + datetime.timedelta(days=365) + SCHEDULE_MEETINGS_START_FROM_NOW).date()
-    notification_until_date = (utcnow + NOTIFY_MEETINGS_UNTIL_FROM_NOW).date()
-    dates_with_participants_preference = get_feasible_meeting_dates_with_participants(
-        meeting,
-        start=schedule_start_date,
-        until=schedule_until_date)
-    for date, participants_preference in dates_with_participants_preference:
-        # Send notification only when at least two months are available and
-        # don't send notification if it is more than three months.
-        if schedule_start_date <= date <= notification_until_date:
-            arrange_new_meeting(meeting, date, participants_preference)
+    # The online meeting link is created once someone confirms, most invitations are never accepted.
+    invitations = [Invitation(record=record, attendant=participant_preference)
+                   for participant_preference in participants_preference]
+    with transaction.atomic():
+        record.save()
+        Invitation.objects.bulk_create(invitations)
+        # Invited participants are not considered for other meetings around this one until they reply.
+        MeetingAttendance.objects.filter(
+            attendant_preference__in=participants_preference,
+            latest_invitation_time__lt=record.meeting_start_time).update(
+            latest_invitation_time=record.meeting_start_time)
+        mark_meeting_inputs_changed(host_meeting.meeting_code)
+        send_scheduled_meeting_notifications(record, invitations, participants_preference)
+
+
+def ensure_online_meeting_link(record: MeetingRecord) -> str:
+    """Creates the online meeting link of the record if it has none yet, returns '' if it can't be created now.
+
+    The provider is called outside of any transaction, since it can take long and would block the other writers.
+    Concurrent confirmations get the same meeting from the provider by the record id, the first one stores it.
+    """
+    if record.online_meeting_link:
+        return record.online_meeting_link
+    link = get_online_meeting_provider().create_meeting_link(
+        record.meeting.display_name, record.meeting_start_time, record.meeting_end_time, str(record.record_id))
+    if not link:
+        return ''
+    if not MeetingRecord.objects.filter(pk=record.pk, online_meeting_link='').update(online_meeting_link=link):
+        link = MeetingRecord.objects.values_list('online_meeting_link', flat=True).get(pk=record.pk)
+    record.online_meeting_link = link
+    return link
+
+
+def get_scheduler_rng() -> Optional[random.Random]:
+    """A random generator seeded by REUNION_SCHEDULER_SEED setting for reproducible plans, None if not set."""
+    seed = getattr(settings, 'REUNION_SCHEDULER_SEED', None)
+    return None if seed is None else random.Random(seed)
+
+
+def _load_scheduled_plan(meeting: Meeting, start: datetime.date, until: datetime.date) \
+        -> Optional[List[Tuple[datetime.date, List[MeetingPreference]]]]:
+    """Returns the cached plan of the meeting between start and until, None if it can't be reused.
+
+    The dates between the end of the cached plan and until are left out, they are less than
+    MAX_SCHEDULED_PLAN_AGE at the far end of the schedule and are considered when the plan is computed again.
+    """
+    plan = meeting.scheduled_plan
+    if (plan is None or meeting.scheduled_input_version != meeting.input_version
+            or get_utc_now() - meeting.scheduled_plan_time >= MAX_SCHEDULED_PLAN_AGE
+            or start < datetime.date.fromisoformat(plan['start'])
+            or until - datetime.date.fromisoformat(plan['until']) >= MAX_SCHEDULED_PLAN_AGE):
+        return None
+    code_to_preference = {str(code): preference for code, preference in MeetingPreference.objects.in_bulk(
+        [code for entry in plan['dates'] for code in entry['participants']]).items()}
+    dates_with_participants_preference = []
+    for entry in plan['dates']:
+        date = datetime.date.fromisoformat(entry['date'])
+        if not start <= date <= until:
+            continue
+        if not all(code in code_to_preference for code in entry['participants']):
+            return None
+        dates_with_participants_preference.append(
+            (date, [code_to_preference[code] for code in entry['participants']]))
+    return dates_with_participants_preference
+
 
+def get_scheduled_plan(meeting: Meeting, start: datetime.date, until: datetime.date) \
+        -> List[Tuple[datetime.date, List[MeetingPreference]]]:
+    """Reuses the plan of the meeting if its inputs didn't change since, otherwise computes and caches it.
+
+    The plan is computed again once it's older than MAX_SCHEDULED_PLAN_AGE, since the scheduled dates move with time.
+    """
+    dates_with_participants_preference = _load_scheduled_plan(meeting, start, until)
+    if dates_with_participants_preference is not None:
+        increment_counter(COUNTER_SCHEDULED_PLAN_CACHE_HITS)
+        return dates_with_participants_preference
 
-# TODO: run in background thread & add test.
+    # Read before loading the inputs, so a change during the computation invalidates the plan.
+    input_version = meeting.input_version
+    dates_with_participants_preference = get_feasible_meeting_dates_with_participants(
+        meeting, start, until, rng=get_scheduler_rng())
+    Meeting.objects.filter(pk=meeting.pk).update(
+        scheduled_input_version=input_version,
+        scheduled_plan={
+            'start': start.isoformat(),
+            'until': until.isoformat(),
+            'dates': [{'date': date.isoformat(),
+                       'participants': [str(p.registered_attendant_code) for p in participants_preference]}
+                      for date, participants_preference in dates_with_participants_preference]},
+        scheduled_plan_time=get_utc_now())
+    return dates_with_participants_preference
+
+
+def _log_scheduling_stats(stats: SchedulingStats):
+    logger.info('Scheduled meeting %s in %.3f seconds.', stats.meeting_code, stats.total_seconds,
+                extra={'scheduling_stats': stats.as_dict()})
+
+
+def _get_scheduling_stats_hook() -> Callable[[SchedulingStats], None]:
+    """Logs the stats, and calls the function at dotted path REUNION_SCHEDULING_STATS_HOOK setting if set."""
+    hook_path = getattr(settings, 'REUNION_SCHEDULING_STATS_HOOK', None)
+    if not hook_path:
+        return _log_scheduling_stats
+    hook = import_string(hook_path)
+
+    def log_and_call_hook(stats: SchedulingStats):
+        _log_scheduling_stats(stats)
+        hook(stats)
+    return log_and_call_hook
+
+
+# Run periodically by the run_scheduler command.
+def schedule_meetings(meeting: Meeting):
+    with collect_scheduling_stats(meeting.meeting_code, hook=_get_scheduling_stats_hook()):
+        utcnow = get_utc_now()
+        schedule_start_date = (utcnow + SCHEDULE_MEETINGS_START_FROM_NOW).date()
+        schedule_until_date = (utcnow + datetime.timedelta(days=365) + SCHEDULE_MEETINGS_START_FROM_NOW).date()
+        notification_until_date = (utcnow + NOTIFY_MEETINGS_UNTIL_FROM_NOW).date()
+        dates_with_participants_preference = get_scheduled_plan(
+            meeting,
+            start=schedule_start_date,
+            until=schedule_until_date)
+        with timed_phase(PHASE_ARRANGE_MEETINGS):
+            for date, participants_preference in dates_with_participants_preference:
+                # Send notification only when at least two months are available and
+                # don't send notification if it is more than three months.
+                if schedule_start_date <= date <= notification_until_date:
+                    increment_counter(COUNTER_MEETINGS_ARRANGED)
+                    arrange_new_meeting(meeting, date, participants_preference)
+
+
+# Run periodically by the run_scheduler command.
 def send_final_meeting_notification():
     utcnow = get_utc_now()
     final_meeting_start_date = (utcnow + datetime.timedelta(days=14)).date()
     final_meeting_end_date = (utcnow + datetime.timedelta(days=23)).date()
-    pending_meeting_records = MeetingRecord.objects.filter(meeting_status=MEETING_RECORD_STATUS_INITIALIZED)
+    pending_meeting_records = list(MeetingRecord.objects.filter(
+        meeting_status=MEETING_RECORD_STATUS_INITIALIZED,
+        meeting_start_time__gt=datetime.datetime.combine(
+            final_meeting_start_date, datetime.datetime.min.time(), datetime.timezone.utc),
+        meeting_start_time__lt=datetime.datetime.combine(
+            final_meeting_end_date, datetime.datetime.min.time(), datetime.timezone.utc),
+    ).select_related('meeting'))
+    record_id_to_participants = collections.defaultdict(list)
+    for invitation in Invitation.objects.filter(
+            record__in=pending_meeting_records, status=ATTENDANT_CONFIRM_STATUS).select_related('attendant'):
+        record_id_to_participants[invitation.record_id].append(invitation.attendant)
+    finalized_record_ids = []
     for record in pending_meeting_records:
-        all_participants = []
-        if final_meeting_start_date < record.meeting_start_time < final_meeting_end_date:
-            attendant_code_to_status = json.loads(record.attendant_code_to_status)
-            for attendant_code, status in attendant_code_to_status.items():
-                if status == ATTENDANT_CONFIRM_STATUS:
-                    preference = MeetingPreference.objects.filter(registered_attendant_code=attendant_code)
-                    if preference:
-                        all_participants.append(preference)
-            for participant in all_participants:
-                send_final_meeting_reminder_emails(participant, all_participants, record)
-            record.meeting_status = MEETING_RECORD_STATUS_FINALIZED
-            record.save()
+        all_participants = record_id_to_participants[record.record_id]
+        # Retried in the next round if the link can't be created now.
+        if all_participants and not ensure_online_meeting_link(record):
+            continue
+        send_final_meeting_reminder_emails(all_participants, record)
+        finalized_record_ids.append(record.record_id)
+    MeetingRecord.objects.filter(record_id__in=finalized_record_ids).update(
+        meeting_status=MEETING_RECORD_STATUS_FINALIZED)
@@ -0,0 +1,167 @@
+"""Synthetic workloads and timings of the scheduling pipeline stages, see the benchmark_scheduler command."""
+import dataclasses
+import datetime
+import random
+import statistics
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+from .models import Meeting, MeetingPreference, MeetingAttendance, DEFAULT_INITIAL_DATE
+from .schedule_meeting import (get_available_dates, get_available_dates_bitmap,
+                               get_feasible_meeting_dates_with_participants, _get_bitmap_dates,
+                               _transfer_custom_input_to_dates, _sanitize_with_meeting_preference,
+                               _get_meeting_value_data_for_preference, _get_participants_and_resolve_conflict,
+                               _load_verified_meeting_attendance, SCHEDULER_ENGINES)
+from .utils import (get_country_holidays, get_country_name_to_holidays_code, VERIFIED_EMAIL_STATUS, REPEAT_EACH_YEAR,
+                    REPEAT_EACH_MONTH, REPEAT_EACH_WEEK, NO_REPEAT, SELECT_ALL_HOLIDAYS_PREFIX, ATTENDING_RULE_CUSTOM,
+                    CUSTOM_DATES_INPUT_FORMAT)
+
+BENCHMARK_COUNTRIES = ('United States', 'Canada', 'Germany', 'Japan')
+
+
+@dataclasses.dataclass
+class SyntheticWorkload:
+    attendant_count: int = 200
+    # Chance that an attendant gives another attendant a negative weight.
+    conflict_density: float = 0.02
+    # Share of attendants who confirmed a meeting before.
+    history_ratio: float = 0.5
+    # Number of attending date rules of each attendant is between 1 and this.
+    max_rules_per_attendant: int = 4
+    start: datetime.date = datetime.date(2023, 1, 1)
+    until: datetime.date = datetime.date(2023, 12, 31)
+    seed: int = 0
+
+
+def _get_random_custom_dates(rng: random.Random, workload: SyntheticWorkload) -> str:
+    """A date range in the selected_attending_dates format, e.g. 12/16/2022 - 12/25/2022:repeat_each_week."""
+    repeat_option = rng.choice([REPEAT_EACH_YEAR, REPEAT_EACH_MONTH, REPEAT_EACH_WEEK, NO_REPEAT])
+    max_days = {REPEAT_EACH_YEAR: 20, REPEAT_EACH_MONTH: 5, REPEAT_EACH_WEEK: 2, NO_REPEAT: 30}[repeat_option]
+    start = workload.start + datetime.timedelta(days=rng.randrange((workload.until - workload.start).days + 1))
+    end = start + datetime.timedelta(days=rng.randint(1, max_days))
+    return (f'{start.strftime(CUSTOM_DATES_INPUT_FORMAT)} - {end.strftime(CUSTOM_DATES_INPUT_FORMAT)}'
+            f':{repeat_option}')
+
+
+def generate_synthetic_preferences(meeting: Meeting, workload: SyntheticWorkload) -> List[MeetingPreference]:
+    """Unsaved preferences with mixed holiday and custom date rules, and conflicts in the weighted attendants."""
+    rng = random.Random(workload.seed)
+    supported_countries = get_country_name_to_holidays_code()
+    country_to_holiday_names = {country: sorted(get_country_holidays(country))
+                                for country in BENCHMARK_COUNTRIES if country in supported_countries}
+    names = [f'attendant_{index}' for index in range(workload.attendant_count)]
+    preferences = []
+    for name in names:
+        rules = []
+        for _ in range(rng.randint(1, workload.max_rules_per_attendant)):
+            if country_to_holiday_names and rng.random() < 0.4:
+                country = rng.choice(sorted(country_to_holiday_names))
+                holiday_name = rng.choice(
+                    country_to_holiday_names[country] + [f'{SELECT_ALL_HOLIDAYS_PREFIX}{country} Holidays'])
+                rules.append(f'{country.replace(" ", "_")}:{holiday_name}')
+            else:
+                rules.append(_get_random_custom_dates(rng, workload))
+        weighted_attendants = []
+        for other_name in names:
+            if other_name != name and rng.random() < workload.conflict_density:
+                weighted_attendants.append(f'{other_name}:{rng.choice([-1, -5, -20])}')
+        preference = MeetingPreference(
+            registered_attendant_code=uuid.UUID(int=rng.getrandbits(128)), meeting=meeting, name=name,
+            email=f'{name}@example.com', email_verification_code=VERIFIED_EMAIL_STATUS,
+            prefer_to_attend_every_n_months=rng.choice([3, 6, 12, 24]),
+            selected_attending_dates=','.join(rules), weighted_attendants=','.join(weighted_attendants),
+            earliest_meeting_time='10:00', latest_meeting_time='21:00', preferred_meeting_duration='4:00',
+            minimal_meeting_value=rng.randint(1, 4), minimal_meeting_size=rng.randint(2, 4))
+        preference.parse_attending_preference()
+        preferences.append(preference)
+    return preferences
+
+
+def create_synthetic_meeting(workload: SyntheticWorkload) -> Meeting:
+    """Saves a meeting with the synthetic preferences and their attendance histories."""
+    rng = random.Random(workload.seed)
+    meeting = Meeting.objects.create(
+        meeting_code=uuid.UUID(int=rng.getrandbits(128)), display_name='synthetic meeting',
+        code_max_usage=workload.attendant_count, code_available_usage=0, contact_email='benchmark@example.com')
+    preferences = MeetingPreference.objects.bulk_create(generate_synthetic_preferences(meeting, workload))
+    earliest_confirmation_time = datetime.datetime.combine(
+        workload.start, datetime.time(), datetime.timezone.utc) - datetime.timedelta(days=730)
+    attendances = []
+    for preference in preferences:
+        confirmation_time = DEFAULT_INITIAL_DATE
+        if rng.random() < workload.history_ratio:
+            confirmation_time = earliest_confirmation_time + datetime.timedelta(days=rng.randrange(730))
+        attendances.append(MeetingAttendance(attendant_preference=preference,
+                                             latest_confirmation_time=confirmation_time))
+    MeetingAttendance.objects.bulk_create(attendances)
+    return meeting
+
+
+def _time_calls(function: Callable, calls: Sequence[Tuple], repeat: int) -> Dict[str, Any]:
+    """Runs function on every args in calls, repeat times, returns the timing of one run over all calls."""
+    run_seconds = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        for args in calls:
+            function(*args)
+        run_seconds.append(time.perf_counter() - start_time)
+    return {'calls': len(calls),
+            'repeat': repeat,
+            'min_seconds': min(run_seconds),
+            'median_seconds': statistics.median(run_seconds),
+            'min_seconds_per_call': min(run_seconds) / len(calls) if calls else 0}
+
+
+def run_scheduler_benchmark(meeting: Meeting, workload: SyntheticWorkload, repeat: int = 3,
+                            busiest_date_count: int = 20) -> Dict[str, Any]:
+    """Times each scheduling stage separately on the meeting's preferences.
+
+    The sanitization and conflict resolution stages run on the busiest_date_count dates with most potential
+    participants, where they do the most work in a scheduling run. Caches such as the holidays are warm after
+    the first repeat, min_seconds is the warm time.
+    """
+    history_meetings_attendance = _load_verified_meeting_attendance(meeting)
+    preferences = [attendance.attendant_preference for attendance in history_meetings_attendance]
+    start, until = workload.start, workload.until
+    custom_rules = [rule for preference in preferences for rule in preference.attending_date_rules
+                    if rule['kind'] == ATTENDING_RULE_CUSTOM]
+
+    date_to_potential_participants: Dict[datetime.date, List[MeetingPreference]] = {}
+    for preference in preferences:
+        for date in _get_bitmap_dates(get_available_dates_bitmap(preference, start, until), start):
+            date_to_potential_participants.setdefault(date, []).append(preference)
+    busiest_dates = sorted(date_to_potential_participants,
+                           key=lambda date: (-len(date_to_potential_participants[date]), date))[:busiest_date_count]
+    busiest_participants = [date_to_potential_participants[date] for date in busiest_dates]
+    conflict_constrains = []
+    for participants in busiest_participants:
+        conflict_constrain = []
+        for participant in participants:
+            _, constrained_participants = _get_meeting_value_data_for_preference(participant, participants)
+            if constrained_participants:
+                conflict_constrain.append((participant, constrained_participants))
+        conflict_constrains.append(conflict_constrain)
+
+    stages = {
+        'get_available_dates': _time_calls(
+            get_available_dates, [(preference, start, until) for preference in preferences], repeat),
+        '_transfer_custom_input_to_dates': _time_calls(
+            _transfer_custom_input_to_dates, [(rule, start, until) for rule in custom_rules], repeat),
+        '_sanitize_with_meeting_preference': _time_calls(
+            _sanitize_with_meeting_preference,
+            [(participants, history_meetings_attendance) for participants in busiest_participants], repeat),
+        '_get_participants_and_resolve_conflict': _time_calls(
+            _get_participants_and_resolve_conflict,
+            [(conflict_constrain, history_meetings_attendance) for conflict_constrain in conflict_constrains], repeat),
+    }
+    for engine in SCHEDULER_ENGINES:
+        stages[f'get_feasible_meeting_dates_with_participants[{engine}]'] = _time_calls(
+            get_feasible_meeting_dates_with_participants, [(meeting, start, until, engine)], repeat)
+    return {
+        'workload': {**dataclasses.asdict(workload), 'start': start.isoformat(), 'until': until.isoformat()},
+        'dates_with_potential_participants': len(date_to_potential_participants),
+        'max_potential_participants': len(busiest_participants[0]) if busiest_participants else 0,
+        'conflicts': sum(len(conflict_constrain) for conflict_constrain in conflict_constrains),
+        'stages': stages,
+    }
@@ -0,0 +1,145 @@
+"""Scenario corpus of meeting snapshots, replayed by the scheduler engines to compare plan quality and cost.
+
+A scenario is a JSON file with the verified participants of one meeting, their attendance and the scheduling
+time, so a replay with the same seed picks the same plan regardless of when it runs:
+    {"format_version": 1, "meeting_code": ..., "now": ..., "start": ..., "until": ...,
+     "participants": [{"code": ..., "name": ..., "selected_attending_dates": ..., ...,
+                       "latest_confirmation_time": ..., "latest_invitation_time": ...}]}
+Emails are not recorded.
+"""
+import dataclasses
+import datetime
+import hashlib
+import json
+import os
+import random
+import time
+import tracemalloc
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from .models import Meeting, MeetingPreference, MeetingAttendance
+from .schedule_meeting import (pick_meeting_dates_for_attendance, get_utc_now, _load_verified_meeting_attendance,
+                               _get_participant_meeting_value, MAX_PARTICIPATE_VALUE,
+                               SCHEDULE_MEETINGS_START_FROM_NOW)
+from .utils import VERIFIED_EMAIL_STATUS
+
+SCENARIO_FORMAT_VERSION = 1
+# Participant fields recorded as they are.
+_PREFERENCE_FIELDS = ('name', 'prefer_to_attend_every_n_months', 'selected_attending_dates', 'weighted_attendants',
+                      'minimal_meeting_value', 'minimal_meeting_size')
+
+
+def snapshot_meeting(meeting: Meeting, now: Optional[datetime.datetime] = None) -> Dict:
+    """The scenario of the meeting scheduled at now, over the same dates as schedule_meetings."""
+    now = now or get_utc_now()
+    start = (now + SCHEDULE_MEETINGS_START_FROM_NOW).date()
+    participants = []
+    for attendance in _load_verified_meeting_attendance(meeting):
+        preference = attendance.attendant_preference
+        participant = {'code': str(preference.registered_attendant_code)}
+        participant.update({field: getattr(preference, field) for field in _PREFERENCE_FIELDS})
+        participant['latest_confirmation_time'] = attendance.latest_confirmation_time.isoformat()
+        participant['latest_invitation_time'] = attendance.latest_invitation_time.isoformat()
+        participants.append(participant)
+    return {'format_version': SCENARIO_FORMAT_VERSION,
+            'meeting_code': str(meeting.meeting_code),
+            'now': now.isoformat(),
+            'start': start.isoformat(),
+            'until': (start + datetime.timedelta(days=365)).isoformat(),
+            'participants': participants}
+
+
+def write_scenario(scenario: Dict, corpus_dir: str) -> str:
+    os.makedirs(corpus_dir, exist_ok=True)
+    path = os.path.join(corpus_dir, f'{scenario["meeting_code"]}.json')
+    with open(path, 'w') as scenario_file:
+        json.dump(scenario, scenario_file, indent=1, sort_keys=True)
+    return path
+
+
+def load_corpus(corpus_dir: str) -> List[Tuple[str, Dict]]:
+    """[(scenario name, scenario)] of the JSON files in the directory, sorted by name."""
+    scenarios = []
+    for file_name in sorted(os.listdir(corpus_dir)):
+        if not file_name.endswith('.json'):
+            continue
+        with open(os.path.join(corpus_dir, file_name)) as scenario_file:
+            scenario = json.load(scenario_file)
+        if scenario.get('format_version') != SCENARIO_FORMAT_VERSION:
+            raise ValueError(f'{file_name} has unsupported format version {scenario.get("format_version")}.')
+        scenarios.append((file_name[:-len('.json')], scenario))
+    return scenarios
+
+
+def _load_scenario_attendance(scenario: Dict) -> List[MeetingAttendance]:
+    """Unsaved attendance of the scenario participants, with their parsed preferences."""
+    history_meetings_attendance = []
+    for participant in scenario['participants']:
+        preference = MeetingPreference(
+            registered_attendant_code=uuid.UUID(participant['code']), email_verification_code=VERIFIED_EMAIL_STATUS,
+            **{field: participant[field] for field in _PREFERENCE_FIELDS})
+        preference.parse_attending_preference()
+        history_meetings_attendance.append(MeetingAttendance(
+            attendant_preference=preference,
+            latest_confirmation_time=datetime.datetime.fromisoformat(participant['latest_confirmation_time']),
+            latest_invitation_time=datetime.datetime.fromisoformat(participant['latest_invitation_time'])))
+    return history_meetings_attendance
+
+
+@dataclasses.dataclass
+class ReplayResult:
+    scenario: str
+    engine: str
+    meetings_scheduled: int
+    total_attendees: int
+    # Sum of the participants' meeting value (days since their last confirmation, capped at MAX_PARTICIPATE_VALUE)
+    # over the scheduled meetings.
+    total_participant_value: int
+    runtime_seconds: float
+    peak_memory_bytes: int
+    # Equal digests mean equal plans.
+    plan_digest: str
+
+
+def replay_scenario(name: str, scenario: Dict, engine: str, seed: int = 0) -> ReplayResult:
+    """Runs the engine on the scenario twice, timed and then traced for peak memory, with the same seed."""
+    now = datetime.datetime.fromisoformat(scenario['now'])
+    start = datetime.date.fromisoformat(scenario['start'])
+    until = datetime.date.fromisoformat(scenario['until'])
+    history_meetings_attendance = _load_scenario_attendance(scenario)
+
+    start_time = time.perf_counter()
+    plan = pick_meeting_dates_for_attendance(
+        history_meetings_attendance, start, until, engine, rng=random.Random(seed), now=now)
+    runtime_seconds = time.perf_counter() - start_time
+
+    # Tracing slows down the run, so it's not timed.
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    baseline_bytes = tracemalloc.get_traced_memory()[0]
+    pick_meeting_dates_for_attendance(
+        _load_scenario_attendance(scenario), start, until, engine, rng=random.Random(seed), now=now)
+    peak_memory_bytes = tracemalloc.get_traced_memory()[1] - baseline_bytes
+    if not tracing:
+        tracemalloc.stop()
+
+    code_to_value = {
+        attendance.attendant_preference.registered_attendant_code:
+            min(_get_participant_meeting_value(attendance, now), MAX_PARTICIPATE_VALUE)
+        for attendance in history_meetings_attendance}
+    plan_entries = [[date.isoformat(), sorted(str(participant.registered_attendant_code)
+                                              for participant in participants)]
+                    for date, participants in plan]
+    return ReplayResult(
+        scenario=name,
+        engine=engine,
+        meetings_scheduled=len(plan),
+        total_attendees=sum(len(participants) for _, participants in plan),
+        total_participant_value=sum(code_to_value[participant.registered_attendant_code]
+                                    for _, participants in plan for participant in participants),
+        runtime_seconds=runtime_seconds,
+        peak_memory_bytes=peak_memory_bytes,
+        plan_digest=hashlib.sha256(json.dumps(plan_entries).encode()).hexdigest()[:16])
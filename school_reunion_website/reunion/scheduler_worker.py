@@ -0,0 +1,127 @@
+"""Runs the meeting scheduler of every meeting in the background, see the run_scheduler command.
+
+Meetings are independent, so each one is scheduled in a worker process of a bounded process pool.
+"""
+import concurrent.futures
+import dataclasses
+import datetime
+import logging
+import signal
+import threading
+from typing import Dict, List, Optional
+
+from django.db import connections
+
+from .models import Meeting
+from .schedule_meeting import schedule_meetings, send_final_meeting_notification, get_utc_now
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STALE_AFTER = datetime.timedelta(hours=24)
+DEFAULT_MEETING_TIMEOUT_SECONDS = 600
+
+
+class MeetingSchedulingTimeout(Exception):
+    pass
+
+
+@dataclasses.dataclass
+class SchedulingRoundResult:
+    scheduled_meeting_codes: List[str] = dataclasses.field(default_factory=list)
+    failed_meeting_codes: List[str] = dataclasses.field(default_factory=list)
+    timed_out_meeting_codes: List[str] = dataclasses.field(default_factory=list)
+    # Meetings not started because of shutdown.
+    cancelled_meeting_codes: List[str] = dataclasses.field(default_factory=list)
+
+
+def get_stale_meeting_codes(stale_after: datetime.timedelta = DEFAULT_STALE_AFTER) -> List[str]:
+    """Codes of the meetings not checked within stale_after, the least recently checked first."""
+    return [str(code) for code in Meeting.objects.filter(
+        last_check_time__lt=get_utc_now() - stale_after).order_by('last_check_time').values_list(
+        'meeting_code', flat=True)]
+
+
+def initialize_worker():
+    """Leaves the shutdown to the parent process, which lets running meetings finish first."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+
+def _raise_timeout(signum, frame):
+    raise MeetingSchedulingTimeout()
+
+
+def schedule_meeting_with_timeout(meeting_code: str, timeout_seconds: Optional[float]) -> str:
+    """Schedules one meeting, raises MeetingSchedulingTimeout if it runs longer than timeout_seconds.
+
+    The timeout is an interval timer of the process, it's only set in the main thread of a process with SIGALRM.
+    """
+    set_timer = (bool(timeout_seconds) and hasattr(signal, 'setitimer')
+                 and threading.current_thread() is threading.main_thread())
+    if set_timer:
+        previous_handler = signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout_seconds)
+    try:
+        schedule_meetings(Meeting.objects.get(meeting_code=meeting_code))
+    finally:
+        if set_timer:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous_handler)
+    return meeting_code
+
+
+def _record_meeting_result(result: SchedulingRoundResult, meeting_code: str, future_or_call):
+    try:
+        future_or_call()
+    except MeetingSchedulingTimeout:
+        logger.warning('Scheduling meeting %s timed out.', meeting_code)
+        result.timed_out_meeting_codes.append(meeting_code)
+    except Exception:
+        logger.exception('Scheduling meeting %s failed.', meeting_code)
+        result.failed_meeting_codes.append(meeting_code)
+    else:
+        result.scheduled_meeting_codes.append(meeting_code)
+
+
+def run_scheduling_round(executor: Optional[concurrent.futures.Executor] = None,
+                         stale_after: datetime.timedelta = DEFAULT_STALE_AFTER,
+                         timeout_seconds: Optional[float] = DEFAULT_MEETING_TIMEOUT_SECONDS,
+                         stop_event: Optional[threading.Event] = None) -> SchedulingRoundResult:
+    """Schedules the stale meetings and sends the final meeting notifications.
+
+    Meetings are scheduled in the executor if given, otherwise one by one in this process. The last check time
+    is only updated for the meetings scheduled successfully, so failed ones are retried in the next round.
+    Meetings not started yet are cancelled once stop_event is set.
+    """
+    result = SchedulingRoundResult()
+    meeting_codes = get_stale_meeting_codes(stale_after)
+    if executor is None:
+        for meeting_code in meeting_codes:
+            if stop_event and stop_event.is_set():
+                result.cancelled_meeting_codes.append(meeting_code)
+                continue
+            _record_meeting_result(
+                result, meeting_code, lambda: schedule_meeting_with_timeout(meeting_code, timeout_seconds))
+    else:
+        # Forked workers must not share the database connections of this process.
+        connections.close_all()
+        future_to_meeting_code: Dict[concurrent.futures.Future, str] = {
+            executor.submit(schedule_meeting_with_timeout, meeting_code, timeout_seconds): meeting_code
+            for meeting_code in meeting_codes}
+        for future in concurrent.futures.as_completed(future_to_meeting_code):
+            meeting_code = future_to_meeting_code[future]
+            if future.cancelled():
+                result.cancelled_meeting_codes.append(meeting_code)
+                continue
+            _record_meeting_result(result, meeting_code, future.result)
+            if stop_event and stop_event.is_set():
+                for pending_future in future_to_meeting_code:
+                    pending_future.cancel()
+
+    Meeting.objects.filter(meeting_code__in=result.scheduled_meeting_codes).update(last_check_time=get_utc_now())
+    if not (stop_event and stop_event.is_set()):
+        try:
+            send_final_meeting_notification()
+        except Exception:
+            logger.exception('Sending final meeting notification failed.')
+    return result
@@ -0,0 +1,109 @@
+"""Per meeting timings and counters of a scheduling run.
+
+The scheduling code calls timed_phase and increment_counter, they only record while collect_scheduling_stats is
+active in the current context, otherwise they cost a context variable lookup.
+"""
+import collections
+import contextlib
+import contextvars
+import dataclasses
+import logging
+import time
+from typing import Callable, Dict, Iterator, Optional
+
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+# Phases, they can nest, e.g. holiday_lookup is part of rule_expansion.
+PHASE_LOAD_ATTENDANCE = 'load_attendance'
+PHASE_RULE_EXPANSION = 'rule_expansion'
+PHASE_HOLIDAY_LOOKUP = 'holiday_lookup'
+PHASE_PICK_DATES = 'pick_dates'
+PHASE_SANITIZATION = 'sanitization'
+PHASE_CONFLICT_SOLVER = 'conflict_solver'
+PHASE_ARRANGE_MEETINGS = 'arrange_meetings'
+
+COUNTER_DB_QUERIES = 'db_queries'
+COUNTER_HOLIDAY_RULES = 'holiday_rules'
+COUNTER_CUSTOM_RULES = 'custom_rules'
+COUNTER_SIZE_SANITIZATIONS = 'size_sanitizations'
+COUNTER_VALUE_SANITIZATIONS = 'value_sanitizations'
+COUNTER_CONFLICT_ROUNDS = 'conflict_rounds'
+COUNTER_CONFLICT_SOLVER_RUNS = 'conflict_solver_runs'
+COUNTER_CONFLICT_SOLVER_NODES = 'conflict_solver_nodes'
+COUNTER_PICKED_DATES = 'picked_dates'
+COUNTER_SCHEDULED_PLAN_CACHE_HITS = 'scheduled_plan_cache_hits'
+COUNTER_MEETINGS_ARRANGED = 'meetings_arranged'
+COUNTER_EMAILS_ENQUEUED = 'emails_enqueued'
+
+
+@dataclasses.dataclass
+class SchedulingStats:
+    meeting_code: str
+    total_seconds: float = 0
+    # Wall time of each phase, summed over its calls.
+    phase_seconds: Dict[str, float] = dataclasses.field(default_factory=lambda: collections.defaultdict(float))
+    counters: Dict[str, int] = dataclasses.field(default_factory=lambda: collections.defaultdict(int))
+
+    def as_dict(self) -> Dict:
+        return {'meeting_code': self.meeting_code,
+                'total_seconds': self.total_seconds,
+                'phase_seconds': dict(self.phase_seconds),
+                'counters': dict(self.counters)}
+
+
+_current_stats: contextvars.ContextVar[Optional[SchedulingStats]] = contextvars.ContextVar(
+    'scheduling_stats', default=None)
+
+
+def get_current_scheduling_stats() -> Optional[SchedulingStats]:
+    return _current_stats.get()
+
+
+def increment_counter(counter: str, amount: int = 1):
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.counters[counter] += amount
+
+
+@contextlib.contextmanager
+def timed_phase(phase: str) -> Iterator[None]:
+    stats = _current_stats.get()
+    if stats is None:
+        yield
+        return
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.phase_seconds[phase] += time.perf_counter() - start_time
+
+
+def _count_query(execute, sql, params, many, context):
+    increment_counter(COUNTER_DB_QUERIES)
+    return execute(sql, params, many, context)
+
+
+@contextlib.contextmanager
+def collect_scheduling_stats(meeting_code: str,
+                             hook: Optional[Callable[[SchedulingStats], None]] = None) -> Iterator[SchedulingStats]:
+    """Records the stats of the scheduling code run in the block, and calls hook with them at the end.
+
+    Queries are counted on the default database connection of this thread. Exceptions of the hook are logged, so
+    they don't fail the scheduling or hide its exception.
+    """
+    stats = SchedulingStats(meeting_code=str(meeting_code))
+    token = _current_stats.set(stats)
+    start_time = time.perf_counter()
+    try:
+        with connection.execute_wrapper(_count_query):
+            yield stats
+    finally:
+        stats.total_seconds = time.perf_counter() - start_time
+        _current_stats.reset(token)
+        if hook:
+            try:
+                hook(stats)
+            except Exception:
+                logger.exception('Scheduling stats hook failed for meeting %s.', stats.meeting_code)
@@ -54,19 +54,30 @@ $(document).ready(function() {
             });
     });
 
-    // show and hide method has display issue when options length is too large.
-    var options = $("#id_holiday").children('option');
+    // Holidays of a country are fetched once it's selected, the catalog is cached by the browser.
     $("#id_country").val('');
-    $("#id_holiday").val('');
+    $("#id_holiday").empty();
     $("#id_country").change(function() {
+        var country = $(this).val();
         $("#id_holiday").empty();
-        var className = $(this).val().replace(/\s+/g, '_');
-        for (option of options) {
-            if (option.getAttribute('class') == className) {
-                $("#id_holiday").append(option);
-            }
+        if (!country) {
+            return;
         }
-        $("#id_holiday").val('');
-        $("#id_holiday").children('option').show();
+        $.getJSON(`/holiday_catalog/${encodeURIComponent(country)}`, function(catalog) {
+            // Another country is selected while loading.
+            if ($("#id_country").val() !== country) {
+                return;
+            }
+            var className = country.replace(/\s+/g, '_');
+            var holidayNames = [`Select All ${country} Holidays`].concat(catalog.holidays);
+            holidayNames.forEach(function(holidayName, idx) {
+                $("#id_holiday").append($('<option>', {value: `${country}_${idx}`, class: className, text: holidayName}));
+            });
+            $("#id_holiday").val('');
+        }).fail(function() {
+            if ($("#id_country").val() === country) {
+                alert(`Holidays of ${country} can't be loaded, please select the country again later.`);
+            }
+        });
     });
 })
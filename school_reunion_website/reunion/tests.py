@@ -1,21 +1,39 @@
 """Run test under manager.py directory with command:
-    set DJANGO_SETTINGS_MODULE=school_reunion_website.settings; python3.9 manage.py test"""
+    set DJANGO_SETTINGS_MODULE=school_reunion_website.settings; python3.9 manage.py test
+The concurrent tests are skipped on an in-memory SQLite test database, they run with a file based one, e.g.
+    DATABASES['default']['TEST'] = {'NAME': BASE_DIR / 'test_db.sqlite3'}"""
 import datetime
+import gzip
+import heapq
+import http.server
+import io
 import re
 import sys
 import os
+import tempfile
+import threading
+import time
+from unittest import mock
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
-from django.test import TestCase
+from django.test import TestCase, SimpleTestCase, TransactionTestCase, override_settings
 from django.test import Client
-from .models import Meeting, MeetingPreference, MeetingAttendance, MeetingRecord
+from .models import Meeting, MeetingPreference, MeetingAttendance, MeetingRecord, Invitation, OutboxEmail, DEFAULT_INITIAL_DATE
 import uuid
 from django.core import mail
-from .emails import SCHOOL_REUNION_ADMIN_EMAIL, invitation_link
-from .utils import VERIFIED_EMAIL_STATUS, ATTENDANT_PENDING_STATUS, ATTENDANT_CONFIRM_STATUS
-from .schedule_meeting import schedule_meetings, get_available_dates, get_feasible_meeting_dates_with_participants, MIN_ATTENDING_INTERVAL_TO_PREFERRED_INTERVAL, SCHEDULE_MEETINGS_START_FROM_NOW, NOTIFY_MEETINGS_UNTIL_FROM_NOW
+from django.core.management import call_command
+from .emails import SCHOOL_REUNION_ADMIN_EMAIL, invitation_link, deliver_outbox_emails, enqueue_email, send_scheduled_meeting_notifications, _claim_outbox_emails, _finish_outbox_email
+from .conflict_solver import solve_max_weight_independent_set, get_tie_broken_weights, solve_conflict_graph, get_connected_components
+from .utils import OUTBOX_STATUS_PENDING, OUTBOX_STATUS_SENT, VERIFIED_EMAIL_STATUS, ATTENDANT_PENDING_STATUS, ATTENDANT_CONFIRM_STATUS, ATTENDANT_DENY_STATUS, MEETING_RECORD_STATUS_INITIALIZED, MEETING_RECORD_STATUS_FINALIZED, _get_country_holidays_in_year, _compute_country_holidays_in_year, _load_holiday_index, clear_holiday_caches, record_new_meeting_preference
+from .schedule_meeting import get_scheduled_plan, _update_other_dates_after_picking_meeting_date, _pop_next_date_to_participate, _sanitize_with_meeting_preference, schedule_meetings, get_available_dates, get_available_dates_bitmap, get_feasible_meeting_dates_with_participants, MIN_ATTENDING_INTERVAL_TO_PREFERRED_INTERVAL, SCHEDULE_MEETINGS_START_FROM_NOW, NOTIFY_MEETINGS_UNTIL_FROM_NOW, SCHEDULER_ENGINE_DATE_LISTS, send_final_meeting_notification, SCHEDULER_ENGINE_MATRIX, ensure_online_meeting_link
+from .scheduler_worker import run_scheduling_round
+from .forms import MeetingPreferenceForm
+from .scheduler_benchmark import SyntheticWorkload, create_synthetic_meeting
+from .load_test import LoadTestConfig, run_load_test
+from .online_meeting_providers import get_online_meeting_provider, clear_online_meeting_providers, ONLINE_MEETING_PROVIDER_RECORDING
+from .create_online_meeting import GraphClient, CircuitBreaker, GraphClientError, CircuitOpenError, create_meeting_link
 from typing import Optional, Dict
-from django.db import transaction
+from django.db import connection, transaction
 import json
 
 
@@ -60,6 +78,27 @@ def _set_all_preference_email_verified(meeting: Meeting):
         preference.save()
 
 
+def _deliver_outbox_emails() -> int:
+    """Sends all the pending emails to mail.outbox, returns the number of emails sent."""
+    sent_count = 0
+    batch_sent_count = deliver_outbox_emails()
+    while batch_sent_count:
+        sent_count += batch_sent_count
+        batch_sent_count = deliver_outbox_emails()
+    return sent_count
+
+
+_recorded_scheduling_stats = []
+
+
+def _record_scheduling_stats(stats):
+    _recorded_scheduling_stats.append(stats)
+
+
+def _fail_scheduling_stats_hook(stats):
+    raise ValueError('stats sink is down')
+
+
 class MeetingPreferenceViewTests(TestCase):
 
     def setUp(self):
@@ -84,11 +123,36 @@ class MeetingPreferenceViewTests(TestCase):
                          "09/29/2021 - 10/02/2021:repeat_each_year,"
                          "10/01/2021 - 10/02/2021:repeat_each_month")
         self.assertEqual(len(preference.email_verification_code), 128)
+        self.assertEqual(_deliver_outbox_emails(), 1)
         self.assertEqual(len(mail.outbox), 1)
         self.assertEqual(mail.outbox[0].from_email, SCHOOL_REUNION_ADMIN_EMAIL)
         self.assertEqual(mail.outbox[0].to, [TESTING_EMAIL_ADDRESS])
         self.assertTrue((preference.email_verification_code in mail.outbox[0].body))
 
+    def test_attending_preference_is_parsed_when_saved(self):
+        _create_preference_form(
+            self.client, self.meeting_code,
+            override_post_data={'selected_attending_dates':
+                                    '[{"value":"12/16/2021 - 12/25/2021:no_repeat"},'
+                                    '{"value":"United_States:Washington\'s Birthday"},'
+                                    '{"value":"United_States:Select All United States Holidays"},'
+                                    '{"value":"13/45/2021 - 12/25/2021:repeat_each_week"},'
+                                    '{"value":"malformed"}]'})
+        preference = MeetingPreference.objects.get(meeting_id=self.meeting_code)
+
+        self.assertEqual(preference.attending_date_rules,
+                         [{'kind': 'custom', 'start': '2021-12-16', 'end': '2021-12-25', 'repeat': 'no_repeat'},
+                          {'kind': 'holiday', 'country': 'United States', 'holiday': "Washington's Birthday"},
+                          {'kind': 'holiday', 'country': 'United States', 'holiday': None}])
+        self.assertEqual(preference.weighted_attendant_values, {'assa': -1, 'lala': -10, 'haha': 20})
+
+    def test_non_finite_attendant_weights_are_dropped_when_saved(self):
+        _create_preference_form(self.client, self.meeting_code, override_post_data={
+            'weighted_attendants': '[{"value":"x:inf"},{"value":"y:nan"},{"value":"z:-2"}]'})
+        preference = MeetingPreference.objects.get(meeting_id=self.meeting_code)
+
+        self.assertEqual(preference.weighted_attendant_values, {'z': -2})
+
     def test_email_verification_status_change_to_pass_after_click_the_generated_link(self):
         _create_preference_form(self.client, self.meeting_code)
         preference = MeetingPreference.objects.get(meeting_id=self.meeting_code)
@@ -104,6 +168,7 @@ class MeetingPreferenceViewTests(TestCase):
         # Unchanged email address.
         _create_preference_form(self.client, self.meeting_code,
                                 override_post_data={'registered_attendant_code': preference.registered_attendant_code})
+        _deliver_outbox_emails()
         self.assertEqual(len(mail.outbox), 1)
         self.assertEqual(mail.outbox[0].from_email, SCHOOL_REUNION_ADMIN_EMAIL)
         self.assertEqual(mail.outbox[0].to, [TESTING_EMAIL_ADDRESS])
@@ -115,6 +180,7 @@ class MeetingPreferenceViewTests(TestCase):
 
         self.assertNotEqual(preference.email_verification_code, updated_preference.email_verification_code)
         self.assertNotEqual(updated_preference.email_verification_code, VERIFIED_EMAIL_STATUS)
+        _deliver_outbox_emails()
         self.assertEqual(len(mail.outbox), 2)
         self.assertEqual(mail.outbox[1].from_email, SCHOOL_REUNION_ADMIN_EMAIL)
         self.assertEqual(mail.outbox[1].to, [SCHOOL_REUNION_ADMIN_EMAIL])
@@ -139,6 +205,53 @@ class MeetingPreferenceViewTests(TestCase):
                               datetime.date(2000, 2, 2), datetime.date(2000, 2, 20), datetime.date(2000, 7, 1),
                               datetime.date(2000, 2, 21), datetime.date(2000, 7, 2), datetime.date(2000, 11, 1)])
 
+    def test_only_selected_country_holidays_are_computed(self):
+        _create_preference_form(
+            self.client, self.meeting_code,
+            override_post_data={'selected_attending_dates': '[{"value":"United_States:Washington\'s Birthday"}]'})
+        preference = MeetingPreference.objects.get(meeting_id=self.meeting_code)
+        _get_country_holidays_in_year.cache_clear()
+        available_dates = get_available_dates(
+            preference,
+            datetime.datetime(year=2000, month=1, day=1).date(),
+            datetime.datetime(year=2001, month=12, day=31).date())
+
+        self.assertEqual(available_dates,
+                         [datetime.date(2000, 2, 19), datetime.date(2000, 2, 20), datetime.date(2000, 2, 21),
+                          datetime.date(2001, 2, 17), datetime.date(2001, 2, 18), datetime.date(2001, 2, 19)])
+        self.assertEqual(_get_country_holidays_in_year.cache_info().currsize, 2)
+
+    def test_holidays_are_served_from_built_holiday_index(self):
+        computed_holidays = _compute_country_holidays_in_year('United States', 2000)
+        with tempfile.TemporaryDirectory() as index_dir:
+            index_path = os.path.join(index_dir, 'holiday_index.json')
+            with self.settings(REUNION_HOLIDAY_INDEX_PATH=index_path):
+                call_command('build_holiday_index', '--first-year', '2000', '--last-year', '2001', stdout=io.StringIO())
+                try:
+                    self.assertEqual(_get_country_holidays_in_year('United States', 2000), computed_holidays)
+                    self.assertTrue(_load_holiday_index())
+                finally:
+                    clear_holiday_caches()
+
+    def test_holiday_catalog_is_served_per_country_with_etag(self):
+        response = self.client.get(path='/holiday_catalog/United States')
+        catalog = json.loads(response.content)
+        self.assertEqual(catalog['country'], 'United States')
+        self.assertIn("Washington's Birthday", catalog['holidays'])
+        self.assertIn('max-age', response['Cache-Control'])
+        # The form renders no holiday, they are loaded after the country is selected.
+        self.assertNotIn("Washington", str(MeetingPreferenceForm()['holiday']))
+
+        gzip_response = self.client.get(path='/holiday_catalog/United States', HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(gzip_response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(gzip_response.content), response.content)
+        self.assertNotEqual(gzip_response['ETag'], response['ETag'])
+
+        not_modified_response = self.client.get(path='/holiday_catalog/United States',
+                                                HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified_response.status_code, 304)
+        self.assertEqual(self.client.get(path='/holiday_catalog/Atlantis').status_code, 404)
+
     def test_get_all_dates_from_meeting_preference(self):
         _create_preference_form(
             self.client, self.meeting_code,
@@ -156,6 +269,30 @@ class MeetingPreferenceViewTests(TestCase):
                                datetime.date(2000, 5, 10), datetime.date(2000, 5, 11), datetime.date(2000, 5, 12),
                                datetime.date(2000, 5, 13), datetime.date(2000, 5, 14), datetime.date(2000, 5, 15)])
 
+    def test_get_available_dates_skip_days_not_in_month(self):
+        _create_preference_form(
+            self.client, self.meeting_code,
+            override_post_data={'selected_attending_dates':
+                                    '[{"value":"02/29/2020 - 02/29/2020:repeat_each_year"},'
+                                    '{"value":"01/31/2021 - 01/31/2021:repeat_each_month"}]'})
+        preference = MeetingPreference.objects.get(meeting_id=self.meeting_code)
+        available_dates = get_available_dates(
+            preference,
+            datetime.datetime(year=2023, month=1, day=1).date(),
+            datetime.datetime(year=2024, month=5, day=1).date())
+        available_dates_bitmap = get_available_dates_bitmap(
+            preference,
+            datetime.datetime(year=2023, month=1, day=1).date(),
+            datetime.datetime(year=2024, month=5, day=1).date())
+
+        self.assertEqual(available_dates,
+                         [datetime.date(2023, 1, 31), datetime.date(2023, 3, 31), datetime.date(2023, 5, 31),
+                          datetime.date(2023, 7, 31), datetime.date(2023, 8, 31), datetime.date(2023, 10, 31),
+                          datetime.date(2023, 12, 31), datetime.date(2024, 1, 31), datetime.date(2024, 2, 29),
+                          datetime.date(2024, 3, 31)])
+        self.assertEqual(bin(available_dates_bitmap).count('1'), len(available_dates))
+        self.assertTrue(available_dates_bitmap & (1 << 30))
+
     def test_no_feasible_meeting_dates_because_minimal_meeting_size_set_too_high(self):
         _create_preference_form(
             self.client, self.meeting_code,
@@ -254,6 +391,38 @@ class MeetingPreferenceViewTests(TestCase):
                     datetime.timedelta(days=int(6*30*MIN_ATTENDING_INTERVAL_TO_PREFERRED_INTERVAL)-1),
                     abs(date - dates_with_participants[idx-1][0]))
 
+    def test_matrix_engine_picks_same_meeting_dates_as_date_lists_engine(self):
+        meeting = Meeting.objects.get(meeting_code=self.meeting_code)
+        meeting.code_available_usage = 10
+        meeting.code_max_usage = 10
+        meeting.save()
+        for idx, (selected_attending_dates, prefer_to_attend_every_n_months) in enumerate([
+                ('[{"value":"12/10/2021 - 12/25/2021:repeat_each_month"}]', '6'),
+                ('[{"value":"12/10/2021 - 12/12/2021:repeat_each_week"}]', '3'),
+                ('[{"value":"12/10/2021 - 12/25/2021:repeat_each_month"}]', '12'),
+                ('[{"value":"12/13/2021 - 12/20/2021:repeat_each_month"}]', '6')]):
+            _create_preference_form(
+                self.client, self.meeting_code,
+                override_post_data={'selected_attending_dates': selected_attending_dates,
+                                    'minimal_meeting_size': '2',
+                                    'prefer_to_attend_every_n_months': prefer_to_attend_every_n_months,
+                                    'email': f'dummy{idx}@gmail.com'})
+        _set_all_preference_email_verified(meeting)
+
+        dates_with_participants = get_feasible_meeting_dates_with_participants(
+            meeting, start=datetime.date(2021, 1, 1), until=datetime.date(2022, 1, 1),
+            engine=SCHEDULER_ENGINE_DATE_LISTS)
+        matrix_dates_with_participants = get_feasible_meeting_dates_with_participants(
+            meeting, start=datetime.date(2021, 1, 1), until=datetime.date(2022, 1, 1),
+            engine=SCHEDULER_ENGINE_MATRIX)
+
+        self.assertLess(0, len(dates_with_participants))
+        self.assertEqual(
+            [(date, sorted(p.registered_attendant_code for p in participants))
+             for date, participants in dates_with_participants],
+            [(date, sorted(p.registered_attendant_code for p in participants))
+             for date, participants in matrix_dates_with_participants])
+
     def test_get_feasible_meeting_dates_with_meeting_value_considered(self):
         # TODO, mock schedule_meeting.get_utc_now before 2025.1.1
         meeting = Meeting.objects.get(meeting_code=self.meeting_code)
@@ -368,7 +537,212 @@ class MeetingPreferenceViewTests(TestCase):
         self.assertCountEqual(['A', 'B'], [p.name for p in dates_with_participants[0][1]])
         self.assertCountEqual(['C', 'D'], [p.name for p in dates_with_participants[1][1]])
 
+    def test_feasible_meeting_dates_are_loaded_in_one_query(self):
+        meeting = Meeting.objects.get(meeting_code=self.meeting_code)
+        meeting.code_available_usage = 10
+        meeting.code_max_usage = 10
+        meeting.save()
+        for name in ['A', 'B', 'C', 'D']:
+            _create_preference_form(
+                self.client, self.meeting_code,
+                override_post_data={'selected_attending_dates': '[{"value":"12/10/2021 - 12/25/2021:no_repeat"}]',
+                                    'weighted_attendants': '[{"value":"A:-1"}]',
+                                    'email': f'{name}@gmail.com',
+                                    'name': name})
+        _set_all_preference_email_verified(meeting)
+
+        with self.assertNumQueries(1):
+            dates_with_participants = get_feasible_meeting_dates_with_participants(
+                meeting, start=datetime.date(2021, 12, 1), until=datetime.date(2022, 1, 1))
+
+        self.assertEqual(len(dates_with_participants), 1)
+
+    def test_send_final_meeting_notification_to_confirmed_participants(self):
+        meeting = Meeting.objects.get(meeting_code=self.meeting_code)
+        meeting.code_available_usage = 10
+        meeting.code_max_usage = 10
+        meeting.save()
+        for name in ['A', 'B', 'C']:
+            _create_preference_form(self.client, self.meeting_code,
+                                    override_post_data={'email': f'{name}@gmail.com', 'name': name})
+        meeting_start_time = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=18)
+        record = MeetingRecord.objects.create(
+            meeting=meeting, meeting_status=MEETING_RECORD_STATUS_INITIALIZED, meeting_method='online',
+            offline_meeting_locations='', online_meeting_link='https://meeting.link',
+            meeting_start_time=meeting_start_time, meeting_end_time=meeting_start_time + datetime.timedelta(hours=2))
+        for preference, status in zip(MeetingPreference.objects.order_by('name'),
+                                      [ATTENDANT_CONFIRM_STATUS, ATTENDANT_PENDING_STATUS, ATTENDANT_CONFIRM_STATUS]):
+            Invitation.objects.create(record=record, attendant=preference, status=status)
+        _deliver_outbox_emails()
+        mail.outbox.clear()
+
+        with self.assertNumQueries(4):
+            send_final_meeting_notification()
+        _deliver_outbox_emails()
+
+        self.assertCountEqual([email.to[0] for email in mail.outbox], ['A@gmail.com', 'C@gmail.com'])
+        self.assertIn('https://meeting.link', mail.outbox[0].body)
+        self.assertEqual(MeetingRecord.objects.get(meeting=meeting).meeting_status, MEETING_RECORD_STATUS_FINALIZED)
+        self.assertEqual(record.get_invitation_status_counts(),
+                         {ATTENDANT_CONFIRM_STATUS: 2, ATTENDANT_PENDING_STATUS: 1})
+
+    @override_settings(REUNION_ONLINE_MEETING_PROVIDER=ONLINE_MEETING_PROVIDER_RECORDING)
+    def test_final_meeting_notification_waits_for_online_meeting_link(self):
+        self.addCleanup(clear_online_meeting_providers)
+        meeting = Meeting.objects.get(meeting_code=self.meeting_code)
+        _create_preference_form(self.client, self.meeting_code)
+        meeting_start_time = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=18)
+        record = MeetingRecord.objects.create(
+            meeting=meeting, meeting_status=MEETING_RECORD_STATUS_INITIALIZED, meeting_method='online',
+            offline_meeting_locations='', meeting_start_time=meeting_start_time,
+            meeting_end_time=meeting_start_time + datetime.timedelta(hours=2))
+        Invitation.objects.create(record=record, attendant=MeetingPreference.objects.get(),
+                                  status=ATTENDANT_CONFIRM_STATUS)
+        _deliver_outbox_emails()
+        mail.outbox.clear()
+
+        provider = get_online_meeting_provider()
+        provider.available = False
+        send_final_meeting_notification()
+        _deliver_outbox_emails()
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(MeetingRecord.objects.get().meeting_status, MEETING_RECORD_STATUS_INITIALIZED)
+
+        provider.available = True
+        send_final_meeting_notification()
+        _deliver_outbox_emails()
+        self.assertIn(MeetingRecord.objects.get().online_meeting_link, mail.outbox[0].body)
+        self.assertEqual(len(provider.calls), 2)
+        self.assertEqual(MeetingRecord.objects.get().meeting_status, MEETING_RECORD_STATUS_FINALIZED)
+
+    @override_settings(REUNION_ONLINE_MEETING_PROVIDER=ONLINE_MEETING_PROVIDER_RECORDING)
+    def test_online_meeting_link_stored_first_is_kept(self):
+        self.addCleanup(clear_online_meeting_providers)
+        meeting_start_time = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=18)
+        record = MeetingRecord.objects.create(
+            meeting=Meeting.objects.get(meeting_code=self.meeting_code),
+            meeting_status=MEETING_RECORD_STATUS_INITIALIZED, meeting_method='online', offline_meeting_locations='',
+            meeting_start_time=meeting_start_time, meeting_end_time=meeting_start_time + datetime.timedelta(hours=2))
+        # Another confirmation stored the link while this one called the provider.
+        MeetingRecord.objects.filter(pk=record.pk).update(online_meeting_link='https://meeting.link/first')
+
+        self.assertEqual(ensure_online_meeting_link(record), 'https://meeting.link/first')
+        self.assertEqual(get_online_meeting_provider().calls[0][3], str(record.record_id))
+        self.assertEqual(MeetingRecord.objects.get(pk=record.pk).online_meeting_link, 'https://meeting.link/first')
+
+    def test_scheduled_plan_is_reused_until_meeting_inputs_change(self):
+        meeting = Meeting.objects.get(meeting_code=self.meeting_code)
+        meeting.code_available_usage = 10
+        meeting.code_max_usage = 10
+        meeting.save()
+        for name in ['A', 'B']:
+            _create_preference_form(
+                self.client, self.meeting_code,
+                override_post_data={'selected_attending_dates': '[{"value":"12/10/2021 - 12/25/2021:no_repeat"}]',
+                                    'email': f'{name}@gmail.com',
+                                    'name': name})
+        _set_all_preference_email_verified(meeting)
+        start, until = datetime.date(2021, 12, 1), datetime.date(2022, 1, 1)
+        plan = get_scheduled_plan(Meeting.objects.get(meeting_code=self.meeting_code), start, until)
+
+        with mock.patch('reunion.schedule_meeting.get_feasible_meeting_dates_with_participants') as compute_plan:
+            cached_plan = get_scheduled_plan(Meeting.objects.get(meeting_code=self.meeting_code), start, until)
+        compute_plan.assert_not_called()
+        self.assertEqual([(date, [p.name for p in participants]) for date, participants in cached_plan],
+                         [(date, [p.name for p in participants]) for date, participants in plan])
+
+        preference = MeetingPreference.objects.get(name='B')
+        preference.selected_attending_dates = '12/20/2021 - 12/25/2021:no_repeat'
+        preference.save()
+        updated_plan = get_scheduled_plan(Meeting.objects.get(meeting_code=self.meeting_code), start, until)
+        self.assertEqual(updated_plan[0][0], datetime.date(2021, 12, 21))
+
+    @override_settings(REUNION_SCHEDULING_STATS_HOOK='reunion.tests._record_scheduling_stats')
+    def test_scheduling_stats_are_reported_per_meeting(self):
+        for name in ['A', 'B']:
+            _create_preference_form(
+                self.client, self.meeting_code,
+                override_post_data={'selected_attending_dates': '[{"value":"12/10/2021 - 12/11/2021:repeat_each_week"}]',
+                                    'email': f'{name}@gmail.com',
+                                    'name': name})
+        _set_all_preference_email_verified(Meeting.objects.get(meeting_code=self.meeting_code))
+        _recorded_scheduling_stats.clear()
+        with self.assertLogs('reunion.schedule_meeting', level='INFO') as logs:
+            schedule_meetings(Meeting.objects.get(meeting_code=self.meeting_code))
+
+        stats = _recorded_scheduling_stats.pop()
+        self.assertEqual(stats.meeting_code, self.meeting_code)
+        self.assertEqual(logs.records[0].scheduling_stats, stats.as_dict())
+        self.assertEqual(stats.counters['custom_rules'], 2)
+        self.assertEqual(stats.counters['meetings_arranged'], 1)
+        self.assertEqual(stats.counters['emails_enqueued'], 2)
+        self.assertLess(stats.counters['meetings_arranged'], stats.counters['picked_dates'])
+        self.assertLess(0, stats.counters['db_queries'])
+        self.assertLessEqual(stats.phase_seconds['rule_expansion'] + stats.phase_seconds['pick_dates'],
+                             stats.total_seconds)
+
+    @override_settings(REUNION_SCHEDULING_STATS_HOOK='reunion.tests._fail_scheduling_stats_hook')
+    def test_failed_scheduling_stats_hook_does_not_fail_scheduling(self):
+        with self.assertLogs('reunion.scheduling_stats', level='ERROR'):
+            schedule_meetings(Meeting.objects.get(meeting_code=self.meeting_code))
+
+    def test_run_scheduler_only_schedules_stale_meetings(self):
+        recently_checked_time = datetime.datetime.now(datetime.timezone.utc)
+        recently_checked_meeting = Meeting.objects.create(
+            meeting_code=str(uuid.uuid4()), display_name='checked meeting', code_max_usage=2,
+            code_available_usage=2, contact_email='test@test.com', last_check_time=recently_checked_time)
+        output = io.StringIO()
+        call_command('run_scheduler', '--once', '--max-workers', '1', stdout=output)
+
+        self.assertIn('Scheduled 1 meetings, 0 failed, 0 timed out', output.getvalue())
+        self.assertLess(DEFAULT_INITIAL_DATE, Meeting.objects.get(meeting_code=self.meeting_code).last_check_time)
+        self.assertEqual(Meeting.objects.get(meeting_code=recently_checked_meeting.meeting_code).last_check_time,
+                         recently_checked_time)
+
+    def test_meeting_timed_out_is_scheduled_again_in_next_round(self):
+        with mock.patch('reunion.scheduler_worker.schedule_meetings', side_effect=lambda meeting: time.sleep(1)):
+            result = run_scheduling_round(timeout_seconds=0.05)
+
+        self.assertEqual(result.timed_out_meeting_codes, [self.meeting_code])
+        self.assertEqual(Meeting.objects.get(meeting_code=self.meeting_code).last_check_time, DEFAULT_INITIAL_DATE)
+
+    def test_denied_or_unknown_invitation_is_not_confirmed(self):
+        _create_preference_form(self.client, self.meeting_code)
+        meeting_start_time = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=60)
+        record = MeetingRecord.objects.create(
+            meeting_id=self.meeting_code, meeting_status=MEETING_RECORD_STATUS_INITIALIZED, meeting_method='online',
+            offline_meeting_locations='', online_meeting_link='https://meeting.link',
+            meeting_start_time=meeting_start_time, meeting_end_time=meeting_start_time + datetime.timedelta(hours=2))
+        invitation = Invitation.objects.create(
+            record=record, attendant=MeetingPreference.objects.get(), status=ATTENDANT_DENY_STATUS)
+
+        response = self.client.get(path=f'/confirm_invitation/{record.record_id}/{invitation.invitation_code}')
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(path=f'/confirm_invitation/{record.record_id}/unknown')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(record.get_invitation_status_counts(), {ATTENDANT_DENY_STATUS: 1})
+
+    def test_registration_with_outdated_meeting_does_not_overbook(self):
+        meeting = Meeting.objects.get(meeting_code=self.meeting_code)
+        meeting.code_available_usage = 1
+        meeting.save()
+        # Both registrations checked the available slot before either one is recorded.
+        outdated_meetings = [Meeting.objects.get(meeting_code=self.meeting_code) for _ in range(2)]
+        recorded = []
+        for index, outdated_meeting in enumerate(outdated_meetings):
+            preference = MeetingPreference(
+                registered_attendant_code=uuid.uuid4(), meeting=outdated_meeting, name=f'name_{index}',
+                email=f'{index}@gmail.com', email_verification_code='code', prefer_to_attend_every_n_months=12)
+            recorded.append(record_new_meeting_preference(
+                outdated_meeting, preference, MeetingAttendance(attendant_preference=preference)))
+
+        self.assertEqual(recorded, [True, False])
+        self.assertEqual(MeetingPreference.objects.count(), 1)
+        self.assertEqual(Meeting.objects.get(meeting_code=self.meeting_code).code_available_usage, 0)
+
+    @override_settings(REUNION_ONLINE_MEETING_PROVIDER=ONLINE_MEETING_PROVIDER_RECORDING)
     def test_send_meeting_link_after_the_invitation_is_confirmed(self):
+        self.addCleanup(clear_online_meeting_providers)
         meeting = Meeting.objects.get(meeting_code=self.meeting_code)
         meeting.code_available_usage = 10
         meeting.code_max_usage = 10
@@ -409,12 +783,16 @@ class MeetingPreferenceViewTests(TestCase):
         schedule_meetings(meeting)
 
         record: MeetingRecord = MeetingRecord.objects.get(meeting=meeting)
-        for code, status in json.loads(record.attendant_code_to_status).items():
-            self.assertEqual(status, ATTENDANT_PENDING_STATUS)
-        invitation_code_to_attendant_code = json.loads(record.invitation_code_to_attendant_code)
-        attendant_code_to_invitation_link = {attendant_code: invitation_link(record.record_id, invitation_code)
-                                             for invitation_code, attendant_code in invitation_code_to_attendant_code.items()}
+        self.assertEqual(record.get_invitation_status_counts(), {ATTENDANT_PENDING_STATUS: 3})
+        # The online meeting link is created on the first confirmation.
+        self.assertEqual(record.online_meeting_link, '')
+        for attendance in MeetingAttendance.objects.filter(attendant_preference__meeting=meeting):
+            self.assertEqual(attendance.latest_invitation_time, record.meeting_start_time)
+        attendant_code_to_invitation_link = {
+            str(invitation.attendant_id): invitation_link(record.record_id, invitation.invitation_code)
+            for invitation in record.invitations.all()}
         # Check if invitation link is sent.
+        _deliver_outbox_emails()
         self.assertEqual(len(mail.outbox), 6)
         for email in mail.outbox[3:6]:
             self.assertEqual(len(email.to), 1)
@@ -428,8 +806,393 @@ class MeetingPreferenceViewTests(TestCase):
             response = self.client.get(path=re.findall('(/confirm_invitation.*)>Click', tmp_link)[0])
             self.assertEqual(response.status_code, 200)
 
+        self.assertEqual(len(get_online_meeting_provider().calls), 1)
+        record.refresh_from_db()
+        _deliver_outbox_emails()
         for email in mail.outbox[-3:]:
             self.assertIn(record.online_meeting_link, email.body)
-        record: MeetingRecord = MeetingRecord.objects.get(meeting=meeting)
-        for code, status in json.loads(record.attendant_code_to_status).items():
-            self.assertEqual(status, ATTENDANT_CONFIRM_STATUS)
+        self.assertEqual(record.get_invitation_status_counts(), {ATTENDANT_CONFIRM_STATUS: 3})
+        for attendance in MeetingAttendance.objects.filter(attendant_preference__meeting=meeting):
+            self.assertEqual(attendance.latest_confirmation_time, record.meeting_start_time)
+
+
+class OutboxEmailTests(TestCase):
+
+    def test_pending_duplicate_email_is_enqueued_once(self):
+        enqueue_email('subject', 'message', TESTING_EMAIL_ADDRESS)
+        enqueue_email('subject', 'message', TESTING_EMAIL_ADDRESS)
+        self.assertEqual(OutboxEmail.objects.filter(status=OUTBOX_STATUS_PENDING).count(), 1)
+
+        self.assertEqual(_deliver_outbox_emails(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        # The same email can be sent again once the previous one is sent.
+        enqueue_email('subject', 'message', TESTING_EMAIL_ADDRESS)
+        self.assertEqual(_deliver_outbox_emails(), 1)
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_failed_email_is_retried_later(self):
+        enqueue_email('subject', 'message', TESTING_EMAIL_ADDRESS)
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages',
+                        side_effect=ConnectionError('unreachable')):
+            self.assertEqual(deliver_outbox_emails(), 0)
+
+        outbox_email = OutboxEmail.objects.get()
+        self.assertEqual(outbox_email.status, OUTBOX_STATUS_PENDING)
+        self.assertEqual(outbox_email.attempts, 1)
+        self.assertIn('unreachable', outbox_email.last_error)
+        self.assertEqual(deliver_outbox_emails(), 0)
+        OutboxEmail.objects.update(next_attempt_time=outbox_email.created_time)
+        self.assertEqual(deliver_outbox_emails(), 1)
+        self.assertEqual(OutboxEmail.objects.get().status, OUTBOX_STATUS_SENT)
+
+    def test_claimed_emails_are_sent_by_one_worker_until_the_lease_expires(self):
+        for recipient in ['A@gmail.com', 'B@gmail.com', 'C@gmail.com']:
+            enqueue_email('subject', 'message', recipient)
+        first_claim = _claim_outbox_emails(2)
+        second_claim = _claim_outbox_emails(10)
+
+        self.assertEqual(len(first_claim), 2)
+        self.assertEqual([outbox_email.recipient for outbox_email in second_claim], ['C@gmail.com'])
+        self.assertEqual(_claim_outbox_emails(10), [])
+        # The first worker didn't finish, its emails are claimed again after the lease.
+        OutboxEmail.objects.filter(lease_token=first_claim[0].lease_token).update(
+            next_attempt_time=first_claim[0].created_time)
+        self.assertEqual(deliver_outbox_emails(), 2)
+        self.assertEqual(OutboxEmail.objects.get(pk=first_claim[0].pk).attempts, 2)
+        _finish_outbox_email(first_claim[0], ConnectionError('late result of the first worker'))
+        self.assertEqual(OutboxEmail.objects.get(pk=first_claim[0].pk).status, OUTBOX_STATUS_SENT)
+
+    def test_meeting_invitations_are_enqueued_with_one_query(self):
+        record = MeetingRecord(meeting=Meeting(display_name='test meeting'),
+                               meeting_start_time=datetime.datetime(2022, 1, 1, tzinfo=datetime.timezone.utc))
+        preferences = [MeetingPreference(name=name, email=f'{name}@gmail.com') for name in ['A', 'B', 'C']]
+        invitations = [Invitation(record=record, attendant=preference) for preference in preferences]
+        with self.assertNumQueries(1):
+            recipient_to_outbox_email = send_scheduled_meeting_notifications(record, invitations, preferences)
+
+        self.assertEqual(list(recipient_to_outbox_email), ['A@gmail.com', 'B@gmail.com', 'C@gmail.com'])
+        for invitation in invitations:
+            outbox_email = recipient_to_outbox_email[invitation.attendant.email]
+            self.assertIn(invitation_link(record.record_id, invitation.invitation_code), outbox_email.message)
+            self.assertIn('A, B, C', outbox_email.message)
+        self.assertEqual(OutboxEmail.objects.count(), 3)
+
+
+class ConcurrentRegistrationTests(TransactionTestCase):
+
+    def setUp(self):
+        # Threads need their own connections to the test database, which in-memory SQLite doesn't share.
+        # test_db_allows_multiple_connections is always False on SQLite, so it can't tell a file based database.
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('The test database is in-memory SQLite.')
+
+    def test_concurrent_registrations_do_not_overbook_meeting(self):
+        meeting_code = str(uuid.uuid4())
+        Meeting.objects.create(meeting_code=meeting_code, display_name='test meeting',
+                               code_max_usage=3, code_available_usage=3, contact_email='test@test.com')
+        registration_count = 8
+        barrier = threading.Barrier(registration_count)
+        status_codes = []
+
+        def register(index):
+            try:
+                barrier.wait()
+                response = _create_preference_form(Client(), meeting_code, email=f'{index}@gmail.com')
+                status_codes.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=register, args=(index,)) for index in range(registration_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertCountEqual(status_codes, [302] * 3 + [404] * (registration_count - 3))
+        self.assertEqual(MeetingPreference.objects.filter(meeting=meeting_code).count(), 3)
+        self.assertEqual(Meeting.objects.get(meeting_code=meeting_code).code_available_usage, 0)
+
+    def test_concurrent_load_keeps_invariants(self):
+        report = run_load_test(LoadTestConfig(users=8, concurrency=4, meeting_slots=5, edits_per_user=1))
+
+        self.assertEqual(report['invariant_violations'], [])
+        self.assertEqual(report['errors'], 0)
+        self.assertEqual(report['registered_users'], 5)
+
+
+class LoadTestTests(TestCase):
+
+    def test_load_test_reports_latencies_and_deletes_its_meeting(self):
+        output = io.StringIO()
+        call_command('load_test', '--users', '5', '--slots', '3', '--concurrency', '1', stdout=output)
+        report = json.loads(output.getvalue())
+
+        self.assertEqual(report['invariant_violations'], [])
+        self.assertEqual(report['errors'], 0)
+        self.assertEqual(report['registered_users'], 3)
+        # Each registered user confirms two invitations and one of them twice.
+        self.assertEqual(report['operations']['confirm']['count'], 9)
+        self.assertLessEqual(report['operations']['edit']['latency_ms']['p50'],
+                             report['operations']['edit']['latency_ms']['p99'])
+        self.assertLess(0, report['throughput_per_second'])
+        self.assertFalse(Meeting.objects.filter(meeting_code=report['meeting_code']).exists())
+        self.assertFalse(OutboxEmail.objects.exists())
+
+    def test_load_test_stdout_is_only_the_report(self):
+        # Without stdout the command writes to sys.stdout, which is redirected to a file in practice.
+        with mock.patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            call_command('load_test', '--users', '2', '--slots', '2', '--concurrency', '1')
+        report = json.loads(stdout.getvalue())
+
+        self.assertEqual(report['registered_users'], 2)
+        self.assertEqual(report['invariant_violations'], [])
+
+    def test_edit_keeps_verified_email_status(self):
+        meeting = Meeting.objects.create(meeting_code=str(uuid.uuid4()), display_name='test meeting',
+                                         code_max_usage=1, code_available_usage=1, contact_email='test@test.com')
+        client = Client()
+        _create_preference_form(client, meeting.meeting_code, override_post_data={'name': 'A'})
+        preference = MeetingPreference.objects.get(meeting=meeting)
+        client.get(f'/email_verification/{preference.email_verification_code}')
+
+        _create_preference_form(client, meeting.meeting_code, override_post_data={
+            'name': 'A', 'registered_attendant_code': str(preference.registered_attendant_code),
+            'prefer_to_attend_every_n_months': '3'})
+
+        preference.refresh_from_db()
+        self.assertEqual(preference.prefer_to_attend_every_n_months, 3)
+        self.assertEqual(preference.email_verification_code, VERIFIED_EMAIL_STATUS)
+
+
+class SchedulerBenchmarkTests(TestCase):
+
+    def test_benchmark_times_each_stage_and_rolls_back_the_synthetic_meeting(self):
+        output = io.StringIO()
+        call_command('benchmark_scheduler', '--attendants', '30', '--conflict-density', '0.2', '--repeat', '1',
+                     stdout=output)
+        results = json.loads(output.getvalue())
+
+        self.assertEqual(results['workload']['attendant_count'], 30)
+        self.assertLess(0, results['conflicts'])
+        self.assertEqual(results['stages']['get_available_dates']['calls'], 30)
+        self.assertIn(f'get_feasible_meeting_dates_with_participants[{SCHEDULER_ENGINE_MATRIX}]', results['stages'])
+        self.assertFalse(Meeting.objects.filter(display_name='synthetic meeting').exists())
+
+
+class SchedulerReplayTests(TestCase):
+
+    def test_replayed_scenarios_are_reproducible_and_engines_agree(self):
+        create_synthetic_meeting(SyntheticWorkload(attendant_count=20, conflict_density=0.2))
+        with tempfile.TemporaryDirectory() as corpus_dir:
+            call_command('record_scheduler_scenarios', '--corpus', corpus_dir, '--all', stdout=io.StringIO())
+            replays = []
+            for _ in range(2):
+                output = io.StringIO()
+                call_command('replay_scheduler_scenarios', '--corpus', corpus_dir, '--seed', '3', stdout=output)
+                replays.append(json.loads(output.getvalue()))
+
+        date_lists_result, matrix_result = replays[0]['results']
+        self.assertLess(0, date_lists_result['meetings_scheduled'])
+        self.assertLess(0, date_lists_result['peak_memory_bytes'])
+        self.assertEqual(date_lists_result['plan_digest'], matrix_result['plan_digest'])
+        self.assertEqual(date_lists_result['total_participant_value'], matrix_result['total_participant_value'])
+        self.assertEqual([result['plan_digest'] for result in replays[1]['results']],
+                         [date_lists_result['plan_digest']] * 2)
+
+
+class ConflictSolverTests(SimpleTestCase):
+
+    def test_prefer_more_participants_on_equal_meeting_value(self):
+        # 0 conflicts with 1 and 2, all have the same value.
+        solution = solve_max_weight_independent_set(get_tie_broken_weights([10, 5, 5]), [0b110, 0b001, 0b001])
+
+        self.assertEqual(solution.participants_bitmap, 0b110)
+        self.assertLess(0, solution.expanded_nodes)
+
+    def test_prefer_leaving_out_earlier_participants_on_equal_meeting_value_and_size(self):
+        solution = solve_max_weight_independent_set(get_tie_broken_weights([7, 7]), [0b10, 0b01])
+
+        self.assertEqual(solution.participants_bitmap, 0b10)
+
+    def test_max_meeting_value_in_conflict_cycle(self):
+        # Conflicts in a cycle 0-1-2-3-4-0.
+        adjacency = [0b10010, 0b00101, 0b01010, 0b10100, 0b01001]
+        solution = solve_max_weight_independent_set(get_tie_broken_weights([1, 9, 1, 9, 1]), adjacency)
+
+        self.assertEqual(solution.participants_bitmap, 0b01010)
+
+    def test_solve_each_conflict_component_independently(self):
+        # Components {0, 1}, {2, 3, 4} and {5}.
+        adjacency = [0b000010, 0b000001, 0b011000, 0b000100, 0b000100, 0b000000]
+        weights = get_tie_broken_weights([3, 5, 4, 2, 3, 1])
+        solution = solve_conflict_graph(weights, adjacency)
+
+        self.assertEqual(get_connected_components(adjacency), [0b000011, 0b011100, 0b100000])
+        self.assertEqual(solution.participants_bitmap, 0b111010)
+        self.assertEqual(solution.participants_bitmap,
+                         solve_max_weight_independent_set(weights, adjacency).participants_bitmap)
+
+
+class SchedulingStepTests(SimpleTestCase):
+
+    @staticmethod
+    def _create_unsaved_preference(name, minimal_meeting_value=1, minimal_meeting_size=1,
+                                   weighted_attendant_values=None):
+        return MeetingPreference(
+            name=name, registered_attendant_code=uuid.uuid4(), minimal_meeting_value=minimal_meeting_value,
+            minimal_meeting_size=minimal_meeting_size, weighted_attendant_values=weighted_attendant_values or {})
+
+    def test_removal_propagates_through_meeting_value_and_size_preference(self):
+        preference = self._create_unsaved_preference
+        # c leaves for the value, then d and b for the size one by one, then e for the value without b.
+        participants = [preference('a'),
+                        preference('b', minimal_meeting_size=4),
+                        preference('c', minimal_meeting_value=5, weighted_attendant_values={'e': 0}),
+                        preference('d', minimal_meeting_size=5),
+                        preference('e', minimal_meeting_value=4, weighted_attendant_values={'b': 3})]
+        sanitized = _sanitize_with_meeting_preference(participants, [])
+
+        self.assertEqual([participant.name for participant in sanitized], ['a'])
+
+    def test_pick_date_with_most_participants_after_sanitization(self):
+        preference = self._create_unsaved_preference
+        # Only a would attend the first date, c and d would attend the second one.
+        date_to_participants = {
+            1: [preference('a'), preference('b', minimal_meeting_size=4), preference('x', minimal_meeting_size=4)],
+            2: [preference('c'), preference('d')],
+        }
+        candidates_queue = [(-len(participants), date, len(participants), True, [])
+                            for date, participants in date_to_participants.items()]
+        heapq.heapify(candidates_queue)
+        date, participants = _pop_next_date_to_participate(
+            candidates_queue, lambda date: date_to_participants.get(date, []), [])
+
+        self.assertEqual(date, 2)
+        self.assertEqual([participant.name for participant in participants], ['c', 'd'])
+        # The first date was sanitized once and stays in the queue with its participants count.
+        self.assertEqual(candidates_queue, [(-1, 1, 3, False, date_to_participants[1][:1])])
+
+    def test_picked_participant_only_removed_from_dates_in_unavailable_range(self):
+        participant = self._create_unsaved_preference('a')
+        participant.prefer_to_attend_every_n_months = 1
+        other_participant = self._create_unsaved_preference('b')
+        # The unavailable range of a meeting on Jan 31 is 21 days before and after it.
+        dates = [datetime.date(2022, 1, 10), datetime.date(2022, 1, 11), datetime.date(2022, 2, 20),
+                 datetime.date(2022, 2, 21)]
+        date_to_participants = {date: [participant, other_participant] for date in dates}
+        participant_code_to_dates = {participant.registered_attendant_code: list(dates)}
+        updated_dates = _update_other_dates_after_picking_meeting_date(
+            datetime.date(2022, 1, 31), [participant], date_to_participants, participant_code_to_dates)
+
+        self.assertEqual(updated_dates, {datetime.date(2022, 1, 11), datetime.date(2022, 2, 20)})
+        self.assertEqual([len(date_to_participants[date]) for date in dates], [2, 1, 1, 2])
+        self.assertEqual(participant_code_to_dates[participant.registered_attendant_code], [dates[0], dates[3]])
+
+
+class _StubGraphHandler(http.server.BaseHTTPRequestHandler):
+    """Responds the next (status code, headers, body, delay seconds) in server.responses."""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.requests.append((self.path, self.headers.get('Authorization')))
+        status_code, headers, body, delay_seconds = self.server.responses.pop(0)
+        time.sleep(delay_seconds)
+        try:
+            self.send_response(status_code)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client timed out and closed the connection.
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class GraphClientTests(SimpleTestCase):
+
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _StubGraphHandler)
+        self.server.requests = []
+        self.server.responses = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.token_count = 0
+        self.sleeps = []
+
+    def _get_token(self):
+        self.token_count += 1
+        return {'access_token': f'token-{self.token_count}', 'expires_in': 3600}
+
+    def _create_client(self, **kwargs):
+        client = GraphClient(get_token=self._get_token, base_url=f'http://127.0.0.1:{self.server.server_port}',
+                             sleep=self.sleeps.append, **kwargs)
+        self.addCleanup(client.session.close)
+        return client
+
+    def test_create_meeting_link_retries_after_throttled(self):
+        meeting_body = json.dumps({'joinWebUrl': 'https://teams.microsoft.com/l/meetup-join/abc?context=1'}).encode()
+        self.server.responses = [(429, {'Retry-After': '2'}, b'', 0), (503, {}, b'', 0), (201, {}, meeting_body, 0),
+                                 (201, {}, meeting_body, 0)]
+        client = self._create_client()
+        start_time = datetime.datetime(2022, 2, 28, 12, 0, tzinfo=datetime.timezone.utc)
+        link = create_meeting_link('reunion', start_time, start_time + datetime.timedelta(hours=1),
+                                   external_id='record-1', client=client)
+        create_meeting_link('reunion', start_time, start_time + datetime.timedelta(hours=1),
+                            external_id='record-2', client=client)
+
+        self.assertEqual(link, 'https://teams.microsoft.com/l/meetup-join/abc')
+        self.assertEqual(self.sleeps, [2, 1])
+        self.assertTrue(all(path.endswith('/onlineMeetings/createOrGet') for path, _ in self.server.requests))
+        # The token is reused until it expires.
+        self.assertEqual([authorization for _, authorization in self.server.requests], ['Bearer token-1'] * 4)
+
+    def test_post_is_only_retried_when_throttled(self):
+        self.server.responses = [(429, {'Retry-After': '1'}, b'', 0), (503, {}, b'', 0), (201, {}, b'', 0)]
+        client = self._create_client()
+        # The meeting could have been created before the 503, so it's not created again.
+        with self.assertRaises(GraphClientError):
+            client.request('POST', '/meetings')
+
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(client.request('POST', '/meetings', idempotent=True).status_code, 201)
+
+    def test_circuit_opens_after_consecutive_failures(self):
+        self.server.responses = [(500, {}, b'', 0)] * 2 + [(200, {}, b'', 0)]
+        clock_time = [0]
+        client = self._create_client(max_retries=0, circuit_breaker=CircuitBreaker(
+            failure_threshold=2, reset_seconds=60, clock=lambda: clock_time[0]))
+        for _ in range(2):
+            with self.assertRaises(GraphClientError):
+                client.request('POST', '/meetings')
+        with self.assertRaises(CircuitOpenError):
+            client.request('POST', '/meetings')
+        self.assertEqual(len(self.server.requests), 2)
+
+        clock_time[0] = 60
+        self.assertEqual(client.request('POST', '/meetings').status_code, 200)
+        self.assertIsNone(client.circuit_breaker.opened_time)
+
+    def test_token_failure_is_a_graph_client_error_counted_by_the_circuit_breaker(self):
+        def get_token():
+            raise ConnectionError('tenant discovery failed')
+
+        client = GraphClient(get_token=get_token, base_url=f'http://127.0.0.1:{self.server.server_port}',
+                             circuit_breaker=CircuitBreaker(failure_threshold=1))
+        self.addCleanup(client.session.close)
+        start_time = datetime.datetime(2022, 2, 28, 12, 0, tzinfo=datetime.timezone.utc)
+        with self.assertLogs('reunion.create_online_meeting', 'ERROR'):
+            self.assertIsNone(create_meeting_link('reunion', start_time, start_time, client=client))
+
+        self.assertIsNotNone(client.circuit_breaker.opened_time)
+        self.assertEqual(self.server.requests, [])
+
+    def test_slow_response_times_out(self):
+        self.server.responses = [(201, {}, b'', 0.5)]
+        client = self._create_client(timeout=(1, 0.1), max_retries=0)
+        with self.assertRaises(GraphClientError):
+            client.request('POST', '/meetings')
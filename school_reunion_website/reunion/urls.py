@@ -16,5 +16,6 @@ urlpatterns = [
     path('meeting_preference/', views.meeting_preference, name='meeting_preference'),
     path('meeting_generation/', views.meeting_generation, name='meeting_generation'),
     path('email_verification/<str:verification_code>', views.email_verification, name='email_verification'),
-    path('confirm_invitation/<str:meeting_record_id>/<str:invitation_code>', views.confirm_invitation, name='confirm_invitation')
+    path('confirm_invitation/<str:meeting_record_id>/<str:invitation_code>', views.confirm_invitation, name='confirm_invitation'),
+    path('holiday_catalog/<str:country_name>', views.holiday_catalog, name='holiday_catalog'),
 ]
@@ -1,24 +1,38 @@
 """Includes all constants for models and utility functions."""
 
 import collections
+import functools
+import gzip
+import hashlib
+import json
+import logging
+import math
+import os
 
+from django.conf import settings
 from django.db import transaction
 from django.http import Http404
 import dataclasses
 from django.db import models
-from typing import Optional
+from typing import Optional, Dict, List
 import holidays
 import pycountry
 import datetime
 
+logger = logging.getLogger(__name__)
 
 DEFAULT_HOLIDAY_YEARS = (datetime.datetime.utcnow().year, datetime.datetime.utcnow().year+1)
+# Max number of (country, year) holiday entries kept in memory.
+HOLIDAY_CACHE_SIZE = 512
+# Built by manage.py build_holiday_index, can be overridden by REUNION_HOLIDAY_INDEX_PATH setting.
+DEFAULT_HOLIDAY_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'holiday_index.json')
+# Browsers and proxies may reuse a holiday catalog for this long without revalidating it.
+HOLIDAY_CATALOG_MAX_AGE_SECONDS = 24 * 3600
 NEAR_WEEKEND_DAYS = {0, 4, 5, 6}
 VERIFIED_EMAIL_STATUS = 'Verified'
 ATTENDANT_PENDING_STATUS = 'PENDING'
 ATTENDANT_CONFIRM_STATUS = 'CONFIRM'
 ATTENDANT_DENY_STATUS = 'DENY'
-COUNTRY_TO_HOLIDAY_MAP_BY_YEAR = {}
 REPEAT_EACH_YEAR = 'repeat_each_year'
 REPEAT_EACH_MONTH = 'repeat_each_month'
 REPEAT_EACH_WEEK = 'repeat_each_week'
@@ -29,9 +43,27 @@ REPEAT_OPTIONS = [(REPEAT_EACH_YEAR, 'repeat each year'),
                   (NO_REPEAT, 'no repeat')]
 REPEAT_OPTIONS_SET = set([option[0] for option in REPEAT_OPTIONS])
 
+# Kinds of the parsed selected_attending_dates rules.
+ATTENDING_RULE_HOLIDAY = 'holiday'
+ATTENDING_RULE_CUSTOM = 'custom'
+CUSTOM_DATES_INPUT_FORMAT = '%m/%d/%Y'
+SELECT_ALL_HOLIDAYS_PREFIX = 'Select All '
+
 MEETING_RECORD_STATUS_INITIALIZED = 'initialized'
 MEETING_RECORD_STATUS_FINALIZED = 'finalized'
 
+OUTBOX_STATUS_PENDING = 'PENDING'
+OUTBOX_STATUS_SENDING = 'SENDING'
+OUTBOX_STATUS_SENT = 'SENT'
+OUTBOX_STATUS_FAILED = 'FAILED'
+# Number of emails sent over one connection by deliver_outbox_emails.
+OUTBOX_BATCH_SIZE = 100
+# An email is failed after this many attempts, the delay before the n-th retry is OUTBOX_RETRY_DELAY * 2^(n-1).
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_RETRY_DELAY = datetime.timedelta(minutes=1)
+# A claimed email is claimed again after this long if the worker sending it didn't finish, e.g. it was killed.
+OUTBOX_SENDING_LEASE = datetime.timedelta(minutes=10)
+
 
 @dataclasses.dataclass
 class ValidForm:
@@ -53,47 +85,207 @@ def valid_request_from_forms(post_request, candidate_forms, raise_if_not_found=T
                     pass
             return ValidForm(name=form_instance.__class__.__name__, model=model)
         else:
-            print(f'\n====debug invalid form {candidate_form.__name__}====')
-            print(form_instance.errors)
-            print(form_instance.non_field_errors)
+            # Not printed, stdout of the management commands posting forms could be their output.
+            logger.debug('Invalid form %s: %s %s', candidate_form.__name__, form_instance.errors.as_json(),
+                         form_instance.non_field_errors())
     if raise_if_not_found:
         raise Http404('Not valid form entry.')
     return ''
 
 
 @transaction.atomic
-def record_new_meeting_preference(meeting, preference, meeting_attendance):
-    meeting.save()
+def record_new_meeting_preference(meeting, preference, meeting_attendance) -> bool:
+    """Takes an available slot of the meeting for the new preference, returns False if there is none."""
+    if not meeting.reserve_available_slot():
+        return False
     preference.save()
     meeting_attendance.save()
+    return True
+
+
+def _parse_custom_attending_rule(date_range: str, repeat_option: str) -> Optional[Dict[str, str]]:
+    try:
+        input_start_date, input_end_date = date_range.split(' - ')
+        input_start_date = datetime.datetime.strptime(input_start_date, CUSTOM_DATES_INPUT_FORMAT).date()
+        input_end_date = datetime.datetime.strptime(input_end_date, CUSTOM_DATES_INPUT_FORMAT).date()
+    except ValueError:
+        return None
+    return {'kind': ATTENDING_RULE_CUSTOM,
+            'start': input_start_date.isoformat(),
+            'end': input_end_date.isoformat(),
+            'repeat': repeat_option}
+
+
+def parse_attending_date_rules(selected_attending_dates: str) -> List[Dict[str, Optional[str]]]:
+    """Parses the selected_attending_dates string to rule records, malformed entries are dropped.
+
+    e.g. "12/16/2021 - 12/25/2021:no_repeat,United_States:Washington's Birthday" to
+        [{'kind': 'custom', 'start': '2021-12-16', 'end': '2021-12-25', 'repeat': 'no_repeat'},
+         {'kind': 'holiday', 'country': 'United States', 'holiday': "Washington's Birthday"}]
+    A holiday of None means all holidays of the country.
+    """
+    rules = []
+    for attending_rule in selected_attending_dates.split(','):
+        split_value = attending_rule.split(':')
+        if len(split_value) != 2:
+            continue
+        if split_value[1] in REPEAT_OPTIONS_SET:
+            rule = _parse_custom_attending_rule(*split_value)
+            if rule:
+                rules.append(rule)
+            continue
+        country, holiday = split_value
+        rules.append({'kind': ATTENDING_RULE_HOLIDAY,
+                      'country': country.replace('_', ' '),
+                      'holiday': None if holiday.startswith(SELECT_ALL_HOLIDAYS_PREFIX) else holiday})
+    return rules
+
+
+def get_weighted_attendants_as_dictionary(weighted_attendants: str) -> Dict[str, float]:
+    """Parses the weighted_attendants string to dictionary, e.g. assa:-1,lala:-10,haha:20"""
+    weighted_attendants_dict = {}
+    for weighted_attendant_str in weighted_attendants.split(','):
+        try:
+            split_value = weighted_attendant_str.split(':')
+            if len(split_value) != 2:
+                continue
+            value = float(split_value[1])
+            # inf and nan can't be stored in the JSON field.
+            if not math.isfinite(value):
+                continue
+            weighted_attendants_dict[split_value[0]] = value
+        except:
+            continue
+    return weighted_attendants_dict
+
+
+def get_bitmap_indices(bitmap: int) -> List[int]:
+    """Returns the indices of the set bits in ascending order."""
+    indices = []
+    while bitmap:
+        lowest_bit = bitmap & -bitmap
+        indices.append(lowest_bit.bit_length() - 1)
+        bitmap ^= lowest_bit
+    return indices
+
+
+def get_holiday_index_path() -> str:
+    return getattr(settings, 'REUNION_HOLIDAY_INDEX_PATH', DEFAULT_HOLIDAY_INDEX_PATH)
+
+
+@functools.lru_cache(maxsize=None)
+def _load_holiday_index() -> Optional[Dict]:
+    """Reads the holiday index built by manage.py build_holiday_index once per process, None if not built."""
+    try:
+        with open(get_holiday_index_path()) as index_file:
+            return json.load(index_file)
+    except FileNotFoundError:
+        return None
+
+
+def build_holiday_index(years) -> Dict:
+    """Returns {'codes': {country name: code}, 'holidays': {country name: {year: {holiday name: [ordinals]}}}}."""
+    country_name_to_code = _compute_country_name_to_holidays_code()
+    country_holidays = {}
+    for country_name in country_name_to_code:
+        country_holidays[country_name] = {
+            str(year): {holiday_name: [date.toordinal() for date in dates]
+                        for holiday_name, dates in _compute_country_holidays_in_year(country_name, year).items()}
+            for year in years}
+    return {'codes': country_name_to_code, 'holidays': country_holidays}
+
+
+def write_holiday_index(years, path: str):
+    holiday_index = build_holiday_index(years)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as index_file:
+        json.dump(holiday_index, index_file, separators=(',', ':'))
+    os.replace(tmp_path, path)
+    clear_holiday_caches()
+
+
+def clear_holiday_caches():
+    _load_holiday_index.cache_clear()
+    get_country_name_to_holidays_code.cache_clear()
+    _get_country_holidays_in_year.cache_clear()
+    get_country_holiday_catalog.cache_clear()
+
+
+def _compute_country_name_to_holidays_code() -> Dict[str, str]:
+    country_code_map = {}
+    for country in pycountry.countries:
+        country_code_map[country.alpha_2] = country.name
+        country_code_map[country.alpha_3] = country.name
+
+    country_name_to_code = {}
+    for country in holidays.list_supported_countries():
+        country_name = country
+        if country.isupper():
+            country_name = country_code_map.get(country)
+        # Only add human readable country name.
+        if country_name and (country_name[1:].islower() or (' ' in country_name)):
+            country_name_to_code[country_name] = country
+    return country_name_to_code
+
+
+@functools.lru_cache(maxsize=None)
+def get_country_name_to_holidays_code() -> Dict[str, str]:
+    """Returns {country name: country code in holidays package}, no holiday is computed."""
+    holiday_index = _load_holiday_index()
+    if holiday_index:
+        return holiday_index['codes']
+    return _compute_country_name_to_holidays_code()
+
+
+def _compute_country_holidays_in_year(country_name: str, year: int) -> Dict[str, List[datetime.date]]:
+    country_code = get_country_name_to_holidays_code().get(country_name)
+    if not country_code:
+        return {}
+    reformatted_holidays = collections.defaultdict(list)
+    for date, holiday_name in holidays.CountryHoliday(country=country_code, years=year).items():
+        reformatted_holidays[holiday_name.replace(",", " ")].append(date)
+    return dict(reformatted_holidays)
+
+
+@functools.lru_cache(maxsize=HOLIDAY_CACHE_SIZE)
+def _get_country_holidays_in_year(country_name: str, year: int) -> Dict[str, List[datetime.date]]:
+    holiday_index = _load_holiday_index()
+    if holiday_index and str(year) in holiday_index['holidays'].get(country_name, {}):
+        return {holiday_name: [datetime.date.fromordinal(ordinal) for ordinal in ordinals]
+                for holiday_name, ordinals in holiday_index['holidays'][country_name][str(year)].items()}
+    return _compute_country_holidays_in_year(country_name, year)
+
+
+def get_country_holidays(country_name: str, years=DEFAULT_HOLIDAY_YEARS) -> Dict[str, List[datetime.date]]:
+    """Returns {holiday name: [holiday dates]} of one country, computed on first use for each (country, year)."""
+    country_holidays = collections.defaultdict(list)
+    for year in years:
+        for holiday_name, dates in _get_country_holidays_in_year(country_name, year).items():
+            country_holidays[holiday_name].extend(dates)
+    return dict(country_holidays)
+
+
+@dataclasses.dataclass(frozen=True)
+class HolidayCatalog:
+    body: bytes
+    gzip_body: bytes
+    # Strong ETag of body, the gzip body's ETag has a -gzip suffix.
+    etag: str
+
+    @property
+    def gzip_etag(self) -> str:
+        return f'{self.etag[:-1]}-gzip"'
+
 
+@functools.lru_cache(maxsize=HOLIDAY_CACHE_SIZE)
+def get_country_holiday_catalog(country_name: str) -> Optional[HolidayCatalog]:
+    """The holiday names of one country for the preference form as JSON, None if the country isn't supported.
 
-def get_country_to_holidays_map(years=DEFAULT_HOLIDAY_YEARS):
-    """Returns {country name: {holiday name: [holiday dates]}}."""
-    global COUNTRY_TO_HOLIDAY_MAP_BY_YEAR
-    if not COUNTRY_TO_HOLIDAY_MAP_BY_YEAR.get(years):
-        country_code_map = {}
-        for country in pycountry.countries:
-            country_code_map[country.alpha_2] = country.name
-            country_code_map[country.alpha_3] = country.name
-
-        country_to_holidays_map = {}
-        countries = holidays.list_supported_countries()
-        for country in countries:
-            country_holidays = holidays.CountryHoliday(
-                country=country, years=years)
-
-            reformatted_holidays = collections.defaultdict(list)
-            for date, holiday_name in country_holidays.items():
-                reformatted_holidays[holiday_name.replace(",", " ")].append(date)
-            country_name = country
-            if country.isupper():
-                country_name = country_code_map.get(country)
-            # Only add human readable country name.
-            if country_name and (country_name[1:].islower() or (' ' in country_name)):
-                country_to_holidays_map[country_name] = reformatted_holidays
-        COUNTRY_TO_HOLIDAY_MAP_BY_YEAR[years] = country_to_holidays_map
-    return COUNTRY_TO_HOLIDAY_MAP_BY_YEAR[years]
-
-
-get_country_to_holidays_map()
+    e.g. {"country":"United States","holidays":["New Year's Day",...]}
+    """
+    if country_name not in get_country_name_to_holidays_code():
+        return None
+    body = json.dumps({'country': country_name, 'holidays': list(get_country_holidays(country_name))},
+                      separators=(',', ':')).encode()
+    return HolidayCatalog(body=body, gzip_body=gzip.compress(body, mtime=0),
+                          etag=f'"{hashlib.sha256(body).hexdigest()[:32]}"')
@@ -1,21 +1,19 @@
+import re
 import uuid
 
-from django.http import Http404, HttpResponse
+from django.http import Http404, HttpResponse, HttpResponseNotModified
 from django.shortcuts import render, get_object_or_404, redirect
-from .utils import valid_request_from_forms, record_new_meeting_preference, VERIFIED_EMAIL_STATUS, ATTENDANT_DENY_STATUS, ATTENDANT_PENDING_STATUS, ATTENDANT_CONFIRM_STATUS
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+from django.views.decorators.http import require_GET
+from .utils import valid_request_from_forms, record_new_meeting_preference, get_country_holiday_catalog, VERIFIED_EMAIL_STATUS, ATTENDANT_DENY_STATUS, ATTENDANT_PENDING_STATUS, ATTENDANT_CONFIRM_STATUS, HOLIDAY_CATALOG_MAX_AGE_SECONDS
 from .emails import verify_registered_email_address, send_scheduled_meeting_details
-from .models import Meeting, MeetingPreference, MeetingAttendance, MeetingRecord
+from .schedule_meeting import ensure_online_meeting_link
+from .models import Meeting, MeetingPreference, MeetingAttendance, Invitation, mark_meeting_inputs_changed
 from .forms import MeetingPreferenceForm, EntryForm, MeetingGenerationForm
-import threading
-import json
 from django.db import transaction
 
 
-# TODO: Simple global threading lock to prevent meeting over booked. May need to use better way.
-#  Also, no concurrent test.
-lock = threading.Lock()
-
-
 def index(request):
     entry_form = EntryForm()
     pop_message = request.session.get('pop_message')
@@ -39,25 +37,18 @@ def meeting_preference(request):
         if valid_form.name == 'MeetingPreferenceForm':
             preference: MeetingPreference = valid_form.model
             if not registered_attendant_code:
-                lock.acquire()
-                try:
-                    # Need to fetch again to refresh the available slot.
-                    meeting = get_object_or_404(Meeting, pk=meeting_code)
-                    if meeting.code_available_usage <= 0:
-                        raise Http404('This meeting has no available slot!')
+                registered_attendant_code = uuid.uuid4()
+                while MeetingPreference.objects.filter(registered_attendant_code=registered_attendant_code).exists():
                     registered_attendant_code = uuid.uuid4()
-                    while MeetingPreference.objects.filter(registered_attendant_code=registered_attendant_code).exists():
-                        registered_attendant_code = uuid.uuid4()
-                    meeting.code_available_usage -= 1
-                    preference.registered_attendant_code = str(registered_attendant_code)
-                    preference.meeting_id = meeting_code
-                    preference.email_verification_code = (
-                        f'{uuid.uuid4()}{uuid.uuid4()}{uuid.uuid4()}{uuid.uuid4()}'.replace('-', ''))
-                    # todo, record attendant's information after encryption
-                    record_new_meeting_preference(
-                        meeting, preference, MeetingAttendance(attendant_preference=preference))
-                finally:
-                    lock.release()
+                preference.registered_attendant_code = str(registered_attendant_code)
+                preference.meeting_id = meeting_code
+                preference.email_verification_code = (
+                    f'{uuid.uuid4()}{uuid.uuid4()}{uuid.uuid4()}{uuid.uuid4()}'.replace('-', ''))
+                # todo, record attendant's information after encryption
+                # The slot is reserved in the same transaction, the meeting fetched above could be outdated.
+                if not record_new_meeting_preference(
+                        meeting, preference, MeetingAttendance(attendant_preference=preference)):
+                    raise Http404('This meeting has no available slot!')
 
                 verify_registered_email_address(preference, meeting.display_name)
                 request.session['pop_message'] = (f'Thank you for registration!'
@@ -78,6 +69,8 @@ def meeting_preference(request):
                 # TODO: Need to update other preference weighted attendants reference
                 #  when the name of this preference is changed.
                 else:
+                    # The form doesn't have the verification status, keep it.
+                    preference.email_verification_code = existing_preference.email_verification_code
                     preference.save()
                 request.session['pop_message'] = f'Your change is saved!'
                 return redirect('reunion:index')
@@ -124,33 +117,47 @@ def email_verification(request, verification_code):
         return render(request, 'reunion/email_verification.html', {'meeting_name': meeting.display_name})
 
 
-@transaction.atomic
-def update_meeting_record_attendance(meeting_record, meeting_attendance):
-    meeting_record.save()
-    meeting_attendance.save()
-
-
 def confirm_invitation(request, meeting_record_id, invitation_code):
     if request.method == 'GET':
-        record: MeetingRecord = get_object_or_404(MeetingRecord, record_id=meeting_record_id)
-        invitation_code_to_attendant_code = json.loads(record.invitation_code_to_attendant_code)
-        attendant_code = invitation_code_to_attendant_code.get(invitation_code)
-        if not attendant_code:
+        try:
+            invitation: Invitation = Invitation.objects.select_related('record__meeting', 'attendant').get(
+                record_id=uuid.UUID(meeting_record_id), invitation_code=uuid.UUID(invitation_code))
+        except (ValueError, Invitation.DoesNotExist):
             raise Http404('Unknown invitation code!')
-        attendant_code_to_status = json.loads(record.attendant_code_to_status)
-        status = attendant_code_to_status.get(attendant_code)
-        # Allow people to double click confirm link to resend the email.
-        if status == ATTENDANT_DENY_STATUS:
-            raise Http404('Link expired!')
-        attendant_code_to_status[attendant_code] = ATTENDANT_CONFIRM_STATUS
-        record.attendant_code_to_status = json.dumps(attendant_code_to_status)
-        # update MeetingAttendant
-        preference = MeetingPreference.objects.get(registered_attendant_code=attendant_code)
-        attendance: MeetingAttendance = MeetingAttendance.objects.get(
-            attendant_preference=preference)
-        attendance.latest_confirmation_meeting_record = max(
-            record.meeting_start_time, attendance.latest_confirmation_time)
-        update_meeting_record_attendance(record, attendance)
-
+        record = invitation.record
+        preference = invitation.attendant
+        with transaction.atomic():
+            # Allow people to double click confirm link to resend the email.
+            confirmed = Invitation.objects.filter(pk=invitation.pk).exclude(status=ATTENDANT_DENY_STATUS).update(
+                status=ATTENDANT_CONFIRM_STATUS)
+            if not confirmed:
+                raise Http404('Link expired!')
+            # update MeetingAttendant
+            MeetingAttendance.objects.filter(
+                attendant_preference=preference, latest_confirmation_time__lt=record.meeting_start_time).update(
+                latest_confirmation_time=record.meeting_start_time)
+            mark_meeting_inputs_changed(preference.meeting_id)
+
+        ensure_online_meeting_link(record)
         send_scheduled_meeting_details(preference, record)
         return HttpResponse(content=b'Attendance confirmed!')
+
+
+@require_GET
+def holiday_catalog(request, country_name):
+    """Holiday names of the country selected in the preference form, compressed once per process."""
+    catalog = get_country_holiday_catalog(country_name)
+    if catalog is None:
+        raise Http404('Unknown country!')
+    use_gzip = bool(re.search(r'\bgzip\b', request.headers.get('Accept-Encoding', '')))
+    etag = catalog.gzip_etag if use_gzip else catalog.etag
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(catalog.gzip_body if use_gzip else catalog.body, content_type='application/json')
+        if use_gzip:
+            response['Content-Encoding'] = 'gzip'
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=HOLIDAY_CATALOG_MAX_AGE_SECONDS)
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response